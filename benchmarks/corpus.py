@@ -0,0 +1,277 @@
+#! /usr/bin/env python3
+
+import math, os, random, struct, sys
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'lib'))
+
+from pes_file_tools import cpk, fpk, ftex, uniparam
+
+#
+# Deterministic generators for synthetic PES files. Every generator takes
+# a $seed, and produces the same output for the same arguments on every
+# run, so that benchmark results are comparable between runs.
+#
+
+words = [
+	b'Asset', b'model', b'character', b'face', b'real', b'uniform', b'team',
+	b'texture', b'player', b'<config>', b'</config>', b'0.500000', b'1',
+	b' ', b' ', b'\n', b'\t', b'\x00\x00\x00\x00', b'\x3f\x80\x00\x00',
+]
+
+#
+# Content that compresses about as well as typical packed files.
+#
+def textContent(generator, size):
+	parts = []
+	length = 0
+	while length < size:
+		word = generator.choice(words)
+		parts.append(word)
+		length += len(word)
+	return b''.join(parts)[0:size]
+
+#
+# Content that does not compress, like already compressed textures.
+#
+def randomContent(generator, size):
+	if size == 0:
+		return b''
+	return generator.getrandbits(8 * size).to_bytes(size, 'little')
+
+#
+# Returns $count sizes between $minSize and $maxSize, distributed
+# log-uniformly, as most packed files are small and a few are large.
+#
+def fileSizes(generator, count, minSize, maxSize):
+	low = math.log(max(minSize, 1))
+	high = math.log(max(maxSize, 1))
+	return [min(maxSize, max(minSize, int(math.exp(generator.uniform(low, high))))) for i in range(count)]
+
+def packedFilename(i, extension):
+	return "Asset/model/character/team%04d/file%06d.%s" % (i // 100, i, extension)
+
+#
+# Returns a dictionary from packed filename to content, where half of the
+# files are compressible and half are not.
+#
+def cpkContents(fileCount, minSize, maxSize, seed):
+	generator = random.Random(seed)
+	contents = {}
+	for (i, size) in enumerate(fileSizes(generator, fileCount, minSize, maxSize)):
+		if i % 2 == 0:
+			contents[packedFilename(i, 'bin')] = textContent(generator, size)
+		else:
+			contents[packedFilename(i, 'bin')] = randomContent(generator, size)
+	return contents
+
+def writeCpk(filename, contents, enableFileCrc = False):
+	writer = cpk.CpkWriter()
+	writer.open(filename, enableFileCrc = enableFileCrc)
+	for (name, content) in contents.items():
+		writer.writeFile(name, content)
+	writer.close()
+
+def makeCpk(filename, fileCount = 1000, minSize = 16, maxSize = 1 << 18, seed = 0):
+	contents = cpkContents(fileCount, minSize, maxSize, seed)
+	writeCpk(filename, contents)
+	return contents
+
+class BitWriter:
+	def __init__(self):
+		self.buffer = bytearray()
+		self.pooledBits = 0
+		self.pooledBitCount = 0
+	
+	def write(self, value, bits):
+		self.pooledBits = self.pooledBits << bits | value
+		self.pooledBitCount += bits
+		while self.pooledBitCount >= 8:
+			self.pooledBitCount -= 8
+			self.buffer.append((self.pooledBits >> self.pooledBitCount) & 0xff)
+		self.pooledBits = self.pooledBits & ((1 << self.pooledBitCount) - 1)
+	
+	def finish(self):
+		if self.pooledBitCount > 0:
+			self.buffer.append((self.pooledBits << (8 - self.pooledBitCount)) & 0xff)
+		return self.buffer
+
+#
+# Builds a crilayla stream of $size bytes of content, for benchmarking
+# decompression. This is not a compressor: it picks random raw bytes and
+# backreferences, and builds the content they decode to alongside the
+# stream. The content is built back to front, as the decompressor writes
+# it, after an uncompressed prefix of 0x100 bytes.
+# Returns the content and the stream.
+#
+def makeCrilayla(size = 1 << 18, seed = 0):
+	generator = random.Random(seed)
+	uncompressedPrefix = textContent(generator, 0x100)
+	bodySize = max(size - len(uncompressedPrefix), 0)
+	
+	data = bytearray()
+	writer = BitWriter()
+	while len(data) < bodySize:
+		if len(data) >= 3 and bodySize - len(data) >= 3 and generator.random() < 0.5:
+			offset = generator.randint(3, min(len(data), (1 << 13) - 1 + 3))
+			length = min(generator.randint(3, 300), bodySize - len(data))
+			writer.write(1, 1)
+			writer.write(offset - 3, 13)
+			remainingLength = length - 3
+			chunkSizes = [2, 3, 5, 8]
+			while True:
+				chunkSize = chunkSizes.pop(0) if len(chunkSizes) > 0 else 8
+				chunkMax = (1 << chunkSize) - 1
+				if remainingLength < chunkMax:
+					writer.write(remainingLength, chunkSize)
+					break
+				writer.write(chunkMax, chunkSize)
+				remainingLength -= chunkMax
+			for i in range(length):
+				data.append(data[-offset])
+		else:
+			byte = generator.choice(words)[0]
+			writer.write(0, 1)
+			writer.write(byte, 8)
+			data.append(byte)
+	
+	# The decompressor reads the bit stream from its last byte backwards.
+	compressedData = bytes(writer.finish()[::-1])
+	header = struct.pack('< 8s I I', b'CRILAYLA', len(data), len(compressedData))
+	return (uncompressedPrefix + bytes(data[::-1]), header + compressedData + uncompressedPrefix)
+
+#
+# The dds dxgiFormat for every ftex format without a fourCC of its own.
+#
+ddsExtensionFormats = {
+	1: 61,
+	8: 80,
+	9: 83,
+	10: 95,
+	11: 98,
+	12: 10,
+	13: 2,
+	14: 24,
+	15: 26,
+}
+
+ddsFourCCs = {
+	2: b'DXT1',
+	3: b'DXT3',
+	4: b'DXT5',
+}
+
+# Limits random bytes to 16 values, so that image data compresses a little.
+nibbleTable = bytes([i & 0x0f for i in range(256)])
+
+#
+# Builds a dds image in the format of ftex format $ftexFormat, with a full
+# chain of mipmaps, filled with semi-compressible content.
+#
+def makeDds(ftexFormat, width = 256, height = 256, seed = 0):
+	generator = random.Random(seed)
+	mipmapCount = max(width, height).bit_length()
+	capabilities1 = 0x1000 | 0x400008
+	if ftexFormat == 0:
+		header = struct.pack('< 4s 7I 44x 2I 4s 5I 2I 12x',
+			b'DDS ', 124, 0x2100f, height, width, width * 4, 1, mipmapCount,
+			32, 0x41, bytes(4), 32, 0xff0000, 0xff00, 0xff, 0xff000000,
+			capabilities1, 0,
+		)
+	else:
+		fourCC = ddsFourCCs.get(ftexFormat, b'DX10')
+		header = struct.pack('< 4s 7I 44x 2I 4s 5I 2I 12x',
+			b'DDS ', 124, 0xa1007, height, width, 0, 1, mipmapCount,
+			32, 0x4, fourCC, 0, 0, 0, 0, 0,
+			capabilities1, 0,
+		)
+		if fourCC == b'DX10':
+			header += struct.pack('< 5I', ddsExtensionFormats[ftexFormat], 3, 0, 1, 0)
+	
+	mipmaps = []
+	for mipmapIndex in range(mipmapCount):
+		size = ftex.ddsMipmapSize(ftexFormat, width, height, 1, mipmapIndex)
+		mipmaps.append(randomContent(generator, size).translate(nibbleTable))
+	return header + b''.join(mipmaps)
+
+def makeFtex(ftexFormat, width = 256, height = 256, seed = 0):
+	return ftex.ddsToFtexBuffer(makeDds(ftexFormat, width, height, seed), 'LINEAR')
+
+def fpkContents(fileCount, minSize, maxSize, seed):
+	generator = random.Random(seed)
+	contents = {}
+	for (i, size) in enumerate(fileSizes(generator, fileCount, minSize, maxSize)):
+		if i % 2 == 0:
+			contents[packedFilename(i, 'fmdl')] = textContent(generator, size)
+		else:
+			contents[packedFilename(i, 'ftex')] = randomContent(generator, size)
+	return contents
+
+def makeFpk(fileCount = 200, minSize = 16, maxSize = 1 << 17, seed = 0):
+	fpkFile = fpk.FpkFile()
+	fpkFile.entries = fpkContents(fileCount, minSize, maxSize, seed)
+	return fpkFile.write(True)
+
+def uniparamContents(fileCount, minSize, maxSize, seed):
+	generator = random.Random(seed)
+	contents = {}
+	for (i, size) in enumerate(fileSizes(generator, fileCount, minSize, maxSize)):
+		contents["u%04dp%d.bin" % (i // 4, i % 4 + 1)] = textContent(generator, size)
+	return contents
+
+def makeUniparam(fileCount = 2000, minSize = 64, maxSize = 4096, seed = 0):
+	uniparamFile = uniparam.UniformParameterFile()
+	uniparamFile.entries = uniparamContents(fileCount, minSize, maxSize, seed)
+	return uniparamFile.write()
+
+def writeFile(filename, content):
+	stream = open(filename, 'wb')
+	stream.write(content)
+	stream.close()
+
+def main(directory, seed):
+	if not os.path.isdir(directory):
+		os.makedirs(directory)
+	
+	makeCpk(os.path.join(directory, "synthetic.cpk"), seed = seed)
+	(content, compressedContent) = makeCrilayla(seed = seed)
+	writeFile(os.path.join(directory, "synthetic.crilayla"), compressedContent)
+	for ftexFormat in sorted(ftex.formatBlockConfiguration.keys()):
+		writeFile(os.path.join(directory, "synthetic-%d.dds" % ftexFormat), makeDds(ftexFormat, seed = seed))
+		writeFile(os.path.join(directory, "synthetic-%d.ftex" % ftexFormat), makeFtex(ftexFormat, seed = seed))
+	writeFile(os.path.join(directory, "synthetic.fpkd"), makeFpk(seed = seed))
+	writeFile(os.path.join(directory, "synthetic_uniparam.bin"), makeUniparam(seed = seed))
+
+def usage():
+	print("corpus -- Generate synthetic PES files for benchmarking")
+	print("Usage:")
+	print("  corpus [OPTIONS] <directory>")
+	print("    Writes a cpk, a crilayla stream, a dds and ftex file in every ftex")
+	print("    format, an fpkd and a uniparam file to <directory>")
+	print("Options:")
+	print("  -s, --seed <SEED>          Generate using <SEED> [default 0]")
+	print("  -h, --help                 Display this help")
+	sys.exit()
+
+if __name__ == '__main__':
+	seed = 0
+	directory = None
+	
+	index = 1
+	while index < len(sys.argv):
+		arg = sys.argv[index]
+		index += 1
+		if arg in ['-s', '--seed']:
+			if index >= len(sys.argv):
+				usage()
+			seed = int(sys.argv[index])
+			index += 1
+		elif arg[0:1] == '-':
+			usage()
+		elif directory is None:
+			directory = arg
+		else:
+			usage()
+	
+	if directory is None:
+		usage()
+	
+	main(directory, seed)
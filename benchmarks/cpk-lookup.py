@@ -0,0 +1,121 @@
+#! /usr/bin/env python3
+
+import os, random, sys, tempfile, time
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'lib'))
+
+from pes_file_tools import cpk
+
+def packedFilename(i):
+	return "Asset/model/character/team%04d/file%06d.fpkd" % (i // 100, i)
+
+#
+# Writes an archive of $fileCount files. Most files are empty, so that
+# large archives consist mostly of their table of contents; every 1000th
+# file has content, to check reading through lookups.
+#
+def makeArchive(filename, fileCount):
+	writer = cpk.CpkWriter()
+	writer.open(filename)
+	for i in range(fileCount):
+		if i % 1000 == 0:
+			content = packedFilename(i).encode('utf-8')
+		else:
+			content = b''
+		writer.writeFile(packedFilename(i), content)
+	writer.close()
+
+def measure(filename, fileCount, lookupCount):
+	reader = cpk.CpkReader()
+	startTime = time.perf_counter()
+	reader.open(filename)
+	openTime = time.perf_counter() - startTime
+	
+	generator = random.Random(fileCount)
+	names = [packedFilename(generator.randrange(fileCount)) for i in range(lookupCount)]
+	
+	# The first lookup may build an index, and is timed separately.
+	startTime = time.perf_counter()
+	reader.findFile(names[0])
+	firstLookupTime = time.perf_counter() - startTime
+	
+	startTime = time.perf_counter()
+	for name in names:
+		entry = reader.findFile(name)
+		if entry is None or cpk.filenameKey(entry.name) != cpk.filenameKey(name):
+			print("FAIL: lookup of '%s' failed" % name)
+			sys.exit(1)
+	lookupTime = (time.perf_counter() - startTime) / lookupCount
+	
+	for i in range(0, fileCount, 1000):
+		content = reader.readFile(reader.findFile(packedFilename(i)))
+		if bytes(content) != packedFilename(i).encode('utf-8'):
+			print("FAIL: content of '%s' does not match" % packedFilename(i))
+			sys.exit(1)
+	if reader.findFile("missing/file.bin") is not None:
+		print("FAIL: lookup of a missing file succeeded")
+		sys.exit(1)
+	
+	reader.close()
+	return (openTime, firstLookupTime, lookupTime)
+
+def main(maxFileCount, lookupCount, tolerance):
+	fileCounts = [count for count in [1000, 10000, 100000, 500000] if count < maxFileCount] + [maxFileCount]
+	
+	print("%10s %10s %12s %14s" % ("files", "open", "first lookup", "lookup"))
+	lookupTimes = []
+	directory = tempfile.mkdtemp()
+	try:
+		for fileCount in fileCounts:
+			filename = os.path.join(directory, "lookup-%d.cpk" % fileCount)
+			makeArchive(filename, fileCount)
+			(openTime, firstLookupTime, lookupTime) = measure(filename, fileCount, lookupCount)
+			os.remove(filename)
+			
+			lookupTimes.append(lookupTime)
+			print("%10d %9.3fs %11.6fs %12.2fus" % (fileCount, openTime, firstLookupTime, lookupTime * 1e6))
+	finally:
+		os.rmdir(directory)
+	
+	if max(lookupTimes) > tolerance * min(lookupTimes):
+		print("FAIL: lookup time grows with archive size")
+		sys.exit(1)
+	print("OK")
+
+def usage():
+	print("cpk-lookup -- Measure cpk filename lookup time as archives grow")
+	print("Usage:")
+	print("  cpk-lookup [OPTIONS]")
+	print("Options:")
+	print("  -n, --files <COUNT>        Largest archive size [default 500000]")
+	print("  -l, --lookups <COUNT>      Lookups per archive [default 100000]")
+	print("  -t, --tolerance <FACTOR>   Allowed ratio of slowest to fastest lookup [default 3]")
+	print("  -h, --help                 Display this help")
+	sys.exit()
+
+maxFileCount = 500000
+lookupCount = 100000
+tolerance = 3.0
+
+index = 1
+while index < len(sys.argv):
+	arg = sys.argv[index]
+	index += 1
+	if arg in ['-n', '--files']:
+		if index >= len(sys.argv):
+			usage()
+		maxFileCount = int(sys.argv[index])
+		index += 1
+	elif arg in ['-l', '--lookups']:
+		if index >= len(sys.argv):
+			usage()
+		lookupCount = int(sys.argv[index])
+		index += 1
+	elif arg in ['-t', '--tolerance']:
+		if index >= len(sys.argv):
+			usage()
+		tolerance = float(sys.argv[index])
+		index += 1
+	else:
+		usage()
+
+main(maxFileCount, lookupCount, tolerance)
@@ -0,0 +1,180 @@
+#! /usr/bin/env python3
+
+import asyncio, os, random, subprocess, sys, tempfile, time
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'lib'))
+
+from pes_file_tools import cpk
+
+serveTool = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'tools', 'cpk', 'pes-cpk-serve.py')
+
+def packedFilename(i):
+	return "Asset/model/character/team%04d/file%06d.bin" % (i // 100, i)
+
+def fileContent(i, maxFileSize):
+	generator = random.Random(i)
+	size = generator.randrange(maxFileSize + 1)
+	return generator.getrandbits(8 * size).to_bytes(size, 'little') if size > 0 else b''
+
+def makeArchive(filename, fileCount, maxFileSize):
+	writer = cpk.CpkWriter()
+	writer.open(filename)
+	for i in range(fileCount):
+		writer.writeFile(packedFilename(i), fileContent(i, maxFileSize))
+	writer.close()
+
+async def readResponse(reader):
+	statusLine = await reader.readline()
+	status = int(statusLine.split()[1])
+	headers = {}
+	while True:
+		line = await reader.readline()
+		if line in [b'\r\n', b'']:
+			break
+		(key, separator, value) = line.decode('iso-8859-1').partition(':')
+		headers[key.strip().lower()] = value.strip()
+	body = await reader.readexactly(int(headers.get('content-length', '0')))
+	return (status, body)
+
+#
+# Runs $requestCount requests over one keep-alive connection, checking
+# every response against the generated content. Half the requests are
+# for a range of the file.
+#
+async def runClient(port, clientIndex, requestCount, contents, latencies):
+	generator = random.Random(clientIndex)
+	(reader, writer) = await asyncio.open_connection('127.0.0.1', port)
+	transferredBytes = 0
+	for i in range(requestCount):
+		fileIndex = generator.randrange(len(contents))
+		content = contents[fileIndex]
+		request = "GET /%s HTTP/1.1\r\nHost: localhost\r\n" % packedFilename(fileIndex)
+		if len(content) > 0 and generator.random() < 0.5:
+			start = generator.randrange(len(content))
+			end = generator.randrange(start, len(content))
+			request += "Range: bytes=%d-%d\r\n" % (start, end)
+			(expectedStatus, expectedBody) = (206, content[start : end + 1])
+		else:
+			(expectedStatus, expectedBody) = (200, content)
+		
+		startTime = time.perf_counter()
+		writer.write((request + "\r\n").encode('iso-8859-1'))
+		(status, body) = await readResponse(reader)
+		latencies.append(time.perf_counter() - startTime)
+		
+		if status != expectedStatus or body != expectedBody:
+			raise ValueError("Wrong response for '%s'" % request.splitlines()[0])
+		transferredBytes += len(body)
+	writer.close()
+	return transferredBytes
+
+async def runLoad(port, clientCount, requestCount, contents):
+	(reader, writer) = await asyncio.open_connection('127.0.0.1', port)
+	writer.write(b"GET /missing/file.bin HTTP/1.1\r\nHost: localhost\r\n\r\n")
+	(status, body) = await readResponse(reader)
+	writer.close()
+	if status != 404:
+		raise ValueError("Request for a missing file returned status %d" % status)
+	
+	latencies = []
+	startTime = time.perf_counter()
+	transferredBytes = await asyncio.gather(*[
+		runClient(port, clientIndex, requestCount, contents, latencies)
+		for clientIndex in range(clientCount)
+	])
+	elapsedTime = time.perf_counter() - startTime
+	return (elapsedTime, sum(transferredBytes), sorted(latencies))
+
+def startServer(filename, threads):
+	arguments = [sys.executable, serveTool, '-p', '0', filename]
+	if threads is not None:
+		arguments += ['-j', str(threads)]
+	server = subprocess.Popen(arguments, stdout = subprocess.PIPE, universal_newlines = True)
+	line = server.stdout.readline()
+	if not line.startswith('Serving'):
+		server.kill()
+		raise ValueError("Server failed to start: %s" % line.strip())
+	port = int(line.strip().rstrip('/').rsplit(':', 1)[1])
+	return (server, port)
+
+def main(fileCount, maxFileSize, clientCount, requestCount, threads):
+	directory = tempfile.mkdtemp()
+	filename = os.path.join(directory, "serve.cpk")
+	try:
+		contents = [fileContent(i, maxFileSize) for i in range(fileCount)]
+		makeArchive(filename, fileCount, maxFileSize)
+		(server, port) = startServer(filename, threads)
+		try:
+			(elapsedTime, transferredBytes, latencies) = asyncio.run(runLoad(port, clientCount, requestCount, contents))
+		finally:
+			server.terminate()
+			server.wait()
+	except Exception as e:
+		print("FAIL: %s" % e)
+		sys.exit(1)
+	finally:
+		if os.path.exists(filename):
+			os.remove(filename)
+		os.rmdir(directory)
+	
+	totalRequests = clientCount * requestCount
+	print("%d clients, %d requests in %.3fs" % (clientCount, totalRequests, elapsedTime))
+	print("%.1f requests/s, %.1f MiB/s" % (totalRequests / elapsedTime, transferredBytes / elapsedTime / (1 << 20)))
+	print("latency p50 %.2fms, p90 %.2fms, p99 %.2fms" % (
+		latencies[len(latencies) // 2] * 1000,
+		latencies[len(latencies) * 9 // 10] * 1000,
+		latencies[len(latencies) * 99 // 100] * 1000,
+	))
+	print("OK")
+
+def usage():
+	print("cpk-serve-load -- Load test pes-cpk-serve with concurrent range requests")
+	print("Usage:")
+	print("  cpk-serve-load [OPTIONS]")
+	print("Options:")
+	print("  -n, --files <COUNT>        Files in the served archive [default 200]")
+	print("  -s, --size <BYTES>         Largest file size [default 262144]")
+	print("  -c, --clients <COUNT>      Concurrent connections [default 32]")
+	print("  -r, --requests <COUNT>     Requests per connection [default 100]")
+	print("  -j, --threads <COUNT>      Server read threads [default: automatic]")
+	print("  -h, --help                 Display this help")
+	sys.exit()
+
+fileCount = 200
+maxFileSize = 262144
+clientCount = 32
+requestCount = 100
+threads = None
+
+index = 1
+while index < len(sys.argv):
+	arg = sys.argv[index]
+	index += 1
+	if arg in ['-n', '--files']:
+		if index >= len(sys.argv):
+			usage()
+		fileCount = int(sys.argv[index])
+		index += 1
+	elif arg in ['-s', '--size']:
+		if index >= len(sys.argv):
+			usage()
+		maxFileSize = int(sys.argv[index])
+		index += 1
+	elif arg in ['-c', '--clients']:
+		if index >= len(sys.argv):
+			usage()
+		clientCount = int(sys.argv[index])
+		index += 1
+	elif arg in ['-r', '--requests']:
+		if index >= len(sys.argv):
+			usage()
+		requestCount = int(sys.argv[index])
+		index += 1
+	elif arg in ['-j', '--threads']:
+		if index >= len(sys.argv):
+			usage()
+		threads = int(sys.argv[index])
+		index += 1
+	else:
+		usage()
+
+main(fileCount, maxFileSize, clientCount, requestCount, threads)
@@ -0,0 +1,151 @@
+#! /usr/bin/env python3
+
+import concurrent.futures, io, os, random, sys, tempfile, time, zlib
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'lib'))
+
+from pes_file_tools import cpk
+
+def packedFilename(i):
+	return "Asset/model/character/team%04d/file%06d.bin" % (i // 100, i)
+
+def fileContent(i, maxFileSize):
+	generator = random.Random(i)
+	size = generator.randrange(maxFileSize + 1)
+	if size == 0:
+		return b''
+	return generator.getrandbits(8 * size).to_bytes(size, 'little')
+
+def makeArchive(filename, fileCount, maxFileSize):
+	writer = cpk.CpkWriter()
+	writer.open(filename, enableFileCrc = True)
+	for i in range(fileCount):
+		writer.writeFile(packedFilename(i), fileContent(i, maxFileSize))
+	writer.close()
+
+#
+# Reads a packed file the way a caller would: by name, as a whole or
+# through readFileTo, and checks its crc. Returns the crc32 of the
+# content, along with the outcome of the crc check.
+#
+def readTask(reader, filename, useStream):
+	entry = reader.findFile(filename)
+	if useStream:
+		outputStream = io.BytesIO()
+		reader.readFileTo(entry, outputStream)
+		content = outputStream.getvalue()
+	else:
+		content = reader.readFile(entry)
+	return (zlib.crc32(content), reader.verifyFile(entry))
+
+def readSerial(reader, fileCount):
+	expected = {}
+	for i in range(fileCount):
+		expected[packedFilename(i)] = readTask(reader, packedFilename(i), False)
+	return expected
+
+def readParallel(reader, fileCount, readCount, threads, expected):
+	generator = random.Random(readCount)
+	tasks = [(packedFilename(generator.randrange(fileCount)), generator.random() < 0.5) for i in range(readCount)]
+	
+	failures = 0
+	startTime = time.perf_counter()
+	executor = concurrent.futures.ThreadPoolExecutor(threads)
+	try:
+		futures = [executor.submit(readTask, reader, filename, useStream) for (filename, useStream) in tasks]
+		for ((filename, useStream), future) in zip(tasks, futures):
+			if future.result() != expected[filename]:
+				print("FAIL: content of '%s' does not match the serial read" % filename)
+				failures += 1
+	finally:
+		executor.shutdown()
+	return (time.perf_counter() - startTime, failures)
+
+def main(fileCount, maxFileSize, readCount, threadCounts):
+	directory = tempfile.mkdtemp()
+	filename = os.path.join(directory, "threads.cpk")
+	failures = 0
+	try:
+		makeArchive(filename, fileCount, maxFileSize)
+		
+		reader = cpk.CpkReader()
+		reader.open(filename)
+		expected = readSerial(reader, fileCount)
+		for i in range(fileCount):
+			if expected[packedFilename(i)] != (zlib.crc32(fileContent(i, maxFileSize)), True):
+				print("FAIL: serial read of '%s' does not match" % packedFilename(i))
+				failures += 1
+		
+		# Archives read from memory, such as nested archives, take the locked
+		# path instead of positional reads.
+		stream = open(filename, 'rb')
+		memoryReader = cpk.CpkReader()
+		memoryReader.openStream(io.BytesIO(stream.read()))
+		stream.close()
+		
+		print("%8s %8s %12s" % ("threads", "source", "time"))
+		for threads in threadCounts:
+			for (source, sharedReader) in [("file", reader), ("memory", memoryReader)]:
+				(elapsedTime, readFailures) = readParallel(sharedReader, fileCount, readCount, threads, expected)
+				failures += readFailures
+				print("%8d %8s %11.3fs" % (threads, source, elapsedTime))
+		
+		reader.close()
+		memoryReader.close()
+	finally:
+		if os.path.exists(filename):
+			os.remove(filename)
+		os.rmdir(directory)
+	
+	if failures > 0:
+		print("FAIL: %d reads did not match" % failures)
+		sys.exit(1)
+	print("OK")
+
+def usage():
+	print("cpk-threads -- Stress test concurrent reads from one shared cpk reader")
+	print("Usage:")
+	print("  cpk-threads [OPTIONS]")
+	print("Options:")
+	print("  -n, --files <COUNT>        Files in the archive [default 200]")
+	print("  -s, --size <BYTES>         Largest file size [default 3000000]")
+	print("  -r, --reads <COUNT>        Random reads per run [default 2000]")
+	print("  -j, --threads <COUNT>      Thread count to test; may be repeated [default 1, 4, 16]")
+	print("  -h, --help                 Display this help")
+	sys.exit()
+
+fileCount = 200
+maxFileSize = 3000000
+readCount = 2000
+threadCounts = []
+
+index = 1
+while index < len(sys.argv):
+	arg = sys.argv[index]
+	index += 1
+	if arg in ['-n', '--files']:
+		if index >= len(sys.argv):
+			usage()
+		fileCount = int(sys.argv[index])
+		index += 1
+	elif arg in ['-s', '--size']:
+		if index >= len(sys.argv):
+			usage()
+		maxFileSize = int(sys.argv[index])
+		index += 1
+	elif arg in ['-r', '--reads']:
+		if index >= len(sys.argv):
+			usage()
+		readCount = int(sys.argv[index])
+		index += 1
+	elif arg in ['-j', '--threads']:
+		if index >= len(sys.argv):
+			usage()
+		threadCounts.append(int(sys.argv[index]))
+		index += 1
+	else:
+		usage()
+
+if len(threadCounts) == 0:
+	threadCounts = [1, 4, 16]
+
+main(fileCount, maxFileSize, readCount, threadCounts)
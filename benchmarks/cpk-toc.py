@@ -0,0 +1,89 @@
+#! /usr/bin/env python3
+
+import io, os, random, sys, time
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'lib'))
+
+from pes_file_tools import cpk
+
+def makeToc(rowCount):
+	generator = random.Random(rowCount)
+	toc = cpk.UtfTable()
+	toc.columns.append(cpk.UtfTable.Column("DirName", cpk.UtfTable.UtfDatumType.string))
+	toc.columns.append(cpk.UtfTable.Column("FileName", cpk.UtfTable.UtfDatumType.string))
+	toc.columns.append(cpk.UtfTable.Column("FileSize", cpk.UtfTable.UtfDatumType.int32))
+	toc.columns.append(cpk.UtfTable.Column("ExtractSize", cpk.UtfTable.UtfDatumType.int32))
+	toc.columns.append(cpk.UtfTable.Column("FileOffset", cpk.UtfTable.UtfDatumType.int64))
+	toc.columns.append(cpk.UtfTable.Column("ID", cpk.UtfTable.UtfDatumType.int32))
+	toc.columns.append(cpk.UtfTable.Column("UserString", cpk.UtfTable.UtfDatumType.string))
+	
+	offset = 0
+	for i in range(rowCount):
+		size = generator.randint(0, 1 << 20)
+		toc.rows.append({
+			"DirName": "Asset/model/character/uniform/team%d" % (i // 100),
+			"FileName": "file%06d.fpkd" % i,
+			"FileSize": size,
+			"ExtractSize": size,
+			"FileOffset": offset,
+			"ID": i,
+			"UserString": "",
+		})
+		offset += size + (-size % 0x800)
+	return toc
+
+def main(rowCount, repeat):
+	toc = makeToc(rowCount)
+	
+	times = []
+	for i in range(repeat):
+		stream = io.BytesIO()
+		startTime = time.perf_counter()
+		size = toc.write(stream, 'TOC ', 'CpkTocInfo')
+		times.append(time.perf_counter() - startTime)
+	
+	stream.seek(0)
+	readBack = cpk.UtfTable()
+	startTime = time.perf_counter()
+	readBack.read(stream, 0, 'TOC ')
+	readTime = time.perf_counter() - startTime
+	
+	if readBack.rows != toc.rows:
+		print("FAIL: table read back does not match the table written")
+		sys.exit(1)
+	
+	print("rows:       %10d" % rowCount)
+	print("table size: %10d" % size)
+	print("write time: %9.3fs (best of %d)" % (min(times), repeat))
+	print("read time:  %9.3fs" % readTime)
+
+def usage():
+	print("cpk-toc -- Measure cpk table of contents encoding time")
+	print("Usage:")
+	print("  cpk-toc [OPTIONS]")
+	print("Options:")
+	print("  -n, --rows <COUNT>         Number of files in the table [default 200000]")
+	print("  -r, --repeat <COUNT>       Take the best of <COUNT> runs [default 3]")
+	print("  -h, --help                 Display this help")
+	sys.exit()
+
+rowCount = 200000
+repeat = 3
+
+index = 1
+while index < len(sys.argv):
+	arg = sys.argv[index]
+	index += 1
+	if arg in ['-n', '--rows']:
+		if index >= len(sys.argv):
+			usage()
+		rowCount = int(sys.argv[index])
+		index += 1
+	elif arg in ['-r', '--repeat']:
+		if index >= len(sys.argv):
+			usage()
+		repeat = int(sys.argv[index])
+		index += 1
+	else:
+		usage()
+
+main(rowCount, repeat)
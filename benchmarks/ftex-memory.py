@@ -0,0 +1,103 @@
+#! /usr/bin/env python3
+
+import os, random, struct, sys, tracemalloc
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'lib'))
+
+from pes_file_tools import ftex
+
+class NullStream:
+	def __init__(self):
+		self.position = 0
+	
+	def write(self, buffer):
+		self.position += len(buffer)
+		return len(buffer)
+	
+	def seek(self, position, whence):
+		self.position = position
+	
+	def tell(self):
+		return self.position
+
+def makeDds(size):
+	mipmapCount = size.bit_length()
+	header = struct.pack('< 4s 7I 44x 2I 4s 5I 2I 12x',
+		b'DDS ',
+		124,
+		0xa1007,
+		size,
+		size,
+		0,
+		1,
+		mipmapCount,
+		32,
+		0x4,
+		b'DXT1',
+		0, 0, 0, 0, 0,
+		0x401008,
+		0,
+	)
+	length = sum([ftex.ddsMipmapSize(2, size, size, 1, i) for i in range(mipmapCount)])
+	generator = random.Random(size)
+	return header + bytes(generator.getrandbits(4) for i in range(length))
+
+def measure(function):
+	tracemalloc.start()
+	tracemalloc.reset_peak()
+	result = function()
+	(current, peak) = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+	return (result, peak)
+
+def main(size, tolerance):
+	ddsBuffer = makeDds(size)
+	
+	(outputBuffer, bufferPeak) = measure(lambda: ftex.ddsToFtexBuffer(ddsBuffer, 'SRGB'))
+	outputSize = len(outputBuffer)
+	del outputBuffer
+	(streamSize, streamPeak) = measure(lambda: ftex.ddsToFtexStream(ddsBuffer, 'SRGB', NullStream()))
+	
+	# The input buffer is allocated before measuring starts, so the
+	# expected peak is the output size plus some bookkeeping.
+	limit = outputSize * tolerance + (1 << 20)
+	print("input size:   %10d" % len(ddsBuffer))
+	print("output size:  %10d" % outputSize)
+	print("buffer peak:  %10d (%.2fx output)" % (bufferPeak, bufferPeak / outputSize))
+	print("stream peak:  %10d (%.2fx output)" % (streamPeak, streamPeak / streamSize))
+	
+	if bufferPeak > limit or streamPeak > limit:
+		print("FAIL: peak memory exceeds %d bytes" % limit)
+		sys.exit(1)
+	print("OK")
+
+def usage():
+	print("ftex-memory -- Measure peak memory use of dds to ftex conversion")
+	print("Usage:")
+	print("  ftex-memory [OPTIONS]")
+	print("Options:")
+	print("  -s, --size <PIXELS>        Texture width and height [default 2048]")
+	print("  -t, --tolerance <FACTOR>   Allowed peak as a multiple of output size [default 1.25]")
+	print("  -h, --help                 Display this help")
+	sys.exit()
+
+size = 2048
+tolerance = 1.25
+
+index = 1
+while index < len(sys.argv):
+	arg = sys.argv[index]
+	index += 1
+	if arg in ['-s', '--size']:
+		if index >= len(sys.argv):
+			usage()
+		size = int(sys.argv[index])
+		index += 1
+	elif arg in ['-t', '--tolerance']:
+		if index >= len(sys.argv):
+			usage()
+		tolerance = float(sys.argv[index])
+		index += 1
+	else:
+		usage()
+
+main(size, tolerance)
@@ -0,0 +1,410 @@
+#! /usr/bin/env python3
+
+import fnmatch, json, os, platform, sys, tempfile, time
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'lib'))
+
+import corpus
+from pes_file_tools import cpk, crilayla, fpk, ftex, uniparam
+from pes_file_tools import zlib as pesZlib
+
+resultsFormat = 1
+# Differences smaller than this many seconds are treated as noise.
+minimumDifference = 0.001
+
+#
+# A scenario prepares its input once with $setup, then times $run, which
+# is passed the result of $setup. $size is passed the result of $setup, and
+# returns the number of bytes processed by each run. $check is passed the
+# result of $setup and the result of the last run, and returns an error
+# message if the output is wrong, or None.
+#
+class Scenario:
+	def __init__(self, name, setup, run, size, check = None):
+		self.name = name
+		self.setup = setup
+		self.run = run
+		self.size = size
+		self.check = check
+
+class Result:
+	def __init__(self, name, times, size):
+		self.name = name
+		self.times = sorted(times)
+		self.size = size
+	
+	def encode(self):
+		return {
+			'seconds': self.times[0],
+			'median': self.times[len(self.times) // 2],
+			'repeats': len(self.times),
+			'bytes': self.size,
+			'throughput': self.size / self.times[0] if self.times[0] > 0 else None,
+		}
+
+#
+# Returns a function that calls $function the first time it is called, and
+# returns the same result every time after, so that inputs shared between
+# scenarios are only generated once, and only for scenarios that run.
+#
+def cached(function):
+	results = []
+	def get():
+		if len(results) == 0:
+			results.append(function())
+		return results[0]
+	return get
+
+def contentSize(contents):
+	return sum([len(content) for content in contents.values()])
+
+def checkCpk(filename, contents):
+	reader = cpk.CpkReader()
+	reader.open(filename)
+	try:
+		if len(reader.files) != len(contents):
+			return "Archive has %d files, expected %d" % (len(reader.files), len(contents))
+		for entry in reader.files:
+			if bytes(reader.readFile(entry)) != contents[entry.name.lstrip('/')]:
+				return "Content of '%s' does not match" % entry.name
+	finally:
+		reader.close()
+	return None
+
+#
+# Builds the scenarios, with inputs scaled by $scale. Temporary files are
+# created in $directory. Inputs are generated when a scenario is set up.
+#
+def scenarios(directory, scale):
+	def count(n):
+		return max(1, int(n * scale))
+	
+	cpkFilename = os.path.join(directory, "suite.cpk")
+	cpkContents = cached(lambda: corpus.cpkContents(count(1000), 16, 1 << 17, 1))
+	
+	def cpkWrite(contents):
+		corpus.writeCpk(cpkFilename, contents)
+		return cpkFilename
+	
+	def cpkReadSetup():
+		contents = cpkContents()
+		corpus.writeCpk(cpkFilename, contents)
+		return contents
+	
+	def cpkOpen(contents):
+		reader = cpk.CpkReader()
+		reader.open(cpkFilename)
+		fileCount = len(reader.files)
+		reader.close()
+		return fileCount
+	
+	def cpkRead(contents):
+		reader = cpk.CpkReader()
+		reader.open(cpkFilename)
+		output = {}
+		for entry in reader.files:
+			output[entry.name.lstrip('/')] = reader.readFile(entry)
+		reader.close()
+		return output
+	
+	def cpkReadCheck(contents, output):
+		for (name, content) in contents.items():
+			if bytes(output.get(name, b'')) != content:
+				return "Content of '%s' does not match" % name
+		return None
+	
+	def cpkRoundTrip(contents):
+		corpus.writeCpk(cpkFilename, contents)
+		return checkCpk(cpkFilename, contents)
+	
+	crilaylaInput = cached(lambda: corpus.makeCrilayla(count(1 << 17), 3))
+	
+	def ftexSetup(ftexFormat):
+		def setup():
+			ddsBuffer = corpus.makeDds(ftexFormat, count(256), count(256), 4)
+			return (ddsBuffer, ftex.ddsToFtexBuffer(ddsBuffer, 'LINEAR'))
+		return cached(setup)
+	
+	# An ftex file converted to dds and back should come out unchanged.
+	def ftexRoundTripCheck(buffers, ftexBuffer):
+		if ftexBuffer != buffers[1]:
+			return "Converting to dds and back changed the ftex file"
+		return None
+	
+	def fpkSetup():
+		fpkFile = fpk.FpkFile()
+		fpkFile.entries = corpus.fpkContents(count(200), 16, 1 << 16, 5)
+		return (fpkFile, fpkFile.write(True))
+	fpkInput = cached(fpkSetup)
+	
+	def fpkRead(buffers):
+		fpkFile = fpk.FpkFile()
+		fpkFile.read(buffers[1])
+		return fpkFile
+	
+	def fpkReadCheck(buffers, fpkFile):
+		if set(fpkFile.entries.keys()) != set(buffers[0].entries.keys()):
+			return "Filenames do not match"
+		for (filename, content) in buffers[0].entries.items():
+			if bytes(fpkFile.entries[filename]) != bytes(content):
+				return "Content of '%s' does not match" % filename
+		return None
+	
+	def uniparamSetup():
+		uniparamFile = uniparam.UniformParameterFile()
+		uniparamFile.entries = corpus.uniparamContents(count(2000), 64, 4096, 6)
+		content = uniparamFile.write()
+		return (uniparamFile, content, pesZlib.compress(content))
+	uniparamInput = cached(uniparamSetup)
+	
+	def uniparamRead(buffers, index):
+		uniparamFile = uniparam.UniformParameterFile()
+		uniparamFile.read(buffers[index])
+		return uniparamFile
+	
+	def uniparamReadCheck(buffers, uniparamFile):
+		if set(uniparamFile.entries.keys()) != set(buffers[0].entries.keys()):
+			return "Filenames do not match"
+		for (filename, content) in buffers[0].entries.items():
+			if bytes(uniparamFile.entries[filename]) != bytes(content):
+				return "Content of '%s' does not match" % filename
+		return None
+	
+	def uniparamRoundTrip(buffers):
+		uniparamFile = uniparam.UniformParameterFile()
+		uniparamFile.read(buffers[0].write())
+		return uniparamFile
+	
+	def entriesSize(buffers):
+		return contentSize(buffers[0].entries)
+	
+	def firstBufferSize(buffers):
+		return len(buffers[0])
+	
+	result = [
+		Scenario('cpk.write.stored', cpkContents, cpkWrite, contentSize, lambda contents, filename: checkCpk(filename, contents)),
+		Scenario('cpk.open', cpkReadSetup, cpkOpen, contentSize, lambda contents, fileCount: None if fileCount == len(contents) else "Wrong file count"),
+		Scenario('cpk.read.stored', cpkReadSetup, cpkRead, contentSize, cpkReadCheck),
+		Scenario('cpk.roundtrip', cpkContents, cpkRoundTrip, contentSize, lambda contents, error: error),
+		Scenario('crilayla.decompress', crilaylaInput, lambda buffers: crilayla.decompressCrilayla(buffers[1]), firstBufferSize, lambda buffers, output: None if bytes(output) == buffers[0] else "Decompressed content does not match"),
+	]
+	
+	for ftexFormat in sorted(ftex.formatBlockConfiguration.keys()):
+		ftexInput = ftexSetup(ftexFormat)
+		result += [
+			Scenario('ftex.%d.dds-to-ftex' % ftexFormat, ftexInput, lambda buffers: ftex.ddsToFtexBuffer(buffers[0], 'LINEAR'), firstBufferSize, lambda buffers, output: None if output == buffers[1] else "Ftex output is not deterministic"),
+			Scenario('ftex.%d.ftex-to-dds' % ftexFormat, ftexInput, lambda buffers: ftex.ftexToDdsBuffer(buffers[1]), firstBufferSize, lambda buffers, output: None if len(output) == len(buffers[0]) else "Dds output has the wrong size"),
+			Scenario('ftex.%d.roundtrip' % ftexFormat, ftexInput, lambda buffers: ftex.ddsToFtexBuffer(ftex.ftexToDdsBuffer(buffers[1]), 'LINEAR'), firstBufferSize, ftexRoundTripCheck),
+		]
+	
+	result += [
+		Scenario('fpk.write', fpkInput, lambda buffers: buffers[0].write(True), entriesSize, lambda buffers, output: None if output == buffers[1] else "Fpk output is not deterministic"),
+		Scenario('fpk.read', fpkInput, fpkRead, entriesSize, fpkReadCheck),
+		Scenario('fpk.roundtrip', fpkInput, lambda buffers: fpkRead((None, buffers[0].write(True))), entriesSize, fpkReadCheck),
+		Scenario('uniparam.write', uniparamInput, lambda buffers: buffers[0].write(), entriesSize, lambda buffers, output: None if output == buffers[1] else "Uniparam output is not deterministic"),
+		Scenario('uniparam.read', uniparamInput, lambda buffers: uniparamRead(buffers, 1), entriesSize, uniparamReadCheck),
+		Scenario('uniparam.read.compressed', uniparamInput, lambda buffers: uniparamRead(buffers, 2), entriesSize, uniparamReadCheck),
+		Scenario('uniparam.roundtrip', uniparamInput, uniparamRoundTrip, entriesSize, uniparamReadCheck),
+	]
+	return result
+
+#
+# Returns the times of $repeats runs of $scenario, and the number of bytes
+# processed by each run.
+#
+def runScenario(scenario, repeats):
+	state = scenario.setup()
+	times = []
+	output = None
+	for i in range(repeats):
+		startTime = time.perf_counter()
+		output = scenario.run(state)
+		times.append(time.perf_counter() - startTime)
+	if scenario.check is not None:
+		error = scenario.check(state, output)
+		if error is not None:
+			raise ValueError(error)
+	return (times, scenario.size(state))
+
+#
+# Compares results against a baseline, both dictionaries from scenario
+# name to encoded Result. A scenario has regressed if its fastest time is
+# more than $tolerance and $minimumDifference slower than in the baseline.
+# Returns the number of regressed scenarios.
+#
+def compareResults(results, baseline, tolerance):
+	regressions = 0
+	print("")
+	print("%-32s %12s %12s %8s" % ("scenario", "baseline", "current", "change"))
+	for name in sorted(set(results.keys()) | set(baseline.keys())):
+		if name not in results:
+			print("%-32s %11.4fs %12s" % (name, baseline[name]['seconds'], "missing"))
+			continue
+		if name not in baseline:
+			print("%-32s %12s %11.4fs" % (name, "missing", results[name]['seconds']))
+			continue
+		ratio = results[name]['seconds'] / max(baseline[name]['seconds'], 1e-9)
+		difference = abs(results[name]['seconds'] - baseline[name]['seconds'])
+		if ratio > 1 + tolerance and difference > minimumDifference:
+			status = "SLOWER"
+			regressions += 1
+		elif ratio < 1 / (1 + tolerance) and difference > minimumDifference:
+			status = "faster"
+		else:
+			status = ""
+		print("%-32s %11.4fs %11.4fs %+7.1f%% %s" % (
+			name,
+			baseline[name]['seconds'],
+			results[name]['seconds'],
+			(ratio - 1) * 100,
+			status,
+		))
+	return regressions
+
+def matchesPatterns(name, patterns):
+	return len(patterns) == 0 or any([fnmatch.fnmatch(name, pattern) for pattern in patterns])
+
+def main(patterns, repeats, scale, outputFile, baselineFile, tolerance, listMode):
+	directory = tempfile.mkdtemp()
+	failures = 0
+	results = {}
+	try:
+		for scenario in scenarios(directory, scale):
+			if not matchesPatterns(scenario.name, patterns):
+				continue
+			if listMode:
+				print(scenario.name)
+				continue
+			try:
+				(times, size) = runScenario(scenario, repeats)
+			except Exception as e:
+				print("%-32s FAIL: %s" % (scenario.name, e))
+				sys.stdout.flush()
+				failures += 1
+				continue
+			result = Result(scenario.name, times, size)
+			results[scenario.name] = result.encode()
+			print("%-32s %9.4fs %9.4fs %10.2f MiB/s" % (
+				scenario.name,
+				result.times[0],
+				result.times[len(result.times) // 2],
+				size / max(result.times[0], 1e-9) / (1 << 20),
+			))
+			sys.stdout.flush()
+	finally:
+		for filename in os.listdir(directory):
+			os.remove(os.path.join(directory, filename))
+		os.rmdir(directory)
+	
+	if listMode:
+		return
+	
+	document = {
+		'format': resultsFormat,
+		'python': platform.python_version(),
+		'platform': platform.platform(),
+		'scale': scale,
+		'scenarios': results,
+	}
+	if outputFile is not None:
+		stream = open(outputFile, 'w', encoding = 'utf-8')
+		json.dump(document, stream, indent = 2, sort_keys = True)
+		stream.write("\n")
+		stream.close()
+	
+	regressions = 0
+	if baselineFile is not None:
+		stream = open(baselineFile, 'r', encoding = 'utf-8')
+		baseline = json.load(stream)
+		stream.close()
+		if baseline.get('format') != resultsFormat:
+			print("Unsupported baseline format")
+			sys.exit(1)
+		if baseline.get('scale') != scale:
+			print("Warning: baseline was measured at scale %s" % baseline.get('scale'))
+		selectedBaseline = {}
+		for (name, result) in baseline['scenarios'].items():
+			if matchesPatterns(name, patterns):
+				selectedBaseline[name] = result
+		regressions = compareResults(results, selectedBaseline, tolerance)
+	
+	if failures > 0 or regressions > 0:
+		print("FAIL: %d scenarios failed, %d regressed" % (failures, regressions))
+		sys.exit(1)
+	print("OK")
+
+def usage():
+	print("suite -- Run the benchmark scenarios on synthetic PES files")
+	print("Usage:")
+	print("  suite [OPTIONS] [scenario pattern]...")
+	print("    Runs the scenarios whose names match any of the glob patterns, or")
+	print("    all scenarios; every scenario checks its output before reporting")
+	print("Options:")
+	print("  -r, --repeats <COUNT>      Time each scenario <COUNT> times [default 5]")
+	print("  -s, --scale <FACTOR>       Scale input sizes by <FACTOR> [default 1]")
+	print("  -o, --output <FILE>        Write results as JSON to <FILE>")
+	print("  -b, --baseline <FILE>      Compare results with the JSON results in <FILE>")
+	print("  -t, --tolerance <FRACTION> Allowed slowdown against the baseline [default 0.25]")
+	print("  -l, --list                 List scenarios without running them")
+	print("  -h, --help                 Display this help")
+	sys.exit()
+
+patterns = []
+repeats = 5
+scale = 1.0
+outputFile = None
+baselineFile = None
+tolerance = 0.25
+listMode = False
+
+index = 1
+while index < len(sys.argv):
+	arg = sys.argv[index]
+	index += 1
+	if arg in ['-r', '--repeats']:
+		if index >= len(sys.argv):
+			usage()
+		try:
+			repeats = int(sys.argv[index])
+		except ValueError:
+			usage()
+		index += 1
+		if repeats < 1:
+			usage()
+	elif arg in ['-s', '--scale']:
+		if index >= len(sys.argv):
+			usage()
+		try:
+			scale = float(sys.argv[index])
+		except ValueError:
+			usage()
+		index += 1
+		if scale <= 0:
+			usage()
+	elif arg in ['-o', '--output']:
+		if index >= len(sys.argv):
+			usage()
+		outputFile = sys.argv[index]
+		index += 1
+	elif arg in ['-b', '--baseline']:
+		if index >= len(sys.argv):
+			usage()
+		baselineFile = sys.argv[index]
+		index += 1
+	elif arg in ['-t', '--tolerance']:
+		if index >= len(sys.argv):
+			usage()
+		try:
+			tolerance = float(sys.argv[index])
+		except ValueError:
+			usage()
+		index += 1
+		if tolerance < 0:
+			usage()
+	elif arg in ['-l', '--list']:
+		listMode = True
+	elif arg[0:1] == '-':
+		usage()
+	else:
+		patterns.append(arg)
+
+main(patterns, repeats, scale, outputFile, baselineFile, tolerance, listMode)
@@ -0,0 +1,97 @@
+#! /usr/bin/env python3
+
+import os, random, sys, time
+import zlib as standardZlib
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'lib'))
+
+from pes_file_tools import zlib
+
+#
+# Generates text-like data, which compresses at a ratio similar to the
+# xml and lua files found in PES archives.
+#
+def makeData(size):
+	generator = random.Random(size)
+	words = [bytes(generator.choice(b'abcdefghijklmnopqrstuvwxyz<>="/ ') for i in range(generator.randint(2, 10))) for j in range(1000)]
+	chunks = []
+	length = 0
+	while length < size:
+		chunk = b' '.join(generator.choice(words) for i in range(1000))
+		chunks.append(chunk)
+		length += len(chunk)
+	return b''.join(chunks)[:size]
+
+def main(size, maxThreads, repeat):
+	data = makeData(size)
+	print("input size: %d" % len(data))
+	print("%8s %10s %10s %12s %8s" % ("threads", "time", "MB/s", "output", "speedup"))
+	
+	threadCounts = []
+	threads = 1
+	while threads <= maxThreads:
+		threadCounts.append(threads)
+		threads *= 2
+	if threadCounts[-1] != maxThreads:
+		threadCounts.append(maxThreads)
+	
+	baseline = None
+	for threads in threadCounts:
+		times = []
+		for i in range(repeat):
+			startTime = time.perf_counter()
+			output = zlib.compress(data, threads)
+			times.append(time.perf_counter() - startTime)
+		elapsed = min(times)
+		if baseline is None:
+			baseline = elapsed
+		
+		if standardZlib.decompress(output[16:]) != data:
+			print("FAIL: output with %d threads does not decompress to the input" % threads)
+			sys.exit(1)
+		
+		print("%8d %9.3fs %10.1f %12d %7.2fx" % (
+			threads,
+			elapsed,
+			len(data) / elapsed / (1 << 20),
+			len(output),
+			baseline / elapsed,
+		))
+
+def usage():
+	print("zlib-threads -- Measure scaling of parallel zlib compression")
+	print("Usage:")
+	print("  zlib-threads [OPTIONS]")
+	print("Options:")
+	print("  -s, --size <MB>            Input size in megabytes [default 64]")
+	print("  -j, --threads <COUNT>      Highest thread count to measure [default: all cores]")
+	print("  -n, --repeat <COUNT>       Take the best of <COUNT> runs [default 3]")
+	print("  -h, --help                 Display this help")
+	sys.exit()
+
+size = 64 << 20
+maxThreads = os.cpu_count() or 1
+repeat = 3
+
+index = 1
+while index < len(sys.argv):
+	arg = sys.argv[index]
+	index += 1
+	if arg in ['-s', '--size']:
+		if index >= len(sys.argv):
+			usage()
+		size = int(sys.argv[index]) << 20
+		index += 1
+	elif arg in ['-j', '--threads']:
+		if index >= len(sys.argv):
+			usage()
+		maxThreads = int(sys.argv[index])
+		index += 1
+	elif arg in ['-n', '--repeat']:
+		if index >= len(sys.argv):
+			usage()
+		repeat = int(sys.argv[index])
+		index += 1
+	else:
+		usage()
+
+main(size, maxThreads, repeat)
@@ -0,0 +1,163 @@
+import io
+
+from . import cpk, fpk
+
+class DecodeError(Exception):
+	pass
+
+#
+# Paths into nested archives consist of a filesystem path to an archive,
+# followed by the path of a packed file in that archive for every level of
+# nesting, separated by '!/'. For instance,
+#   dt36_win.cpk!/Asset/model/x.fpkd!/x.ftex
+# refers to the file x.ftex, stored in the fpkd file Asset/model/x.fpkd,
+# stored in the cpk file dt36_win.cpk.
+#
+pathSeparator = '!/'
+
+def splitPath(path):
+	return path.split(pathSeparator)
+
+def joinPath(components):
+	return pathSeparator.join(components)
+
+#
+# Packed filenames are compared without leading or trailing slashes,
+# as cpk and fpk files disagree about leading slashes.
+#
+def normalizeFilename(filename):
+	return filename.replace('\\', '/').strip('/')
+
+def archiveType(content):
+	if content[0:4] == b'CPK ':
+		return 'cpk'
+	if content[0:6] == b'foxfpk':
+		return 'fpk'
+	return None
+
+class CpkArchive:
+	def __init__(self, reader):
+		self.reader = reader
+		self.index = {}
+		for entry in reader.files:
+			self.index[normalizeFilename(entry.name)] = entry
+	
+	def filenames(self):
+		return [entry.name for entry in self.reader.files]
+	
+	def readFile(self, filename):
+		normalizedFilename = normalizeFilename(filename)
+		if normalizedFilename not in self.index:
+			return None
+		return memoryview(self.reader.readFile(self.index[normalizedFilename]))
+	
+	def close(self):
+		self.reader.close()
+
+class FpkArchive:
+	def __init__(self, fpkFile):
+		self.fpkFile = fpkFile
+		self.index = {}
+		for filename in fpkFile.entries:
+			self.index[normalizeFilename(filename)] = filename
+	
+	def filenames(self):
+		return list(self.fpkFile.entries.keys())
+	
+	def readFile(self, filename):
+		normalizedFilename = normalizeFilename(filename)
+		if normalizedFilename not in self.index:
+			return None
+		return memoryview(self.fpkFile.entries[self.index[normalizedFilename]])
+	
+	def close(self):
+		self.fpkFile.close()
+
+#
+# Resolves nested archive paths, keeping every archive it opens along
+# with an index of its packed files, so that repeated lookups in the same
+# archive do not parse it again.
+#
+class ArchiveResolver:
+	def __init__(self):
+		# archives is a dictionary from archive path to CpkArchive or FpkArchive.
+		self.archives = {}
+	
+	def close(self):
+		for archive in self.archives.values():
+			archive.close()
+		self.archives = {}
+	
+	#
+	# Closes the archive at $path and the archives nested in it, to release
+	# their memory once they are no longer needed.
+	#
+	def closeArchive(self, path):
+		for archivePath in list(self.archives.keys()):
+			if archivePath == path or archivePath.startswith(path + pathSeparator):
+				self.archives[archivePath].close()
+				del self.archives[archivePath]
+	
+	#
+	# Opens the archive at $path. For nested archives, $content is the
+	# content of the packed file at $path if the caller has already read
+	# it, or None to read it.
+	#
+	def openArchive(self, path, content = None):
+		if path in self.archives:
+			return self.archives[path]
+		components = splitPath(path)
+		
+		if len(components) == 1:
+			stream = open(components[0], 'rb')
+			magic = stream.read(6)
+			stream.seek(0, 0)
+			if archiveType(magic) == 'cpk':
+				reader = cpk.CpkReader()
+				try:
+					reader.openStream(stream)
+				except:
+					reader.close()
+					raise
+				archive = CpkArchive(reader)
+			elif archiveType(magic) == 'fpk':
+				stream.close()
+				fpkFile = fpk.FpkFile()
+				fpkFile.open(components[0])
+				archive = FpkArchive(fpkFile)
+			else:
+				stream.close()
+				raise DecodeError("File '%s' is not a cpk or fpk archive" % components[0])
+		else:
+			if content is None:
+				content = self.readFile(path)
+			if archiveType(content) == 'cpk':
+				reader = cpk.CpkReader()
+				reader.openStream(io.BytesIO(content))
+				archive = CpkArchive(reader)
+			elif archiveType(content) == 'fpk':
+				fpkFile = fpk.FpkFile()
+				fpkFile.read(content, verifyChecksums = False)
+				archive = FpkArchive(fpkFile)
+			else:
+				raise DecodeError("Packed file '%s' is not a cpk or fpk archive" % path)
+		
+		self.archives[path] = archive
+		return archive
+	
+	def readFile(self, path):
+		components = splitPath(path)
+		if len(components) == 1:
+			stream = open(components[0], 'rb')
+			content = stream.read()
+			stream.close()
+			return memoryview(content)
+		
+		archive = self.openArchive(joinPath(components[:-1]))
+		content = archive.readFile(components[-1])
+		if content is None:
+			raise DecodeError("File '%s' not found" % path)
+		return content
+	
+	def listFiles(self, path):
+		return self.openArchive(path).filenames()
@@ -1,12 +1,20 @@
+import asyncio
 import datetime
 import io
+import mmap
+import multiprocessing
+import os
 import struct
+import threading
+import zlib
 
 from .crilayla import decompressCrilayla
 
 class DecodeError(Exception):
 	pass
 
+blockSize = 1 << 20
+
 def read(stream, size):
 	output = bytes()
 	while len(output) < size:
@@ -23,6 +31,77 @@ def write(stream, content):
 			raise DecodeError("Writing error")
 		content = content[written:]
 
+#
+# Reads from a file at a given position without using the file position
+# of the stream, so that reads can run concurrently. Uses os.pread where
+# available, and a memory map otherwise.
+#
+class PositionalReader:
+	def __init__(self, stream):
+		self.fd = stream.fileno()
+		if hasattr(os, 'pread'):
+			self.mapping = None
+		else:
+			self.mapping = mmap.mmap(self.fd, 0, access = mmap.ACCESS_READ)
+	
+	def read(self, offset, size):
+		if self.mapping is not None:
+			if offset + size > len(self.mapping):
+				raise DecodeError("Unexpected end of file")
+			return self.mapping[offset : offset + size]
+		
+		output = bytes()
+		while len(output) < size:
+			buffer = os.pread(self.fd, size - len(output), offset + len(output))
+			if len(buffer) == 0:
+				raise DecodeError("Unexpected end of file")
+			if len(buffer) == size:
+				return buffer
+			output += buffer
+		return output
+	
+	def close(self):
+		if self.mapping is not None:
+			self.mapping.close()
+			self.mapping = None
+
+#
+# Computes the crc32 of everything written to a stream.
+#
+class CrcStream:
+	def __init__(self, stream):
+		self.stream = stream
+		self.crc = 0
+	
+	def write(self, buffer):
+		written = self.stream.write(buffer)
+		self.crc = zlib.crc32(memoryview(buffer)[0 : written], self.crc)
+		return written
+
+#
+# The table encryption xors the content with a keystream in which every
+# byte is the previous byte multiplied by 0x15. This keystream repeats
+# with a short period, so it can be applied to large blocks at once by
+# xoring them as integers.
+#
+def makeCryptKey():
+	m = 0x5f
+	t = 0x15
+	
+	key = bytearray()
+	while True:
+		key.append(m)
+		m = (m * t) & 0xff
+		if m == 0x5f:
+			break
+	return bytes(key)
+
+cryptKey = makeCryptKey()
+# cryptKeystream is the keystream for a block of cryptBlockSize bytes, as
+# a little-endian integer. Blocks start at multiples of the key period.
+cryptBlockSize = len(cryptKey) * 1024
+cryptKeystream = int.from_bytes(cryptKey * 1024, 'little')
+
 class UtfTable:
 	class UtfDatumType:
 		int8 = 0
@@ -44,6 +123,17 @@ class UtfTable:
 		UtfDatumType.bytestring: 8,
 	}
 	
+	# struct format codes for the row storage of each datum type
+	datumFormats = {
+		UtfDatumType.int8: 'B',
+		UtfDatumType.int16: 'H',
+		UtfDatumType.int32: 'I',
+		UtfDatumType.int64: 'Q',
+		UtfDatumType.float32: 'f',
+		UtfDatumType.string: 'I',
+		UtfDatumType.bytestring: 'II',
+	}
+	
 	class UtfDatumStorage:
 		null = 1
 		constant = 3
@@ -58,16 +148,26 @@ class UtfTable:
 		self.columns = []
 		self.rows = []
 	
+	#
+	# Xors $buffer with the table encryption keystream, one block at a
+	# time, so that no temporaries larger than a block are needed.
+	#
+	@staticmethod
+	def cryptInPlace(buffer):
+		view = memoryview(buffer)
+		for offset in range(0, len(view), cryptBlockSize):
+			block = view[offset : offset + cryptBlockSize]
+			if len(block) == cryptBlockSize:
+				keystream = cryptKeystream
+			else:
+				keystream = cryptKeystream & ((1 << (8 * len(block))) - 1)
+			value = int.from_bytes(block, 'little') ^ keystream
+			block[0 : len(block)] = value.to_bytes(len(block), 'little')
+	
 	@staticmethod
 	def crypt(block):
-		m = 0x5f
-		t = 0x15
-		
-		output = bytearray(len(block))
-		for i in range(len(output)):
-			output[i] = block[i] ^ (m & 0xff)
-			m *= t
-			m &= 0xff
+		output = bytearray(block)
+		UtfTable.cryptInPlace(output)
 		return output
 	
 	def read(self, stream, offset, tableName):
@@ -84,6 +184,15 @@ class UtfTable:
 		else:
 			content = memoryview(UtfTable.crypt(encryptedContent))
 		
+		if len(content) >= 8 and struct.unpack('> I', content[4:8])[0] + 8 != length:
+			raise DecodeError("Unexpected utf table inner length")
+		self.decode(content)
+	
+	#
+	# Decodes an unencrypted utf table, as found inside the outer table
+	# header, or nested in bytestring cells of other tables.
+	#
+	def decode(self, content):
 		headerStream = io.BytesIO(content)
 		header = bytearray(32)
 		if headerStream.readinto(header) != len(header):
@@ -102,7 +211,7 @@ class UtfTable:
 		
 		if str(magic, 'UTF-8') != '@UTF':
 			raise DecodeError("Unexpected utf table magic")
-		if bodyLength + 8 != length:
+		if bodyLength + 8 > len(content):
 			raise DecodeError("Unexpected utf table inner length")
 		
 		body = content[8:]
@@ -206,81 +315,122 @@ class UtfTable:
 			self.rows.append(row)
 	
 	def write(self, stream, tableMagic, tableName):
-		columnStream = io.BytesIO()
-		rowStream = io.BytesIO()
-		stringStream = io.BytesIO()
-		dataStream = io.BytesIO()
+		buffer = self.encode(tableName)
+		header = struct.pack('< 4s I Q', tableMagic.encode('utf-8'), 0, len(buffer))
+		UtfTable.cryptInPlace(buffer)
+		write(stream, header)
+		write(stream, buffer)
+		return len(header) + len(buffer)
+	
+	#
+	# Encodes the table as an unencrypted utf table, without the outer
+	# table header.
+	#
+	def encode(self, tableName):
+		stringBuffer = bytearray()
+		dataBuffer = bytearray()
 		
 		stringIndices = {}
 		def addString(string):
 			if string not in stringIndices:
-				stringIndices[string] = len(stringStream.getbuffer())
-				stringStream.write(string.encode('utf-8') + bytes(1))
+				stringIndices[string] = len(stringBuffer)
+				stringBuffer.extend(string.encode('utf-8'))
+				stringBuffer.append(0)
 			return stringIndices[string]
 		
+		# Identical data blocks are stored only once.
+		dataIndices = {}
 		def addData(data):
-			index = len(dataStream.getbuffer())
-			dataStream.write(data)
-			if len(dataStream.getbuffer()) % 8 > 0:
-				dataStream.write(bytearray(8 - (len(dataStream.getbuffer()) % 8)))
-			return index
+			key = bytes(data)
+			if key not in dataIndices:
+				dataIndices[key] = len(dataBuffer)
+				dataBuffer.extend(data)
+				if len(dataBuffer) % 8 > 0:
+					dataBuffer.extend(bytes(8 - (len(dataBuffer) % 8)))
+			return dataIndices[key]
 		
-		def writeCell(dataType, value):
-			if dataType == UtfTable.UtfDatumType.int8:
-				rowStream.write(struct.pack('> B', value))
-			elif dataType == UtfTable.UtfDatumType.int16:
-				rowStream.write(struct.pack('> H', value))
-			elif dataType == UtfTable.UtfDatumType.int32:
-				rowStream.write(struct.pack('> I', value))
-			elif dataType == UtfTable.UtfDatumType.int64:
-				rowStream.write(struct.pack('> Q', value))
-			elif dataType == UtfTable.UtfDatumType.float32:
-				rowStream.write(struct.pack('> f', value))
-			elif dataType == UtfTable.UtfDatumType.string:
-				rowStream.write(struct.pack('> I', addString(value)))
-			elif dataType == UtfTable.UtfDatumType.bytestring:
-				rowStream.write(struct.pack('> II', addData(value), len(value)))
+		def encodeValue(datumType, value):
+			if datumType == UtfTable.UtfDatumType.string:
+				return (addString(value), )
+			elif datumType == UtfTable.UtfDatumType.bytestring:
+				return (addData(value), len(value))
 			else:
-				print("Unknown data type: %s" % dataType)
+				return (value, )
 		
 		tableNameID = addString(tableName)
 		
-		storageTypes = {}
-		rowLength = 0
+		#
+		# Columns without values are stored as null, and columns with the
+		# same value in every row are stored once as a constant. Tables with
+		# a single row, such as the cpk header, store their values in the row.
+		#
+		columnBuffer = bytearray()
+		rowFormat = '>'
+		variableColumns = []
 		for column in self.columns:
-			if len(self.rows) == 1 and self.rows[0][column.name] is None:
+			if len(self.rows) > 0:
+				firstValue = self.rows[0][column.name]
+				isUniform = all([row[column.name] == firstValue for row in self.rows])
+			else:
+				firstValue = None
+				isUniform = False
+			
+			if isUniform and firstValue is None:
 				storageType = UtfTable.UtfDatumStorage.null
+			elif isUniform and len(self.rows) > 1:
+				storageType = UtfTable.UtfDatumStorage.constant
 			else:
 				storageType = UtfTable.UtfDatumStorage.variable
-				rowLength += UtfTable.datumSizes[column.datumType]
-			storageTypes[column.name] = storageType
+				rowFormat += UtfTable.datumFormats[column.datumType]
+				variableColumns.append((column.name, column.datumType))
 			
 			flags = storageType << 4 | column.datumType
 			nameIndex = addString(column.name)
-			columnStream.write(struct.pack('> B I', flags, nameIndex))
+			columnBuffer += struct.pack('> B I', flags, nameIndex)
+			if storageType == UtfTable.UtfDatumStorage.constant:
+				columnBuffer += struct.pack('>' + UtfTable.datumFormats[column.datumType], *encodeValue(column.datumType, firstValue))
+		rowStruct = struct.Struct(rowFormat)
+		rowLength = rowStruct.size
 		
+		string = UtfTable.UtfDatumType.string
+		bytestring = UtfTable.UtfDatumType.bytestring
+		rowValues = []
 		for row in self.rows:
-			for column in self.columns:
-				if storageTypes[column.name] == UtfTable.UtfDatumStorage.variable:
-					writeCell(column.datumType, row[column.name])
-		
-		columnBuffer = columnStream.getbuffer()
-		rowBuffer = rowStream.getbuffer()
-		stringBuffer = stringStream.getbuffer()
-		dataBuffer = dataStream.getbuffer()
+			values = []
+			for (name, datumType) in variableColumns:
+				value = row[name]
+				if datumType == string:
+					values.append(addString(value))
+				elif datumType == bytestring:
+					values.append(addData(value))
+					values.append(len(value))
+				else:
+					values.append(value)
+			rowValues.append(values)
 		
+		#
+		# The output is built in a single buffer of the final size, with the
+		# 32 byte header followed by the column definitions, the rows, which
+		# are packed in place, the strings, and the 8 byte aligned data.
+		#
 		columnOffset = 32
 		rowOffset = columnOffset + len(columnBuffer)
-		stringOffset = rowOffset + len(rowBuffer)
-		stringPaddingOffset = stringOffset + len(stringBuffer)
-		if stringPaddingOffset % 8 > 0:
-			stringPadding = bytes(8 - (stringPaddingOffset % 8))
-		else:
-			stringPadding = bytes(0)
-		dataOffset = stringPaddingOffset + len(stringPadding)
+		stringOffset = rowOffset + rowLength * len(self.rows)
+		dataOffset = stringOffset + len(stringBuffer)
+		if dataOffset % 8 > 0:
+			dataOffset += 8 - (dataOffset % 8)
 		dataEnd = dataOffset + len(dataBuffer)
 		
-		header = struct.pack('> 4s IIII IHHI',
+		output = bytearray(dataEnd)
+		output[columnOffset : rowOffset] = columnBuffer
+		position = rowOffset
+		for values in rowValues:
+			rowStruct.pack_into(output, position, *values)
+			position += rowLength
+		output[stringOffset : stringOffset + len(stringBuffer)] = stringBuffer
+		output[dataOffset : dataEnd] = dataBuffer
+		
+		struct.pack_into('> 4s IIII IHHI', output, 0,
 			'@UTF'.encode('utf-8'),
 			dataEnd - 8,
 			rowOffset - 8,
@@ -291,31 +441,72 @@ class UtfTable:
 			rowLength,
 			len(self.rows),
 		)
-		
-		plaintextBuffer = header + columnBuffer + rowBuffer + stringBuffer + stringPadding + dataBuffer
-		encryptedBuffer = struct.pack('< 4s I Q', tableMagic.encode('utf-8'), 0, len(plaintextBuffer)) + UtfTable.crypt(plaintextBuffer)
-		write(stream, encryptedBuffer)
-		
-		return len(encryptedBuffer)
+		return output
 
+def decodeModificationTime(encodedModificationTime):
+	return datetime.datetime(
+		encodedModificationTime >> 48 & 0xffff,
+		encodedModificationTime >> 40 & 0xff,
+		encodedModificationTime >> 32 & 0xff,
+		encodedModificationTime >> 24 & 0xff,
+		encodedModificationTime >> 16 & 0xff,
+		encodedModificationTime >>  8 & 0xff,
+	)
+
+#
+# Filenames are looked up case-insensitively, ignoring leading slashes.
+#
+def filenameKey(filename):
+	return filename.replace('\\', '/').strip('/').upper()
 
 class CpkReader:
 	class FileEntry:
-		def __init__(self, name, size, offset, modificationTime, compressedSize):
+		def __init__(self, name, size, offset, modificationTime, compressedSize, id = None, crc = None):
 			self.name = name
 			self.size = size
 			self.offset = offset
 			self.modificationTime = modificationTime
 			self.compressedSize = compressedSize
+			self.id = id
+			# $crc is the crc32 of the stored file content, or None if the
+			# archive has no file crcs.
+			self.crc = crc
 	
 	def __init__(self):
 		self.stream = None
+		# Packed files are read through positionalReader when the archive
+		# is a file on disk, so that a reader can be shared between threads.
+		# Other streams are read under streamLock.
+		self.positionalReader = None
+		self.streamLock = threading.Lock()
 		self.files = []
+		# ids is a dictionary from file $id to FileEntry.
+		self.ids = {}
+		# filenames is a dictionary from filename key to FileEntry, built on
+		# the first lookup.
+		self.filenames = None
+		# tocRange is the ($offset, $size) of the TOC, and tocCrc its crc32,
+		# or None if the archive has no TOC crc.
+		self.tocRange = None
+		self.tocCrc = None
 	
 	def open(self, filename):
+		self.openStream(open(filename, 'rb'))
+	
+	def openStream(self, stream):
 		self.close()
-		self.stream = open(filename, 'rb')
+		self.stream = stream
 		self.files = []
+		self.ids = {}
+		self.filenames = None
+		self.tocRange = None
+		self.tocCrc = None
+		
+		try:
+			stream.fileno()
+			self.positionalReader = PositionalReader(stream)
+		except (AttributeError, io.UnsupportedOperation):
+			self.positionalReader = None
 		
 		headerTable = UtfTable()
 		headerTable.read(self.stream, 0, 'CPK ')
@@ -325,12 +516,6 @@ class CpkReader:
 			raise DecodeError("Missing content offset")
 		contentOffset = headerFields['ContentOffset']
 		
-		if 'TocOffset' not in headerFields:
-			raise DecodeError("Missing table of contents")
-		tocOffset = headerFields['TocOffset']
-		tocTable = UtfTable()
-		tocTable.read(self.stream, tocOffset, 'TOC ')
-		
 		etocTable = None
 		if 'EtocOffset' in headerFields:
 			etocOffset = headerFields['EtocOffset']
@@ -340,6 +525,30 @@ class CpkReader:
 				if 'UpdateDateTime' not in [column.name for column in etocTable.columns]:
 					etocTable = None
 		
+		# The crcs are stored in fields of our own, as CRI's crc scheme is
+		# not documented, and are only trusted in archives written by
+		# CpkWriter.
+		enableCrc = headerFields.get('Tvers') == 'pes-file-tools'
+		
+		if headerFields.get('TocOffset') is not None:
+			self.readToc(headerFields['TocOffset'], etocTable, enableCrc)
+			if headerFields.get('TocSize') is not None:
+				self.tocRange = (headerFields['TocOffset'], headerFields['TocSize'])
+				if enableCrc and headerFields.get('PftTocCrc') is not None:
+					self.tocCrc = headerFields['PftTocCrc']
+		elif headerFields.get('ItocOffset') is not None:
+			self.readItoc(headerFields['ItocOffset'], contentOffset, headerFields.get('Align'), etocTable)
+		else:
+			raise DecodeError("Missing table of contents")
+		
+		for entry in self.files:
+			if entry.id is not None:
+				self.ids[entry.id] = entry
+	
+	def readToc(self, tocOffset, etocTable, enableCrc):
+		tocTable = UtfTable()
+		tocTable.read(self.stream, tocOffset, 'TOC ')
+		
 		tocRows = [column.name for column in tocTable.columns]
 		for row in ['DirName', 'FileName', 'FileSize', 'FileOffset', 'ExtractSize']:
 			if row not in tocRows:
@@ -351,50 +560,226 @@ class CpkReader:
 		for row in tocTable.rows:
 			name = row['DirName'].replace('\\', '/').rstrip('/') + '/' + row['FileName'].replace('\\', '/').lstrip('/')
 			
-			if 'ID' in row and row['ID'] is not None and etocTable is not None and row['ID'] < len(etocTable.rows):
-				encodedModificationTime = etocTable.rows[row['ID']]['UpdateDateTime']
-				modificationTime = datetime.datetime(
-					encodedModificationTime >> 48 & 0xffff,
-					encodedModificationTime >> 40 & 0xff,
-					encodedModificationTime >> 32 & 0xff,
-					encodedModificationTime >> 24 & 0xff,
-					encodedModificationTime >> 16 & 0xff,
-					encodedModificationTime >>  8 & 0xff,
-				)
+			id = row.get('ID')
+			if id is not None and etocTable is not None and id < len(etocTable.rows):
+				modificationTime = decodeModificationTime(etocTable.rows[id]['UpdateDateTime'])
+			else:
+				modificationTime = None
+			
+			crc = row.get('PftFileCrc') if enableCrc else None
+			self.files.append(CpkReader.FileEntry(name, row['ExtractSize'], row['FileOffset'] + effectiveContentOffset, modificationTime, row['FileSize'], id, crc))
+	
+	#
+	# Archives addressed by ID may have an ITOC instead of a TOC. The ITOC
+	# lists file sizes by ID, in two nested tables for files smaller and
+	# larger than 64KiB; files are stored in ID order, each aligned to
+	# $alignment bytes. These files have no names, and are named after
+	# their ID instead.
+	#
+	def readItoc(self, itocOffset, contentOffset, alignment, etocTable):
+		itocTable = UtfTable()
+		itocTable.read(self.stream, itocOffset, 'ITOC')
+		itocFields = itocTable.rows[0]
+		if alignment is None or alignment == 0:
+			alignment = 0x800
+		
+		sizes = {}
+		for key in ['DataL', 'DataH']:
+			if itocFields.get(key) is None or len(itocFields[key]) == 0:
+				continue
+			dataTable = UtfTable()
+			dataTable.decode(itocFields[key])
+			for row in dataTable.rows:
+				extractSize = row.get('ExtractSize')
+				if extractSize is None:
+					extractSize = row['FileSize']
+				sizes[row['ID']] = (row['FileSize'], extractSize)
+		
+		offset = contentOffset
+		for id in sorted(sizes.keys()):
+			(fileSize, extractSize) = sizes[id]
+			if etocTable is not None and id < len(etocTable.rows):
+				modificationTime = decodeModificationTime(etocTable.rows[id]['UpdateDateTime'])
 			else:
 				modificationTime = None
 			
-			self.files.append(CpkReader.FileEntry(name, row['ExtractSize'], row['FileOffset'] + effectiveContentOffset, modificationTime, row['FileSize']))
+			self.files.append(CpkReader.FileEntry("%05d" % id, extractSize, offset, modificationTime, fileSize, id))
+			offset += fileSize
+			if fileSize % alignment > 0:
+				offset += alignment - (fileSize % alignment)
+	
+	def findFile(self, filename):
+		key = filenameKey(filename)
+		# The index is only published once complete, so that concurrent
+		# lookups never see a partial index.
+		if self.filenames is None:
+			filenames = {}
+			for entry in self.files:
+				filenames.setdefault(filenameKey(entry.name), entry)
+			self.filenames = filenames
+		return self.filenames.get(key)
 	
 	def close(self):
+		if self.positionalReader is not None:
+			self.positionalReader.close()
+			self.positionalReader = None
 		if self.stream is not None:
 			self.stream.close()
 			self.stream = None
 	
+	#
+	# Reads $size bytes at $offset without depending on the position of
+	# the stream. Safe to call from several threads at once.
+	#
+	def readAt(self, offset, size):
+		if self.positionalReader is not None:
+			return self.positionalReader.read(offset, size)
+		with self.streamLock:
+			self.stream.seek(offset, 0)
+			return read(self.stream, size)
+	
+	#
+	# Writes the content of $entry to $outputStream. Stored files are
+	# copied in blocks, so that they are never held in memory as a whole.
+	#
+	def readFileTo(self, entry, outputStream):
+		if entry.size != entry.compressedSize:
+			write(outputStream, self.readFile(entry))
+			return
+		
+		offset = entry.offset
+		remainingSize = entry.compressedSize
+		while remainingSize > 0:
+			block = self.readAt(offset, min(remainingSize, blockSize))
+			write(outputStream, block)
+			offset += len(block)
+			remainingSize -= len(block)
+	
 	def readFile(self, entry):
-		self.stream.seek(entry.offset, 0)
-		content = read(self.stream, entry.compressedSize)
+		content = self.readAt(entry.offset, entry.compressedSize)
 		
 		if entry.size != entry.compressedSize and len(content) >= 16 and content[0:8] == b'CRILAYLA':
 			return decompressCrilayla(content)
 		
 		return content
+	
+	def crc(self, offset, size):
+		crc = 0
+		while size > 0:
+			block = self.readAt(offset, min(size, blockSize))
+			crc = zlib.crc32(block, crc)
+			offset += len(block)
+			size -= len(block)
+		return crc
+	
+	#
+	# Checks the stored content of $entry against its crc, without
+	# decompressing it. Returns None if the archive has no file crcs.
+	#
+	def verifyFile(self, entry):
+		if entry.crc is None:
+			return None
+		return self.crc(entry.offset, entry.compressedSize) == entry.crc
+	
+	def verifyToc(self):
+		if self.tocCrc is None:
+			return None
+		return self.crc(self.tocRange[0], self.tocRange[1]) == self.tocCrc
+	
+	def findById(self, id):
+		return self.ids.get(id)
+	
+	def readById(self, id):
+		if id not in self.ids:
+			return None
+		return self.readFile(self.ids[id])
+
+#
+# Reads cpk archives from asyncio code. The archive is opened and
+# decompressed in an executor, and files are read with positional reads,
+# so that any number of reads can run at once without sharing a file
+# position.
+#
+class AsyncCpkReader:
+	def __init__(self, executor = None):
+		self.reader = CpkReader()
+		self.executor = executor
+	
+	@property
+	def files(self):
+		return self.reader.files
+	
+	async def open(self, filename):
+		loop = asyncio.get_running_loop()
+		await loop.run_in_executor(self.executor, self.reader.open, filename)
+	
+	def close(self):
+		self.reader.close()
+	
+	def findFile(self, filename):
+		return self.reader.findFile(filename)
+	
+	def findById(self, id):
+		return self.reader.findById(id)
+	
+	def isStored(self, entry):
+		return entry.size == entry.compressedSize
+	
+	#
+	# Reads bytes $start up to $end of a stored file.
+	#
+	async def readRange(self, entry, start, end):
+		if not self.isStored(entry):
+			raise DecodeError("Cannot read a range of a compressed file")
+		start = max(0, min(start, entry.size))
+		end = max(start, min(end, entry.size))
+		loop = asyncio.get_running_loop()
+		return await loop.run_in_executor(self.executor, self.reader.readAt, entry.offset + start, end - start)
+	
+	async def readFile(self, entry):
+		loop = asyncio.get_running_loop()
+		content = await loop.run_in_executor(self.executor, self.reader.readAt, entry.offset, entry.compressedSize)
+		if not self.isStored(entry) and len(content) >= 16 and content[0:8] == b'CRILAYLA':
+			content = await loop.run_in_executor(self.executor, decompressCrilayla, content)
+		return content
 
 class CpkWriter:
 	class FileEntry:
-		def __init__(self, size, offset, modificationTime):
+		def __init__(self, size, offset, modificationTime, id, crc):
 			self.size = size
 			self.offset = offset
 			self.modificationTime = modificationTime
+			self.id = id
+			self.crc = crc
 	
 	def __init__(self):
 		self.stream = None
 		self.alignment = None
 		self.position = None
 		self.files = {}
+		self.enableToc = True
+		self.enableItoc = False
+		self.enableFileCrc = False
+		self.enableTocCrc = False
 	
-	def open(self, filename, alignment = 0x800):
+	#
+	# If $enableItoc is set, the archive has an ITOC, allowing files to be
+	# found by ID. File IDs are then assigned in the order files are
+	# written; otherwise, in filename order. If $enableToc is not set, the
+	# archive has no TOC, and files can only be found by ID.
+	# If $enableFileCrc and $enableTocCrc are set, the archive stores the
+	# crc32 of every file and of the TOC, computed as they are written. They
+	# are stored in a PftFileCrc TOC column and a PftTocCrc header field,
+	# which CRI tools ignore, rather than in CRI's own crc fields.
+	#
+	def open(self, filename, alignment = 0x800, enableToc = True, enableItoc = False, enableFileCrc = False, enableTocCrc = False):
+		if not enableToc and not enableItoc:
+			raise ValueError("Cpk archive needs a TOC or ITOC")
 		self.alignment = alignment
+		self.enableToc = enableToc
+		self.enableItoc = enableItoc
+		self.enableFileCrc = enableFileCrc
+		self.enableTocCrc = enableTocCrc
 		self.stream = open(filename, 'wb')
 		self.files = {}
 		
@@ -403,19 +788,30 @@ class CpkWriter:
 		write(self.stream, "(c)CRI".encode('utf-8'))
 	
 	def close(self):
+		# Size columns are 64-bit only in archives with files of 4GiB or more.
+		if any([entry.size >= 1 << 32 for entry in self.files.values()]):
+			sizeType = UtfTable.UtfDatumType.int64
+		else:
+			sizeType = UtfTable.UtfDatumType.int32
+		
 		toc = UtfTable()
 		toc.columns.append(UtfTable.Column("DirName", UtfTable.UtfDatumType.string))
 		toc.columns.append(UtfTable.Column("FileName", UtfTable.UtfDatumType.string))
-		toc.columns.append(UtfTable.Column("FileSize", UtfTable.UtfDatumType.int32))
-		toc.columns.append(UtfTable.Column("ExtractSize", UtfTable.UtfDatumType.int32))
+		toc.columns.append(UtfTable.Column("FileSize", sizeType))
+		toc.columns.append(UtfTable.Column("ExtractSize", sizeType))
 		toc.columns.append(UtfTable.Column("FileOffset", UtfTable.UtfDatumType.int64))
 		toc.columns.append(UtfTable.Column("ID", UtfTable.UtfDatumType.int32))
 		toc.columns.append(UtfTable.Column("UserString", UtfTable.UtfDatumType.string))
+		if self.enableFileCrc:
+			toc.columns.append(UtfTable.Column("PftFileCrc", UtfTable.UtfDatumType.int32))
 		
 		etoc = UtfTable()
 		etoc.columns.append(UtfTable.Column("UpdateDateTime", UtfTable.UtfDatumType.int64))
 		etoc.columns.append(UtfTable.Column("LocalDir", UtfTable.UtfDatumType.string))
 		
+		# ETOC rows are indexed by file ID.
+		etocRows = [None] * len(self.files)
+		
 		totalSize = 0
 		for filename in sorted(list(self.files.keys()), key = lambda x: x.upper()):
 			pos = filename.rfind('/')
@@ -426,6 +822,10 @@ class CpkWriter:
 				entryDirName = filename[0:pos]
 				entryFileName = filename[pos + 1:]
 			entry = self.files[filename]
+			if self.enableItoc:
+				id = entry.id
+			else:
+				id = len(toc.rows)
 			
 			toc.rows.append({
 				"DirName": entryDirName,
@@ -433,12 +833,14 @@ class CpkWriter:
 				"FileSize": entry.size,
 				"ExtractSize": entry.size,
 				"FileOffset": entry.offset - 0x800,
-				"ID": len(toc.rows),
+				"ID": id,
 				"UserString": "",
 			})
+			if self.enableFileCrc:
+				toc.rows[-1]["PftFileCrc"] = entry.crc
 			
 			if entry.modificationTime is not None:
-				etoc.rows.append({
+				etocRows[id] = {
 					"UpdateDateTime": (
 						entry.modificationTime.year << 48 |
 						entry.modificationTime.month << 40 |
@@ -449,29 +851,45 @@ class CpkWriter:
 						0 << 0
 					),
 					"LocalDir": entryDirName,
-				})
+				}
 			
 			totalSize += entry.size
 		
-		tocPosition = self.position
-		tocSize = toc.write(self.stream, 'TOC ', 'CpkTocInfo')
-		self.position += tocSize
+		contentEnd = self.position
 		
-		if len(etoc.rows) == len(toc.rows):
-			if tocSize % self.alignment > 0:
-				tocPadding = self.alignment - (tocSize % self.alignment)
-				write(self.stream, bytes(tocPadding))
-				self.position += tocPadding
-			
+		def writeTable(table, tableMagic, tableName, stream):
+			if self.position % self.alignment > 0:
+				padding = self.alignment - (self.position % self.alignment)
+				write(self.stream, bytes(padding))
+				self.position += padding
+			tablePosition = self.position
+			tableSize = table.write(stream, tableMagic, tableName)
+			self.position += tableSize
+			return (tablePosition, tableSize)
+		
+		tocCrc = None
+		if self.enableToc:
+			tocStream = CrcStream(self.stream)
+			(tocPosition, tocSize) = writeTable(toc, 'TOC ', 'CpkTocInfo', tocStream)
+			if self.enableTocCrc:
+				tocCrc = tocStream.crc
+		else:
+			(tocPosition, tocSize) = (None, None)
+		
+		if self.enableToc and None not in etocRows:
+			etoc.rows = etocRows
 			etoc.rows.append({
 				"UpdateDateTime": 0,
 				"LocalDir": "",
 			})
-			etocPosition = self.position
-			etocSize = etoc.write(self.stream, 'ETOC', 'CpkEtocInfo')
+			(etocPosition, etocSize) = writeTable(etoc, 'ETOC', 'CpkEtocInfo', self.stream)
 		else:
-			etocPosition = None
-			etocSize = None
+			(etocPosition, etocSize) = (None, None)
+		
+		if self.enableItoc:
+			(itocPosition, itocSize) = writeTable(self.encodeItoc(), 'ITOC', 'CpkItocInfo', self.stream)
+		else:
+			(itocPosition, itocSize) = (None, None)
 		
 		header = UtfTable()
 		header.rows.append({})
@@ -482,7 +900,7 @@ class CpkWriter:
 		addHeader("UpdateDateTime", 1, UtfTable.UtfDatumType.int64)
 		addHeader("FileSize", None, UtfTable.UtfDatumType.int64)
 		addHeader("ContentOffset", 0x800, UtfTable.UtfDatumType.int64)
-		addHeader("ContentSize", tocPosition - 0x800, UtfTable.UtfDatumType.int64)
+		addHeader("ContentSize", contentEnd - 0x800, UtfTable.UtfDatumType.int64)
 		addHeader("TocOffset", tocPosition, UtfTable.UtfDatumType.int64)
 		addHeader("TocSize", tocSize, UtfTable.UtfDatumType.int64)
 		addHeader("TocCrc", None, UtfTable.UtfDatumType.int32)
@@ -490,8 +908,8 @@ class CpkWriter:
 		addHeader("HtocSize", None, UtfTable.UtfDatumType.int64)
 		addHeader("EtocOffset", etocPosition, UtfTable.UtfDatumType.int64)
 		addHeader("EtocSize", etocSize, UtfTable.UtfDatumType.int64)
-		addHeader("ItocOffset", None, UtfTable.UtfDatumType.int64)
-		addHeader("ItocSize", None, UtfTable.UtfDatumType.int64)
+		addHeader("ItocOffset", itocPosition, UtfTable.UtfDatumType.int64)
+		addHeader("ItocSize", itocSize, UtfTable.UtfDatumType.int64)
 		addHeader("ItocCrc", None, UtfTable.UtfDatumType.int32)
 		addHeader("GtocOffset", None, UtfTable.UtfDatumType.int64)
 		addHeader("GtocSize", None, UtfTable.UtfDatumType.int64)
@@ -512,7 +930,7 @@ class CpkWriter:
 		addHeader("Revision", 14, UtfTable.UtfDatumType.int16)
 		addHeader("Align", self.alignment, UtfTable.UtfDatumType.int16)
 		addHeader("Sorted", 1, UtfTable.UtfDatumType.int16)
-		addHeader("EnableFileName", 1, UtfTable.UtfDatumType.int16)
+		addHeader("EnableFileName", 1 if self.enableToc else 0, UtfTable.UtfDatumType.int16)
 		addHeader("EID", None, UtfTable.UtfDatumType.int16)
 		addHeader("CpkMode", 1, UtfTable.UtfDatumType.int32)
 		addHeader("Tvers", "pes-file-tools", UtfTable.UtfDatumType.string)
@@ -523,21 +941,154 @@ class CpkWriter:
 		addHeader("EnableFileCrc", 0, UtfTable.UtfDatumType.int16)
 		addHeader("CrcMode", 0, UtfTable.UtfDatumType.int32)
 		addHeader("CrcTable", bytes(0), UtfTable.UtfDatumType.bytestring)
+		if tocCrc is not None:
+			addHeader("PftTocCrc", tocCrc, UtfTable.UtfDatumType.int32)
 		
 		self.stream.seek(0)
 		header.write(self.stream, 'CPK ', 'CpkHeader')
 		self.stream.close()
 	
+	def encodeItoc(self):
+		if len(self.files) > 0x10000:
+			raise ValueError("Too many files for an ITOC")
+		if any([entry.size >= 1 << 32 for entry in self.files.values()]):
+			raise ValueError("Files of 4GiB or more cannot be stored in an ITOC")
+		
+		def dataTable(sizeType):
+			table = UtfTable()
+			table.columns.append(UtfTable.Column("ID", UtfTable.UtfDatumType.int16))
+			table.columns.append(UtfTable.Column("FileSize", sizeType))
+			table.columns.append(UtfTable.Column("ExtractSize", sizeType))
+			return table
+		
+		smallFiles = dataTable(UtfTable.UtfDatumType.int16)
+		largeFiles = dataTable(UtfTable.UtfDatumType.int32)
+		for entry in sorted(self.files.values(), key = lambda entry: entry.id):
+			if entry.size < 0x10000:
+				table = smallFiles
+			else:
+				table = largeFiles
+			table.rows.append({
+				"ID": entry.id,
+				"FileSize": entry.size,
+				"ExtractSize": entry.size,
+			})
+		
+		itoc = UtfTable()
+		itoc.rows.append({})
+		def addField(key, value, type):
+			itoc.columns.append(UtfTable.Column(key, type))
+			itoc.rows[0][key] = value
+		
+		addField("FilesL", len(smallFiles.rows), UtfTable.UtfDatumType.int32)
+		addField("FilesH", len(largeFiles.rows), UtfTable.UtfDatumType.int32)
+		addField("DataL", bytes(smallFiles.encode('CpkItocL')) if len(smallFiles.rows) > 0 else None, UtfTable.UtfDatumType.bytestring)
+		addField("DataH", bytes(largeFiles.encode('CpkItocH')) if len(largeFiles.rows) > 0 else None, UtfTable.UtfDatumType.bytestring)
+		return itoc
+	
 	def writeFile(self, filename, content, modificationTime = None):
+		return self.writeFileStream(filename, io.BytesIO(content), modificationTime)
+	
+	#
+	# Packs the content of $inputStream, copying it in blocks, so that
+	# files are never held in memory as a whole.
+	#
+	def writeFileStream(self, filename, inputStream, modificationTime = None):
 		if filename in self.files:
 			return False
 		
-		self.files[filename] = CpkWriter.FileEntry(len(content), self.position, modificationTime)
-		if len(content) % self.alignment > 0:
-			paddingLength = self.alignment - (len(content) % self.alignment)
+		entry = CpkWriter.FileEntry(0, self.position, modificationTime, len(self.files), None)
+		self.files[filename] = entry
+		if self.enableFileCrc:
+			contentStream = CrcStream(self.stream)
+		else:
+			contentStream = self.stream
+		
+		while True:
+			block = inputStream.read(blockSize)
+			if len(block) == 0:
+				break
+			write(contentStream, block)
+			entry.size += len(block)
+		if self.enableFileCrc:
+			entry.crc = contentStream.crc
+		
+		if entry.size % self.alignment > 0:
+			paddingLength = self.alignment - (entry.size % self.alignment)
 		else:
 			paddingLength = 0
-		write(self.stream, content)
 		write(self.stream, bytearray(paddingLength))
-		self.position += len(content) + paddingLength
+		self.position += entry.size + paddingLength
 		return True
+
+#
+# Worker process state for verifyArchive. Each worker opens the archive
+# once, and checks ranges of its files.
+#
+verifyReader = None
+verifyDecode = False
+
+def initializeVerifyWorker(filename, decode):
+	global verifyReader, verifyDecode
+	verifyReader = CpkReader()
+	verifyReader.open(filename)
+	verifyDecode = decode
+
+def verifyTask(task):
+	(start, end) = task
+	results = []
+	for entry in verifyReader.files[start:end]:
+		try:
+			isValid = verifyReader.verifyFile(entry)
+			if isValid is None and verifyDecode and entry.size != entry.compressedSize:
+				content = verifyReader.readAt(entry.offset, entry.compressedSize)
+				if len(content) < 16 or content[0:8] != b'CRILAYLA':
+					isValid = False
+				else:
+					isValid = len(decompressCrilayla(content)) == entry.size
+		except Exception as e:
+			results.append((entry.name, 'error: %s' % e))
+			continue
+		
+		if isValid is None:
+			results.append((entry.name, 'unchecked'))
+		elif isValid:
+			results.append((entry.name, 'ok'))
+		else:
+			results.append((entry.name, 'bad'))
+	return results
+
+#
+# Checks every file in the archive $filename against its stored crc,
+# using $processes worker processes. Files without a crc are left
+# unchecked, unless $decode is set, in which case compressed files are
+# checked by decompressing them. Stored files without a crc cannot be
+# checked, and are always left unchecked.
+# Yields ($name, $result) for every file, where $result is 'ok', 'bad',
+# 'unchecked', or an error message starting with 'error:'.
+#
+def verifyArchive(filename, processes = None, decode = False, batchSize = 256):
+	reader = CpkReader()
+	reader.open(filename)
+	fileCount = len(reader.files)
+	reader.close()
+	tasks = [(i, min(i + batchSize, fileCount)) for i in range(0, fileCount, batchSize)]
+	
+	if processes == 1:
+		initializeVerifyWorker(filename, decode)
+		try:
+			for task in tasks:
+				for result in verifyTask(task):
+					yield result
+		finally:
+			verifyReader.close()
+		return
+	
+	pool = multiprocessing.Pool(processes, initializeVerifyWorker, (filename, decode))
+	try:
+		for results in pool.imap_unordered(verifyTask, tasks):
+			for result in results:
+				yield result
+	finally:
+		pool.terminate()
+		pool.join()
@@ -0,0 +1,160 @@
+import fnmatch
+import multiprocessing
+import os
+import re
+
+from . import archive
+
+class Match:
+	def __init__(self, path, offset, error = None):
+		# $path is a nested archive path, as understood by archive.ArchiveResolver.
+		# $offset is the position of the first content match, or None when
+		# only filenames were searched.
+		# $error is a message if $path could not be read or searched, in
+		# which case the match only reports the error.
+		self.path = path
+		self.offset = offset
+		self.error = error
+
+class Query:
+	def __init__(self, namePattern = None, nameRegex = None, contentPattern = None, ignoreCase = False):
+		# $namePattern is a glob pattern, and $nameRegex a regular expression,
+		# matched against packed filenames without leading slashes.
+		# $contentPattern is a byte string to search for in packed files.
+		flags = re.IGNORECASE if ignoreCase else 0
+		self.namePatterns = []
+		if namePattern is not None:
+			self.namePatterns.append(re.compile(fnmatch.translate(namePattern), flags))
+		if nameRegex is not None:
+			self.namePatterns.append(re.compile(nameRegex, flags))
+		
+		if contentPattern is not None:
+			self.contentPattern = re.compile(re.escape(contentPattern))
+		else:
+			self.contentPattern = None
+	
+	def matchesName(self, filename):
+		normalizedFilename = archive.normalizeFilename(filename)
+		for pattern in self.namePatterns:
+			if pattern.search(normalizedFilename) is None:
+				return False
+		return True
+
+def errorMessage(exception):
+	message = str(exception)
+	if message == '':
+		return exception.__class__.__name__
+	return message
+
+def isNestedArchive(filename):
+	return filename.lower().endswith(('.cpk', '.fpk', '.fpkd'))
+
+#
+# Searches the packed files of an archive, descending into nested
+# archives. Content is only read for packed files whose names match,
+# and for nested archives. Packed files and nested archives that cannot
+# be read are reported as Match objects with an $error, and the search
+# continues.
+#
+def searchArchive(resolver, archivePath, filenames, query):
+	matches = []
+	for filename in filenames:
+		path = archive.joinPath([archivePath, archive.normalizeFilename(filename)])
+		nameMatches = query.matchesName(filename)
+		
+		content = None
+		if nameMatches and query.contentPattern is None:
+			matches.append(Match(path, None))
+		elif nameMatches:
+			try:
+				content = resolver.readFile(path)
+			except Exception as e:
+				matches.append(Match(path, None, errorMessage(e)))
+				continue
+			contentMatch = query.contentPattern.search(content)
+			if contentMatch is not None:
+				matches.append(Match(path, contentMatch.start()))
+		
+		if isNestedArchive(filename):
+			try:
+				nestedFilenames = resolver.openArchive(path, content).filenames()
+			except Exception as e:
+				matches.append(Match(path, None, errorMessage(e)))
+				resolver.closeArchive(path)
+				continue
+			matches += searchArchive(resolver, path, nestedFilenames, query)
+			resolver.closeArchive(path)
+	return matches
+
+#
+# Worker process state. Each worker keeps its own resolver, so that top
+# level archives are opened once per process.
+#
+workerResolver = None
+workerQuery = None
+
+def initializeWorker(query):
+	global workerResolver, workerQuery
+	workerResolver = archive.ArchiveResolver()
+	workerQuery = query
+
+def searchTask(task):
+	(archivePath, filenames) = task
+	return searchArchive(workerResolver, archivePath, filenames, workerQuery)
+
+def listArchives(filenames):
+	archives = []
+	for filename in filenames:
+		if os.path.isdir(filename):
+			for (directory, subdirectories, entries) in os.walk(filename):
+				subdirectories.sort()
+				for entry in sorted(entries):
+					if isNestedArchive(entry):
+						archives.append(os.path.join(directory, entry))
+		else:
+			archives.append(filename)
+	return archives
+
+#
+# Searches archives, and the archives nested in them, for packed files
+# matching $query. $filenames are archives or directories containing
+# archives. Yields Match objects as they are found; the top level
+# archives are split into batches of $batchSize packed files, which are
+# searched by $processes worker processes. Archives that cannot be read
+# are yielded as Match objects with an $error.
+#
+def find(filenames, query, processes = None, batchSize = 64):
+	tasks = []
+	resolver = archive.ArchiveResolver()
+	try:
+		for archivePath in listArchives(filenames):
+			try:
+				topLevelFilenames = resolver.listFiles(archivePath)
+			except Exception as e:
+				yield Match(archivePath, None, errorMessage(e))
+				continue
+			finally:
+				resolver.closeArchive(archivePath)
+			for i in range(0, len(topLevelFilenames), batchSize):
+				tasks.append((archivePath, topLevelFilenames[i : i + batchSize]))
+	finally:
+		resolver.close()
+	
+	if processes == 1:
+		initializeWorker(query)
+		try:
+			for task in tasks:
+				for match in searchTask(task):
+					yield match
+		finally:
+			workerResolver.close()
+		return
+	
+	pool = multiprocessing.Pool(processes, initializeWorker, (query, ))
+	try:
+		for matches in pool.imap_unordered(searchTask, tasks):
+			for match in matches:
+				yield match
+	finally:
+		pool.terminate()
+		pool.join()
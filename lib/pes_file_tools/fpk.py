@@ -1,5 +1,7 @@
 import hashlib
 import io
+import mmap
+import os
 import struct
 
 class DecodeError(Exception):
@@ -7,9 +9,17 @@ class DecodeError(Exception):
 
 class FpkFile:
 	def __init__(self):
+		# entries is a dictionary from $filename (string) to $content (bytes-like).
 		self.entries = {}
+		# checksums is a dictionary from $filename to the md5 digest stored for it.
+		self.checksums = {}
+		self.stream = None
+		self.mapping = None
+		# mappedViews is the list of entry views into $mapping created by
+		# open(), which are released by close().
+		self.mappedViews = []
 	
-	def read(self, byteBuffer):
+	def read(self, byteBuffer, verifyChecksums = True):
 		data = memoryview(byteBuffer)
 		
 		if len(data) < 48:
@@ -37,21 +47,18 @@ class FpkFile:
 		if referenceCount != 0:
 			raise DecodeError("Unsupported FPK")
 		
-		stream = io.BytesIO(data[48:])
+		if len(data) < 48 + 48 * fileCount:
+			raise DecodeError("Incomplete file entry")
+		
 		entries = {}
-		for i in range(fileCount):
-			entryBuffer = bytearray(48)
-			if stream.readinto(entryBuffer) != len(entryBuffer):
-				raise DecodeError("Incomplete file entry")
-			
-			(
-				contentOffset,
-				contentLength,
-				filenameOffset,
-				filenameLength,
-				checksum,
-			) = struct.unpack('< QQQQ 16s', entryBuffer)
-			
+		checksums = {}
+		for (
+			contentOffset,
+			contentLength,
+			filenameOffset,
+			filenameLength,
+			checksum,
+		) in struct.iter_unpack('< QQQQ 16s', data[48 : 48 + 48 * fileCount]):
 			if contentOffset + contentLength > len(data):
 				raise DecodeError("Unexpected end of file")
 			if filenameOffset + filenameLength > len(data):
@@ -63,75 +70,174 @@ class FpkFile:
 			if filename in entries:
 				raise DecodeError("Duplicate entry for filename '%s'" % filename)
 			entries[filename] = content
+			checksums[filename] = checksum
 			
-			digest = hashlib.md5()
-			digest.update(data[filenameOffset : filenameOffset + filenameLength])
-			if digest.digest() != checksum:
-				raise DecodeError("Incorrect checksum")
+			if verifyChecksums:
+				digest = hashlib.md5()
+				digest.update(data[filenameOffset : filenameOffset + filenameLength])
+				if digest.digest() != checksum:
+					raise DecodeError("Incorrect checksum")
 		
 		self.entries = entries
+		self.checksums = checksums
 	
-	def readFile(self, filename):
+	def readFile(self, filename, verifyChecksums = True):
 		stream = open(filename, 'rb')
 		byteBuffer = stream.read()
 		stream.close()
-		self.read(byteBuffer)
+		self.read(byteBuffer, verifyChecksums)
 	
-	def write(self, isFpkd):
-		entries = []
-		filenameBuffer = bytearray()
-		contentBuffer = bytearray()
-		for filename in sorted(self.entries.keys()):
-			relativeFilenameOffset = len(filenameBuffer)
-			encodedFilename = bytes(filename, 'utf-8')
-			filenameBuffer += encodedFilename + b'\0'
-			
-			relativeContentOffset = len(contentBuffer)
-			contentBuffer += self.entries[filename]
-			if len(contentBuffer) % 16 > 0:
-				contentBuffer += bytearray(16 - len(contentBuffer) % 16)
+	#
+	# Reads an fpk file without loading it into memory. Entries are
+	# memoryview slices of a memory mapping of the file, which are only
+	# read from disk when their content is accessed. They remain valid
+	# until close() is called.
+	#
+	def open(self, filename, verifyChecksums = False):
+		self.close()
+		self.stream = open(filename, 'rb')
+		try:
+			self.mapping = mmap.mmap(self.stream.fileno(), 0, access = mmap.ACCESS_READ)
+		except ValueError:
+			# Empty files cannot be mapped
+			self.close()
+			raise DecodeError("Incomplete header")
+		
+		try:
+			self.read(self.mapping, verifyChecksums)
+		except:
+			self.close()
+			raise
+		self.mappedViews = list(self.entries.values())
+	
+	def close(self):
+		for content in self.mappedViews:
+			content.release()
+		self.mappedViews = []
+		self.entries = {}
+		self.checksums = {}
+		
+		if self.mapping is not None:
+			try:
+				self.mapping.close()
+			except BufferError:
+				# Entry content is still referenced elsewhere, and keeps
+				# the mapping alive until it is released.
+				pass
+			self.mapping = None
+		if self.stream is not None:
+			self.stream.close()
+			self.stream = None
+	
+	#
+	# Verifies the filename checksums skipped by read() or open().
+	#
+	def verify(self):
+		for filename in self.checksums:
+			digest = hashlib.md5()
+			digest.update(bytes(filename, 'utf-8'))
+			if digest.digest() != self.checksums[filename]:
+				raise DecodeError("Incorrect checksum for filename '%s'" % filename)
+	
+	#
+	# Writes the fpk file to $stream without assembling it in memory.
+	# Offsets are computed from the entry lengths up front, so the header,
+	# entry table, filenames and content are each written once, in order.
+	#
+	def writeStream(self, stream, isFpkd):
+		filenames = sorted(self.entries.keys())
+		entryBufferOffset = 48
+		filenameBufferOffset = entryBufferOffset + 48 * len(filenames)
+		
+		encodedFilenames = [bytes(filename, 'utf-8') for filename in filenames]
+		filenameBufferLength = sum([len(encodedFilename) + 1 for encodedFilename in encodedFilenames])
+		if filenameBufferLength % 16 > 0:
+			filenameBufferLength += 16 - filenameBufferLength % 16
+		contentBufferOffset = filenameBufferOffset + filenameBufferLength
+		
+		entryBuffer = bytearray(48 * len(filenames))
+		filenameBuffer = bytearray(filenameBufferLength)
+		filenameOffset = 0
+		contentOffset = 0
+		for (i, filename) in enumerate(filenames):
+			encodedFilename = encodedFilenames[i]
+			filenameBuffer[filenameOffset : filenameOffset + len(encodedFilename)] = encodedFilename
 			
 			digest = hashlib.md5()
 			digest.update(encodedFilename)
 			
-			entries.append((
-				relativeContentOffset,
-				len(self.entries[filename]),
-				relativeFilenameOffset,
+			contentLength = len(self.entries[filename])
+			struct.pack_into('< QQQQ 16s', entryBuffer, 48 * i,
+				contentOffset + contentBufferOffset,
+				contentLength,
+				filenameOffset + filenameBufferOffset,
 				len(encodedFilename),
 				digest.digest(),
-			))
-		if len(filenameBuffer) % 16 > 0:
-			filenameBuffer += bytearray(16 - len(filenameBuffer) % 16)
-		
-		entryBuffer = bytearray()
-		entryBufferOffset = 48
-		filenameBufferOffset = entryBufferOffset + 48 * len(entries)
-		contentBufferOffset = filenameBufferOffset + len(filenameBuffer)
-		for (relativeContentOffset, contentLength, relativeFilenameOffset, filenameLength, filenameDigest) in entries:
-			entryBuffer += struct.pack('< QQQQ 16s',
-				relativeContentOffset + contentBufferOffset,
-				contentLength,
-				relativeFilenameOffset + filenameBufferOffset,
-				filenameLength,
-				filenameDigest,
 			)
+			
+			filenameOffset += len(encodedFilename) + 1
+			contentOffset += contentLength
+			if contentOffset % 16 > 0:
+				contentOffset += 16 - contentOffset % 16
 		
 		header = struct.pack('< 6s c 3s I 18x I I I I',
 			b'foxfpk',
 			(b'd' if isFpkd else b'\0'),
 			b'win',
-			len(contentBuffer) + contentBufferOffset,
+			contentOffset + contentBufferOffset,
 			2,
-			len(entries),
+			len(filenames),
 			0,
 			0,
 		)
-		return header + entryBuffer + filenameBuffer + contentBuffer
+		
+		stream.write(header)
+		stream.write(entryBuffer)
+		stream.write(filenameBuffer)
+		for filename in filenames:
+			content = self.entries[filename]
+			if isinstance(content, FileContent):
+				content.writeTo(stream)
+			else:
+				stream.write(content)
+			if len(content) % 16 > 0:
+				stream.write(bytes(16 - len(content) % 16))
+	
+	def write(self, isFpkd):
+		stream = io.BytesIO()
+		self.writeStream(stream, isFpkd)
+		return stream.getvalue()
 	
 	def writeFile(self, filename):
 		isFpkd = filename.lower().endswith('.fpkd')
 		
 		stream = open(filename, 'wb')
-		stream.write(self.write(isFpkd))
+		self.writeStream(stream, isFpkd)
 		stream.close()
+
+#
+# Entry content stored in a file on disk, for packing large fpk files
+# without loading every packed file into memory.
+#
+class FileContent:
+	def __init__(self, filename):
+		self.filename = filename
+		self.size = os.stat(filename).st_size
+	
+	def __len__(self):
+		return self.size
+	
+	def writeTo(self, stream):
+		inputStream = open(self.filename, 'rb')
+		buffer = bytearray(1 << 20)
+		remaining = self.size
+		while remaining > 0:
+			length = inputStream.readinto(buffer)
+			if length == 0:
+				break
+			length = min(length, remaining)
+			stream.write(memoryview(buffer)[0:length])
+			remaining -= length
+		inputStream.close()
+		if remaining > 0:
+			raise DecodeError("File '%s' changed while packing" % self.filename)
@@ -1,54 +1,157 @@
 import io
+import mmap
 import struct
 
 class DecodeError(Exception):
 	pass
 
+cipherValue = 0x9c
+cipherTable = bytes([b ^ cipherValue for b in range(256)])
+
+def crypt(shaderBuffer):
+	if type(shaderBuffer) is not bytes:
+		shaderBuffer = bytes(shaderBuffer)
+	return shaderBuffer.translate(cipherTable)
+
+#
+# A shader stores its vertex and pixel shaders in plaintext, encrypted, or
+# both; each form is computed from the other when it is first needed.
+# Shaders read and written unmodified are thus never decrypted.
+#
 class Shader:
-	def __init__(self, vertexShader, pixelShader):
-		self.vertexShader = vertexShader
-		self.pixelShader = pixelShader
+	def __init__(self, vertexShader = None, pixelShader = None):
+		self.vertexShaderPlaintext = vertexShader
+		self.vertexShaderCiphertext = None
+		self.pixelShaderPlaintext = pixelShader
+		self.pixelShaderCiphertext = None
+	
+	@staticmethod
+	def fromEncrypted(encryptedVertexShader, encryptedPixelShader):
+		shader = Shader()
+		shader.vertexShaderCiphertext = encryptedVertexShader
+		shader.pixelShaderCiphertext = encryptedPixelShader
+		return shader
+	
+	@property
+	def vertexShader(self):
+		if self.vertexShaderPlaintext is None:
+			self.vertexShaderPlaintext = crypt(self.vertexShaderCiphertext)
+		return self.vertexShaderPlaintext
+	
+	@vertexShader.setter
+	def vertexShader(self, value):
+		self.vertexShaderPlaintext = value
+		self.vertexShaderCiphertext = None
+	
+	@property
+	def pixelShader(self):
+		if self.pixelShaderPlaintext is None:
+			self.pixelShaderPlaintext = crypt(self.pixelShaderCiphertext)
+		return self.pixelShaderPlaintext
+	
+	@pixelShader.setter
+	def pixelShader(self, value):
+		self.pixelShaderPlaintext = value
+		self.pixelShaderCiphertext = None
+	
+	@property
+	def encryptedVertexShader(self):
+		if self.vertexShaderCiphertext is None:
+			self.vertexShaderCiphertext = crypt(self.vertexShaderPlaintext)
+		return self.vertexShaderCiphertext
+	
+	@property
+	def encryptedPixelShader(self):
+		if self.pixelShaderCiphertext is None:
+			self.pixelShaderCiphertext = crypt(self.pixelShaderPlaintext)
+		return self.pixelShaderCiphertext
+
+#
+# Finds the shaders in an fsop file without copying them.
+# Returns a dictionary from shader name to ($offset, $vertexShaderLength,
+# $pixelShaderLength), where $offset is the position of the shader entry.
+#
+def buildIndex(byteBuffer):
+	data = memoryview(byteBuffer)
+	index = {}
+	position = 0
+	while position < len(data):
+		offset = position
+		nameLength = data[position]
+		position += 1
+		if position + nameLength > len(data):
+			raise DecodeError("Incomplete filename entry")
+		name = str(data[position : position + nameLength - 1], 'utf-8')
+		position += nameLength
+		
+		if position + 4 > len(data):
+			raise DecodeError("Incomplete vertex shader entry")
+		( vertexShaderLength, ) = struct.unpack('< I', data[position : position + 4])
+		position += 4 + vertexShaderLength
+		if position > len(data):
+			raise DecodeError("Incomplete vertex shader")
+		
+		if position + 4 > len(data):
+			raise DecodeError("Incomplete pixel shader entry")
+		( pixelShaderLength, ) = struct.unpack('< I', data[position : position + 4])
+		position += 4 + pixelShaderLength
+		if position > len(data):
+			raise DecodeError("Incomplete pixel shader")
+		
+		index[name] = (offset, vertexShaderLength, pixelShaderLength)
+	return index
+
+#
+# Returns the positions of the vertex and pixel shaders of the entry at $offset.
+#
+def shaderOffsets(data, offset, vertexShaderLength):
+	vertexShaderOffset = offset + 1 + data[offset] + 4
+	pixelShaderOffset = vertexShaderOffset + vertexShaderLength + 4
+	return (vertexShaderOffset, pixelShaderOffset)
+
+def encodeEntry(name, encryptedVertexShader, encryptedPixelShader):
+	encodedName = bytes(name, 'utf-8')
+	return [
+		struct.pack('< B', len(encodedName) + 1),
+		encodedName,
+		bytes([0]),
+		struct.pack('< I', len(encryptedVertexShader)),
+		encryptedVertexShader,
+		struct.pack('< I', len(encryptedPixelShader)),
+		encryptedPixelShader,
+	]
 
 class FsopFile:
-	cipherValue = 0x9c
+	cipherValue = cipherValue
 	
-	def __init__(self):
+	def __init__(self, keepEncrypted = False):
+		# If $keepEncrypted is set, shaders are read without decrypting them,
+		# and are decrypted when their content is first accessed.
+		self.keepEncrypted = keepEncrypted
 		self.entries = {}
+		
+		# State of an fsop file opened for random access by open().
+		self.stream = None
+		self.mapping = None
+		self.index = {}
 	
 	def crypt(self, shaderBuffer):
-		return bytes([b ^ FsopFile.cipherValue for b in shaderBuffer])
+		return crypt(shaderBuffer)
 	
 	def read(self, stream):
-		while True:
-			nameLengthBuffer = bytearray(1)
-			if stream.readinto(nameLengthBuffer) != len(nameLengthBuffer):
-				break
-			( nameLength, ) = struct.unpack('< B', nameLengthBuffer)
-			nameBuffer = bytearray(nameLength)
-			if stream.readinto(nameBuffer) != len(nameBuffer):
-				raise DecodeError("Incomplete filename entry")
-			name = str(nameBuffer[:-1], 'utf-8')
-			
-			vertexShaderLengthBuffer = bytearray(4)
-			if stream.readinto(vertexShaderLengthBuffer) != len(vertexShaderLengthBuffer):
-				raise DecodeError("Incomplete vertex shader entry")
-			( vertexShaderLength, ) = struct.unpack('< I', vertexShaderLengthBuffer)
-			vertexShaderBuffer = bytearray(vertexShaderLength)
-			if stream.readinto(vertexShaderBuffer) != len(vertexShaderBuffer):
-				raise DecodeError("Incomplete vertex shader")
-			
-			pixelShaderLengthBuffer = bytearray(4)
-			if stream.readinto(pixelShaderLengthBuffer) != len(pixelShaderLengthBuffer):
-				raise DecodeError("Incomplete pixel shader entry")
-			( pixelShaderLength, ) = struct.unpack('< I', pixelShaderLengthBuffer)
-			pixelShaderBuffer = bytearray(pixelShaderLength)
-			if stream.readinto(pixelShaderBuffer) != len(pixelShaderBuffer):
-				raise DecodeError("Incomplete pixel shader")
-			
-			self.entries[name] = Shader(self.crypt(vertexShaderBuffer), self.crypt(pixelShaderBuffer))
+		self.readBuffer(stream.read())
 	
 	def readBuffer(self, byteBuffer):
-		self.read(io.BytesIO(byteBuffer))
+		data = memoryview(byteBuffer)
+		for (name, (offset, vertexShaderLength, pixelShaderLength)) in buildIndex(data).items():
+			(vertexShaderOffset, pixelShaderOffset) = shaderOffsets(data, offset, vertexShaderLength)
+			vertexShaderBuffer = data[vertexShaderOffset : vertexShaderOffset + vertexShaderLength]
+			pixelShaderBuffer = data[pixelShaderOffset : pixelShaderOffset + pixelShaderLength]
+			
+			if self.keepEncrypted:
+				self.entries[name] = Shader.fromEncrypted(bytes(vertexShaderBuffer), bytes(pixelShaderBuffer))
+			else:
+				self.entries[name] = Shader(crypt(vertexShaderBuffer), crypt(pixelShaderBuffer))
 	
 	def readFile(self, filename):
 		stream = open(filename, 'rb')
@@ -57,20 +160,8 @@ class FsopFile:
 	
 	def write(self, stream):
 		for name in sorted(self.entries.keys()):
-			encodedName = bytes(name, 'utf-8')
-			vertexShaderBuffer = self.crypt(self.entries[name].vertexShader)
-			pixelShaderBuffer = self.crypt(self.entries[name].pixelShader)
-			
-			block = (
-				  struct.pack('< B', len(encodedName) + 1)
-				+ encodedName
-				+ bytes([0])
-				+ struct.pack('< I', len(vertexShaderBuffer))
-				+ vertexShaderBuffer
-				+ struct.pack('< I', len(pixelShaderBuffer))
-				+ pixelShaderBuffer
-			)
-			stream.write(block)
+			for block in encodeEntry(name, self.entries[name].encryptedVertexShader, self.entries[name].encryptedPixelShader):
+				stream.write(block)
 	
 	def writeBuffer(self):
 		stream = io.BytesIO()
@@ -83,3 +174,95 @@ class FsopFile:
 		stream = open(filename, 'wb')
 		self.write(stream)
 		stream.close()
+	
+	#
+	# Opens an fsop file for random access. Only an index of the shaders is
+	# built, and shaders are read by get() when requested. If $writable is
+	# set, shaders can be replaced with replace().
+	#
+	def open(self, filename, writable = False):
+		self.close()
+		self.stream = open(filename, 'r+b' if writable else 'rb')
+		try:
+			self.mapFile()
+			self.index = buildIndex(self.mapping)
+		except:
+			self.close()
+			raise
+	
+	def mapFile(self):
+		if isinstance(self.mapping, mmap.mmap):
+			self.mapping.close()
+		try:
+			self.mapping = mmap.mmap(self.stream.fileno(), 0, access = mmap.ACCESS_READ)
+		except ValueError:
+			# Empty files cannot be mapped
+			self.mapping = bytes()
+	
+	def close(self):
+		if isinstance(self.mapping, mmap.mmap):
+			self.mapping.close()
+		self.mapping = None
+		if self.stream is not None:
+			self.stream.close()
+			self.stream = None
+		self.index = {}
+	
+	def get(self, name):
+		if name not in self.index:
+			return None
+		(offset, vertexShaderLength, pixelShaderLength) = self.index[name]
+		(vertexShaderOffset, pixelShaderOffset) = shaderOffsets(self.mapping, offset, vertexShaderLength)
+		return Shader.fromEncrypted(
+			self.mapping[vertexShaderOffset : vertexShaderOffset + vertexShaderLength],
+			self.mapping[pixelShaderOffset : pixelShaderOffset + pixelShaderLength],
+		)
+	
+	#
+	# Replaces or adds a shader in a file opened with open().
+	# A shader replaced by one of the same size is overwritten in place, and
+	# new shaders are appended; in both cases only the new shader is
+	# written. Otherwise, the entries after the replaced one are moved.
+	#
+	def replace(self, name, shader):
+		encryptedVertexShader = shader.encryptedVertexShader
+		encryptedPixelShader = shader.encryptedPixelShader
+		
+		if name not in self.index:
+			offset = len(self.mapping)
+			self.stream.seek(offset, 0)
+			for block in encodeEntry(name, encryptedVertexShader, encryptedPixelShader):
+				self.stream.write(block)
+			self.stream.flush()
+			self.mapFile()
+			self.index[name] = (offset, len(encryptedVertexShader), len(encryptedPixelShader))
+			return
+		
+		(offset, vertexShaderLength, pixelShaderLength) = self.index[name]
+		(vertexShaderOffset, pixelShaderOffset) = shaderOffsets(self.mapping, offset, vertexShaderLength)
+		if vertexShaderLength == len(encryptedVertexShader) and pixelShaderLength == len(encryptedPixelShader):
+			self.stream.seek(vertexShaderOffset, 0)
+			self.stream.write(encryptedVertexShader)
+			self.stream.seek(pixelShaderOffset, 0)
+			self.stream.write(encryptedPixelShader)
+			self.stream.flush()
+			self.mapFile()
+			return
+		
+		entryEnd = pixelShaderOffset + pixelShaderLength
+		remainder = self.mapping[entryEnd:]
+		entry = encodeEntry(name, encryptedVertexShader, encryptedPixelShader)
+		self.stream.seek(offset, 0)
+		for block in entry:
+			self.stream.write(block)
+		self.stream.write(remainder)
+		self.stream.truncate()
+		self.stream.flush()
+		self.mapFile()
+		
+		shift = sum([len(block) for block in entry]) - (entryEnd - offset)
+		for otherName in self.index:
+			(otherOffset, otherVertexShaderLength, otherPixelShaderLength) = self.index[otherName]
+			if otherOffset > offset:
+				self.index[otherName] = (otherOffset + shift, otherVertexShaderLength, otherPixelShaderLength)
+		self.index[name] = (offset, len(encryptedVertexShader), len(encryptedPixelShader))
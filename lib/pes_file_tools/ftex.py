@@ -1,4 +1,5 @@
 import io
+import mmap
 import struct
 import zlib
 from .zlib import tryDecompress
@@ -60,91 +61,256 @@ def ddsMipmapSize(ftexFormat, width, height, depth, mipmapIndex):
 	heightBlocks = (mipmapHeight + blockSizePixels - 1) // blockSizePixels
 	return widthBlocks * heightBlocks * mipmapDepth * blockSizeBytes
 
-def ftexToDdsBuffer(ftexBuffer):
-	def readImageBuffer(stream, imageOffset, chunkCount, uncompressedSize, compressedSize):
-		stream.seek(imageOffset, 0)
+def readImageBuffer(buffer, imageOffset, chunkCount, uncompressedSize, compressedSize):
+	if chunkCount == 0:
+		if compressedSize == 0:
+			if imageOffset + uncompressedSize > len(buffer):
+				raise DecodeError("Unexpected end of stream")
+			return buffer[imageOffset : imageOffset + uncompressedSize]
+		else:
+			if imageOffset + compressedSize > len(buffer):
+				raise DecodeError("Unexpected end of stream")
+			return zlib.decompress(buffer[imageOffset : imageOffset + compressedSize])
+	
+	if imageOffset + chunkCount * 8 > len(buffer):
+		raise DecodeError("Incomplete chunk header")
+	
+	imageBuffers = []
+	for (compressedSize, uncompressedSize, offset) in struct.iter_unpack('< HH I', buffer[imageOffset : imageOffset + chunkCount * 8]):
+		isCompressed = (compressedSize != uncompressedSize)
+		offset &= ~(1 << 31)
 		
-		if chunkCount == 0:
-			if compressedSize == 0:
-				uncompressedBuffer = bytearray(uncompressedSize)
-				if stream.readinto(uncompressedBuffer) != len(uncompressedBuffer):
-					raise DecodeError("Unexpected end of stream")
-				return uncompressedBuffer
-			else:
-				compressedBuffer = bytearray(compressedSize)
-				if stream.readinto(compressedBuffer) != len(compressedBuffer):
-					raise DecodeError("Unexpected end of stream")
-				return zlib.decompress(compressedBuffer)
+		if imageOffset + offset + compressedSize > len(buffer):
+			raise DecodeError("Unexpected end of stream")
+		compressedBuffer = buffer[imageOffset + offset : imageOffset + offset + compressedSize]
+		if isCompressed:
+			try:
+				decompressedBuffer = zlib.decompress(compressedBuffer)
+			except:
+				raise DecodeError("Decompression error")
+		else:
+			decompressedBuffer = compressedBuffer
+		imageBuffers.append(decompressedBuffer)
+	return b''.join(imageBuffers)
+
+class FtexHeader:
+	class Frame:
+		def __init__(self, offset, uncompressedSize, compressedSize, ftexsNumber, chunkCount):
+			self.offset = offset
+			self.uncompressedSize = uncompressedSize
+			self.compressedSize = compressedSize
+			self.ftexsNumber = ftexsNumber
+			self.chunkCount = chunkCount
+	
+	def __init__(self):
+		self.pixelFormat = None
+		self.width = None
+		self.height = None
+		self.depth = None
+		self.mipmapCount = None
+		self.textureType = None
+		self.ftexsCount = None
+		self.imageCount = None
 		
-		chunks = []
-		for i in range(chunkCount):
-			header = bytearray(8)
-			if stream.readinto(header) != len(header):
-				raise DecodeError("Incomplete chunk header")
-			(
-				compressedSize,
-				uncompressedSize,
-				offset,
-			) = struct.unpack('< HH I', header)
-			isCompressed = (compressedSize != uncompressedSize)
-			offset &= ~(1 << 31)
-			
-			chunks.append((offset, compressedSize, isCompressed))
+		#
+		# A frame is a byte array containing a single mipmap element of a single image.
+		# Cube maps have six images with mipmaps, and so 6 * $mipmapCount frames.
+		# Other textures just have $mipmapCount frames.
+		#
+		# frames is a list of $imageCount lists of $mipmapCount frame entries.
+		#
+		self.frames = []
+	
+	def isCubeMap(self):
+		return (self.textureType & 4) != 0
+	
+	def frameSize(self, mipmapIndex):
+		return ddsMipmapSize(self.pixelFormat, self.width, self.height, self.depth, mipmapIndex)
+	
+	def read(self, ftexBuffer):
+		data = memoryview(ftexBuffer)
 		
-		imageBuffers = []
-		for (offset, compressedSize, isCompressed) in chunks:
-			stream.seek(imageOffset + offset, 0)
-			compressedBuffer = bytearray(compressedSize)
-			if stream.readinto(compressedBuffer) != len(compressedBuffer):
-				raise DecodeError("Unexpected end of stream")
-			if isCompressed:
+		if len(data) < 64:
+			raise DecodeError("Incomplete ftex header")
+		
+		(
+			ftexMagic,
+			ftexVersion,
+			ftexPixelFormat,
+			ftexWidth,
+			ftexHeight,
+			ftexDepth,
+			ftexMipmapCount,
+			ftexNrt,
+			ftexFlags,
+			ftexUnknown1,
+			ftexUnknown2,
+			ftexTextureType,
+			ftexFtexsCount,
+			ftexUnknown3,
+			ftexHash1,
+			ftexHash2,
+		) = struct.unpack('< 4s f HHHH  BB HIII  BB 14x  8s 8s', data[0:64])
+		
+		if ftexMagic != b'FTEX':
+			raise DecodeError("Incorrect ftex signature")
+		
+		if ftexVersion < 2.025:
+			raise DecodeError("Unsupported ftex version")
+		if ftexVersion > 2.045:
+			raise DecodeError("Unsupported ftex version")
+		if ftexMipmapCount == 0:
+			raise DecodeError("Unsupported ftex variant")
+		if ftexPixelFormat not in formatBlockConfiguration:
+			raise DecodeError("Unsupported ftex codec")
+		
+		if (ftexTextureType & 4) != 0:
+			# Cube map, with six faces
+			if ftexDepth > 1:
+				raise DecodeError("Unsupported ftex variant")
+			imageCount = 6
+		else:
+			imageCount = 1
+		
+		if len(data) < 64 + imageCount * ftexMipmapCount * 16:
+			raise DecodeError("Incomplete mipmap header")
+		
+		frames = []
+		mipmapHeaders = struct.iter_unpack('< I I I BB H', data[64 : 64 + imageCount * ftexMipmapCount * 16])
+		for i in range(imageCount):
+			imageFrames = []
+			for j in range(ftexMipmapCount):
+				(
+					offset,
+					uncompressedSize,
+					compressedSize,
+					index,
+					ftexsNumber,
+					chunkCount,
+				) = next(mipmapHeaders)
+				if index != j:
+					raise DecodeError("Unexpected mipmap")
+				imageFrames.append(FtexHeader.Frame(offset, uncompressedSize, compressedSize, ftexsNumber, chunkCount))
+			frames.append(imageFrames)
+		
+		self.pixelFormat = ftexPixelFormat
+		self.width = ftexWidth
+		self.height = ftexHeight
+		self.depth = max(ftexDepth, 1)
+		self.mipmapCount = ftexMipmapCount
+		self.textureType = ftexTextureType
+		self.ftexsCount = ftexFtexsCount
+		self.imageCount = imageCount
+		self.frames = frames
+
+def ftexsFilename(ftexFilename, ftexsNumber):
+	if ftexFilename.lower().endswith('.ftex'):
+		basename = ftexFilename[:-5]
+	else:
+		basename = ftexFilename
+	return '%s.%s.ftexs' % (basename, ftexsNumber)
+
+#
+# The ftexs files accompanying an ftex file, which store its larger mipmaps.
+# Each ftexs file is memory-mapped the first time a frame stored in it is read.
+#
+class FtexsFiles:
+	def __init__(self, ftexFilename):
+		self.ftexFilename = ftexFilename
+		self.files = {}
+	
+	def buffer(self, ftexsNumber):
+		if ftexsNumber not in self.files:
+			filename = ftexsFilename(self.ftexFilename, ftexsNumber)
+			try:
+				stream = open(filename, 'rb')
+			except OSError:
+				raise DecodeError("Missing ftexs file '%s'" % filename)
+			try:
+				content = mmap.mmap(stream.fileno(), 0, access = mmap.ACCESS_READ)
+			except ValueError:
+				# Empty files cannot be mapped
+				content = bytes()
+			self.files[ftexsNumber] = (stream, content)
+		return memoryview(self.files[ftexsNumber][1])
+	
+	def close(self):
+		for (stream, content) in self.files.values():
+			if isinstance(content, mmap.mmap):
 				try:
-					decompressedBuffer = zlib.decompress(compressedBuffer)
-				except:
-					raise DecodeError("Decompression error")
+					content.close()
+				except BufferError:
+					# Frames read from the file are still in use, and
+					# keep the mapping alive until they are released.
+					pass
+			stream.close()
+		self.files = {}
+
+#
+# Decodes the requested frames of an ftex image, without decompressing any
+# of the others.
+#
+# $levels and $faces are lists of mipmap indices and cube map faces
+# respectively, or None to select all of them.
+# Frames stored in ftexs files are read through $ftexsFiles, an FtexsFiles
+# object; only the ftexs files holding requested frames are opened.
+# Returns a dictionary from ($face, $mipmapIndex) to frame content.
+#
+def readMipLevels(ftexBuffer, levels = None, faces = None, header = None, ftexsFiles = None):
+	if header is None:
+		header = FtexHeader()
+		header.read(ftexBuffer)
+	data = memoryview(ftexBuffer)
+	
+	if levels is None:
+		levels = range(header.mipmapCount)
+	if faces is None:
+		faces = range(header.imageCount)
+	
+	frames = {}
+	for face in faces:
+		if not (0 <= face < header.imageCount):
+			raise DecodeError("Unknown image %s" % face)
+		for mipmapIndex in levels:
+			if not (0 <= mipmapIndex < header.mipmapCount):
+				raise DecodeError("Unknown mipmap %s" % mipmapIndex)
+			
+			entry = header.frames[face][mipmapIndex]
+			if entry.ftexsNumber == 0:
+				frameData = data
+			elif ftexsFiles is None:
+				raise DecodeError("Missing ftexs file %s" % entry.ftexsNumber)
 			else:
-				decompressedBuffer = compressedBuffer
-			imageBuffers.append(decompressedBuffer)
-		return b''.join(imageBuffers)
-	
-	
-	
-	inputStream = io.BytesIO(ftexBuffer)
-	
-	header = bytearray(64)
-	if inputStream.readinto(header) != len(header):
-		raise DecodeError("Incomplete ftex header")
-	
-	(
-		ftexMagic,
-		ftexVersion,
-		ftexPixelFormat,
-		ftexWidth,
-		ftexHeight,
-		ftexDepth,
-		ftexMipmapCount,
-		ftexNrt,
-		ftexFlags,
-		ftexUnknown1,
-		ftexUnknown2,
-		ftexTextureType,
-		ftexFtexsCount,
-		ftexUnknown3,
-		ftexHash1,
-		ftexHash2,
-	) = struct.unpack('< 4s f HHHH  BB HIII  BB 14x  8s 8s', header)
-	
-	if ftexMagic != b'FTEX':
-		raise DecodeError("Incorrect ftex signature")
+				frameData = ftexsFiles.buffer(entry.ftexsNumber)
+			frame = readImageBuffer(frameData, entry.offset, entry.chunkCount, entry.uncompressedSize, entry.compressedSize)
+			expectedSize = header.frameSize(mipmapIndex)
+			if len(frame) < expectedSize:
+				frame = bytes(frame) + bytes(expectedSize - len(frame))
+			elif len(frame) > expectedSize:
+				frame = frame[0:expectedSize]
+			frames[(face, mipmapIndex)] = frame
+	return frames
+
+#
+# Converts an ftex image to dds.
+# If $maxSize is set, mipmaps wider or higher than $maxSize pixels are
+# left out of the dds image, and are not decoded.
+#
+def ftexToDdsBuffer(ftexBuffer, maxSize = None, ftexsFiles = None):
+	header = FtexHeader()
+	header.read(ftexBuffer)
+	
+	firstMipmap = 0
+	if maxSize is not None:
+		while (
+			    firstMipmap < header.mipmapCount - 1
+			and max(header.width >> firstMipmap, header.height >> firstMipmap) > maxSize
+		):
+			firstMipmap += 1
 	
-	if ftexVersion < 2.025:
-		raise DecodeError("Unsupported ftex version")
-	if ftexVersion > 2.045:
-		raise DecodeError("Unsupported ftex version")
-	if ftexFtexsCount > 0:
-		raise DecodeError("Unsupported ftex variant")
-	if ftexMipmapCount == 0:
-		raise DecodeError("Unsupported ftex variant")
+	ddsWidth = max(header.width >> firstMipmap, 1)
+	ddsHeight = max(header.height >> firstMipmap, 1)
+	ftexPixelFormat = header.pixelFormat
 	
 	
 	
@@ -157,21 +323,17 @@ def ftexToDdsBuffer(ftexBuffer):
 	ddsCapabilities1 = 0x1000 # texture
 	ddsCapabilities2 = 0
 	
-	if (ftexTextureType & 4) != 0:
+	if header.isCubeMap():
 		# Cube map, with six faces
-		if ftexDepth > 1:
-			raise DecodeError("Unsupported ftex variant")
-		imageCount = 6
 		ddsDepth = 1
 		ddsCapabilities1 |= 0x8    # complex
 		ddsCapabilities2 |= 0xfe00 # cube map with six faces
 		
 		ddsExtensionDimension = 3 # 2D
 		ddsExtensionFlags = 0x4 # cube map
-	elif ftexDepth > 1:
+	elif header.depth > 1:
 		# Volume texture
-		imageCount = 1
-		ddsDepth = ftexDepth
+		ddsDepth = max(header.depth >> firstMipmap, 1)
 		ddsFlags |= 0x800000      # depth
 		ddsCapabilities2 |= 0x200000 # volume texture
 		
@@ -179,59 +341,30 @@ def ftexToDdsBuffer(ftexBuffer):
 		ddsExtensionFlags = 0
 	else:
 		# Regular 2D texture
-		imageCount = 1
 		ddsDepth = 1
 		
 		ddsExtensionDimension = 3 # 2D
 		ddsExtensionFlags = 0
 	
-	ddsMipmapCount = ftexMipmapCount
-	mipmapCount = ftexMipmapCount
+	ddsMipmapCount = header.mipmapCount - firstMipmap
 	ddsFlags |= 0x20000          # mipmapCount
 	ddsCapabilities1 |= 0x8      # complex
 	ddsCapabilities1 |= 0x400000 # mipmap
 	
 	
 	
-	#
-	# A frame is a byte array containing a single mipmap element of a single image.
-	# Cube maps have six images with mipmaps, and so 6 * $mipmapCount frames.
-	# Other textures just have $mipmapCount frames.
-	#
-	frameSpecifications = []
-	for i in range(imageCount):
-		for j in range(mipmapCount):
-			mipmapHeader = bytearray(16)
-			if inputStream.readinto(mipmapHeader) != len(mipmapHeader):
-				raise DecodeError("Incomplete mipmap header")
-			(
-				offset,
-				uncompressedSize,
-				compressedSize,
-				index,
-				ftexsNumber,
-				chunkCount,
-			) = struct.unpack('< I I I BB H', mipmapHeader)
-			if index != j:
-				raise DecodeError("Unexpected mipmap")
-			
-			expectedFrameSize = ddsMipmapSize(ftexPixelFormat, ftexWidth, ftexHeight, ddsDepth, j)
-			frameSpecifications.append((offset, chunkCount, uncompressedSize, compressedSize, expectedFrameSize))
-	
+	levels = range(firstMipmap, header.mipmapCount)
+	decodedFrames = readMipLevels(ftexBuffer, levels = levels, header = header, ftexsFiles = ftexsFiles)
 	frames = []
-	for (offset, chunkCount, uncompressedSize, compressedSize, expectedSize) in frameSpecifications:
-		frame = readImageBuffer(inputStream, offset, chunkCount, uncompressedSize, compressedSize)
-		if len(frame) < expectedSize:
-			frame += bytes(expectedSize - len(frame))
-		elif len(frame) > expectedSize:
-			frame = frame[0:expectedSize]
-		frames.append(frame)
+	for face in range(header.imageCount):
+		for mipmapIndex in levels:
+			frames.append(decodedFrames[(face, mipmapIndex)])
 	
 	
 	
 	ddsPitch = None
 	if ftexPixelFormat == 0:
-		ddsPitchOrLinearSize = 4 * ftexWidth
+		ddsPitchOrLinearSize = 4 * ddsWidth
 		ddsFlags |= 0x8 # pitch
 		useExtensionHeader = False
 		
@@ -297,8 +430,8 @@ def ftexToDdsBuffer(ftexBuffer):
 		
 		124, # header size
 		ddsFlags,
-		ftexHeight,
-		ftexWidth,
+		ddsHeight,
+		ddsWidth,
 		ddsPitchOrLinearSize,
 		ddsDepth,
 		ddsMipmapCount,
@@ -330,12 +463,16 @@ def ftexToDdsBuffer(ftexBuffer):
 	
 	return outputStream.getbuffer()
 
-def ftexToDds(ftexFilename, ddsFilename):
+def ftexToDds(ftexFilename, ddsFilename, maxSize = None):
 	inputStream = open(ftexFilename, 'rb')
 	inputBuffer = inputStream.read()
 	inputStream.close()
 	
-	outputBuffer = ftexToDdsBuffer(inputBuffer)
+	ftexsFiles = FtexsFiles(ftexFilename)
+	try:
+		outputBuffer = ftexToDdsBuffer(inputBuffer, maxSize, ftexsFiles)
+	finally:
+		ftexsFiles.close()
 	
 	outputStream = open(ddsFilename, 'wb')
 	outputStream.write(outputBuffer)
@@ -343,37 +480,55 @@ def ftexToDds(ftexFilename, ddsFilename):
 
 
 
-def ddsToFtexBuffer(ddsBuffer, colorSpace):
-	def encodeImage(data):
+#
+# Writes the ftex image to a seekable stream as it is encoded. Chunks are
+# written as soon as they are compressed, and the chunk and mipmap tables
+# are filled in afterwards, so that the output is never held in memory
+# in addition to the stream.
+#
+# The $ftexsLevels largest mipmaps are stored in separate ftexs files
+# rather than in the ftex itself, one file per mipmap; $ftexsStreams is
+# called with the ftexs number to obtain a seekable stream for each of them.
+#
+def ddsToFtexStream(ddsBuffer, colorSpace, stream, ftexsLevels = 0, ftexsStreams = None):
+	def writeImage(stream, data):
 		chunkSize = 1 << 14 # Value known not to crash PES
 		chunkCount = (len(data) + chunkSize - 1) // chunkSize
 		
-		headerBuffer = bytearray()
-		chunkBuffer = bytearray()
-		chunkBufferOffset = chunkCount * 8
+		chunkTable = bytearray(chunkCount * 8)
+		chunkTablePosition = stream.tell()
+		stream.write(chunkTable)
+		offset = chunkCount * 8
 		
 		for i in range(chunkCount):
 			chunk = data[chunkSize * i : chunkSize * (i + 1)]
 			compressedChunk = zlib.compress(chunk, level = 9)
-			offset = len(chunkBuffer)
-			chunkBuffer += compressedChunk
-			headerBuffer += struct.pack('< HHI',
+			struct.pack_into('< HHI', chunkTable, i * 8,
 				len(compressedChunk),
 				len(chunk),
-				offset + chunkBufferOffset,
+				offset,
 			)
+			stream.write(compressedChunk)
+			offset += len(compressedChunk)
 		
-		output = headerBuffer + chunkBuffer
-		if len(output) % 8 > 0:
-			output += bytearray(8 - len(output) % 8)
+		if offset % 8 > 0:
+			paddingLength = 8 - offset % 8
+		else:
+			paddingLength = 0
+		stream.write(bytes(paddingLength))
+		
+		stream.seek(chunkTablePosition, 0)
+		stream.write(chunkTable)
+		stream.seek(chunkTablePosition + offset + paddingLength, 0)
 		
-		return (output, chunkCount)
+		return (offset + paddingLength, chunkCount)
 	
-	inputStream = io.BytesIO(ddsBuffer)
+	inputBuffer = memoryview(ddsBuffer)
 	
-	header = bytearray(128)
-	if inputStream.readinto(header) != len(header):
+	if len(inputBuffer) < 128:
 		raise DecodeError("Incomplete dds header")
+	header = inputBuffer[0:128]
+	inputPosition = 128
 	
 	(
 		ddsMagic,
@@ -456,9 +611,10 @@ def ddsToFtexBuffer(ddsBuffer, colorSpace):
 		else:
 			raise DecodeError("Unsupported dds codec")
 	elif ddsFourCC == b'DX10':
-		extensionHeader = bytearray(20)
-		if inputStream.readinto(extensionHeader) != len(extensionHeader):
+		if len(inputBuffer) < inputPosition + 20:
 			raise DecodeError("Incomplete dds extension header")
+		extensionHeader = inputBuffer[inputPosition : inputPosition + 20]
+		inputPosition += 20
 		
 		(
 			ddsExtensionFormat,
@@ -483,7 +639,7 @@ def ddsToFtexBuffer(ddsBuffer, colorSpace):
 			ftexPixelFormat = 11
 		elif ddsExtensionFormat == 10: # DXGI_FORMAT_R16G16B16A16_FLOAT
 			ftexPixelFormat = 12
-		elif ddsExtensionFormat == 1:  # DXGI_FORMAT_R32G32B32A32_FLOAT
+		elif ddsExtensionFormat in [1, 2]: # DXGI_FORMAT_R32G32B32A32_TYPELESS, DXGI_FORMAT_R32G32B32A32_FLOAT
 			ftexPixelFormat = 13
 		elif ddsExtensionFormat == 24: # DXGI_FORMAT_R10G10B10A2_UNORM
 			ftexPixelFormat = 14
@@ -509,32 +665,9 @@ def ddsToFtexBuffer(ddsBuffer, colorSpace):
 	
 	
 	
-	frameBuffer = bytearray()
-	mipmapEntries = []
-	for _ in range(cubeEntries):
-		for mipmapIndex in range(mipmapCount):
-			length = ddsMipmapSize(ftexPixelFormat, ddsWidth, ddsHeight, depth, mipmapIndex)
-			frame = inputStream.read(length)
-			if len(frame) != length:
-				raise DecodeError("Unexpected end of dds stream")
-			
-			frameOffset = len(frameBuffer)
-			(compressedFrame, chunkCount) = encodeImage(frame)
-			frameBuffer += compressedFrame
-			mipmapEntries.append((frameOffset, len(frame), len(compressedFrame), mipmapIndex, chunkCount))
-	
-	mipmapBuffer = bytearray()
-	mipmapBufferOffset = 64
-	frameBufferOffset = mipmapBufferOffset + len(mipmapEntries) * 16
-	for (relativeFrameOffset, uncompressedSize, compressedSize, mipmapIndex, chunkCount) in mipmapEntries:
-		mipmapBuffer += struct.pack('< III BB H',
-			relativeFrameOffset + frameBufferOffset,
-			uncompressedSize,
-			compressedSize,
-			mipmapIndex,
-			0, # ftexs number
-			chunkCount
-		)
+	ftexsCount = max(min(ftexsLevels, mipmapCount - 1), 0)
+	if ftexsCount > 0 and ftexsStreams is None:
+		raise DecodeError("No output for ftexs files")
 	
 	header = struct.pack('< 4s f HHHH  BB HIII  BB 14x  16x',
 		b'FTEX',
@@ -549,21 +682,97 @@ def ddsToFtexBuffer(ddsBuffer, colorSpace):
 		1, # unknown
 		0, # unknown
 		ftexTextureType,
-		0, # ftexs count
-		0, # unknown
+		ftexsCount,
+		max(ftexsCount - 1, 0), # additional ftexs count
 		# 14 bytes padding
 		# 16 bytes hashes
 	)
 	
-	return header + mipmapBuffer + frameBuffer
+	mipmapBuffer = bytearray(cubeEntries * mipmapCount * 16)
+	startPosition = stream.tell()
+	stream.write(header)
+	stream.write(mipmapBuffer)
+	
+	frameOffset = len(header) + len(mipmapBuffer)
+	ftexsStartPositions = {}
+	frameIndex = 0
+	for _ in range(cubeEntries):
+		for mipmapIndex in range(mipmapCount):
+			length = ddsMipmapSize(ftexPixelFormat, ddsWidth, ddsHeight, depth, mipmapIndex)
+			frame = inputBuffer[inputPosition : inputPosition + length]
+			if len(frame) != length:
+				raise DecodeError("Unexpected end of dds stream")
+			inputPosition += length
+			
+			if mipmapIndex < ftexsCount:
+				ftexsNumber = ftexsCount - mipmapIndex
+				ftexsStream = ftexsStreams(ftexsNumber)
+				if ftexsNumber not in ftexsStartPositions:
+					ftexsStartPositions[ftexsNumber] = ftexsStream.tell()
+				offset = ftexsStream.tell() - ftexsStartPositions[ftexsNumber]
+				(compressedSize, chunkCount) = writeImage(ftexsStream, frame)
+			else:
+				ftexsNumber = 0
+				offset = frameOffset
+				(compressedSize, chunkCount) = writeImage(stream, frame)
+				frameOffset += compressedSize
+			
+			struct.pack_into('< III BB H', mipmapBuffer, frameIndex * 16,
+				offset,
+				len(frame),
+				compressedSize,
+				mipmapIndex,
+				ftexsNumber,
+				chunkCount,
+			)
+			frameIndex += 1
+	
+	stream.seek(startPosition + len(header), 0)
+	stream.write(mipmapBuffer)
+	stream.seek(startPosition + frameOffset, 0)
+	
+	return frameOffset
+
+def ddsToFtexBuffer(ddsBuffer, colorSpace):
+	outputStream = io.BytesIO()
+	ddsToFtexStream(ddsBuffer, colorSpace, outputStream)
+	return outputStream.getvalue()
+
+#
+# Converts a dds image to an ftex image with its $ftexsLevels largest
+# mipmaps in separate ftexs files.
+# Returns the ftex content, and a dictionary from ftexs number to ftexs content.
+#
+def ddsToFtexBuffers(ddsBuffer, colorSpace, ftexsLevels):
+	ftexsOutputStreams = {}
+	def ftexsStreams(ftexsNumber):
+		if ftexsNumber not in ftexsOutputStreams:
+			ftexsOutputStreams[ftexsNumber] = io.BytesIO()
+		return ftexsOutputStreams[ftexsNumber]
+	
+	outputStream = io.BytesIO()
+	ddsToFtexStream(ddsBuffer, colorSpace, outputStream, ftexsLevels, ftexsStreams)
+	
+	ftexsBuffers = {}
+	for ftexsNumber in ftexsOutputStreams:
+		ftexsBuffers[ftexsNumber] = ftexsOutputStreams[ftexsNumber].getvalue()
+	return (outputStream.getvalue(), ftexsBuffers)
 
-def ddsToFtex(ddsFilename, ftexFilename, colorSpace):
+def ddsToFtex(ddsFilename, ftexFilename, colorSpace, ftexsLevels = 0):
 	inputStream = open(ddsFilename, 'rb')
 	inputBuffer = inputStream.read()
 	inputStream.close()
 	
-	outputBuffer = ddsToFtexBuffer(tryDecompress(inputBuffer), colorSpace)
+	ftexsOutputStreams = {}
+	def ftexsStreams(ftexsNumber):
+		if ftexsNumber not in ftexsOutputStreams:
+			ftexsOutputStreams[ftexsNumber] = open(ftexsFilename(ftexFilename, ftexsNumber), 'wb')
+		return ftexsOutputStreams[ftexsNumber]
 	
 	outputStream = open(ftexFilename, 'wb')
-	outputStream.write(outputBuffer)
-	outputStream.close()
+	try:
+		ddsToFtexStream(tryDecompress(inputBuffer), colorSpace, outputStream, ftexsLevels, ftexsStreams)
+	finally:
+		outputStream.close()
+		for ftexsStream in ftexsOutputStreams.values():
+			ftexsStream.close()
@@ -0,0 +1,214 @@
+import contextlib
+import json
+import mmap
+import threading
+import time
+
+from . import cpk, crilayla, fpk, fsop, ftex, uniparam, zlib
+
+#
+# Opt-in instrumentation of the codecs in this package. While enabled,
+# the functions in $instrumentedFunctions are replaced by wrappers that
+# count calls, wall time, and bytes in and out for every function. When
+# disabled, the original functions are put back, so that instrumentation
+# costs nothing unless it is used.
+#
+# Times are inclusive: a phase that calls another phase includes the time
+# spent in it. Only calls in the current process are counted; work done in
+# worker processes, such as by cpk.verifyArchive or uniparam.applyManifest
+# with more than one process, is not.
+#
+
+#
+# Each entry is ($owner, $attribute, $inputArgument, $output), where
+# $inputArgument is the position of the argument whose length counts as
+# bytes in, or None. $output is 'buffer' if the length of the return value
+# counts as bytes out, 'count' if the return value is a number of bytes
+# written, or None.
+# Functions imported by name into other modules are listed once for every
+# module that calls them.
+#
+instrumentedFunctions = [
+	(cpk, 'read', None, 'buffer'),
+	(cpk, 'write', 1, None),
+	(cpk, 'decompressCrilayla', 0, 'buffer'),
+	(cpk.UtfTable, 'cryptInPlace', 0, None),
+	(cpk.UtfTable, 'decode', 1, None),
+	(cpk.UtfTable, 'encode', None, 'buffer'),
+	(cpk.CpkReader, 'openStream', None, None),
+	(cpk.CpkReader, 'readAt', None, 'buffer'),
+	(cpk.CpkReader, 'readFile', None, 'buffer'),
+	(cpk.CpkReader, 'readFileTo', None, None),
+	(cpk.CpkReader, 'crc', None, None),
+	(cpk.CpkWriter, 'writeFileStream', None, None),
+	(cpk.CpkWriter, 'close', None, None),
+	(crilayla, 'decompressCrilayla', 0, 'buffer'),
+	(ftex, 'readImageBuffer', None, 'buffer'),
+	(ftex, 'tryDecompress', 0, 'buffer'),
+	(ftex, 'ftexToDdsBuffer', 0, 'buffer'),
+	(ftex, 'ddsToFtexStream', 0, None),
+	(fpk.FpkFile, 'read', 1, None),
+	(fpk.FpkFile, 'verify', None, None),
+	(fpk.FpkFile, 'writeStream', None, None),
+	(fsop, 'crypt', 0, 'buffer'),
+	(fsop.FsopFile, 'readBuffer', 1, None),
+	(fsop.FsopFile, 'write', None, None),
+	(uniparam, 'decodeEntryTable', 0, None),
+	(uniparam, 'applyChanges', None, None),
+	(uniparam.UniformParameterFile, 'read', 1, None),
+	(uniparam.UniformParameterFile, 'write', None, 'buffer'),
+	(uniparam.UniformParameterEditor, 'read', 1, None),
+	(uniparam.UniformParameterEditor, 'write', None, 'buffer'),
+	(zlib, 'compress', 0, 'buffer'),
+	(zlib, 'tryCompress', 0, 'buffer'),
+	(zlib, 'decompress', 0, 'buffer'),
+	(zlib, 'tryDecompress', 0, 'buffer'),
+	(zlib, 'compressBlock', 0, None),
+	(zlib, 'compressStream', None, 'count'),
+	(zlib, 'decompressStream', None, 'count'),
+]
+
+class Counter:
+	def __init__(self):
+		self.calls = 0
+		self.time = 0.0
+		self.bytesIn = 0
+		self.bytesOut = 0
+
+# counters is a dictionary from phase name to Counter.
+counters = {}
+countersLock = threading.Lock()
+# patches is a list of ($owner, $attribute, $original) for every function
+# replaced while enabled.
+patches = []
+patchesLock = threading.Lock()
+
+def byteCount(value):
+	if isinstance(value, memoryview):
+		return value.nbytes
+	if isinstance(value, (bytes, bytearray, mmap.mmap)):
+		return len(value)
+	return 0
+
+def phaseName(function):
+	moduleName = function.__module__.rsplit('.', 1)[-1]
+	return "%s.%s" % (moduleName, function.__qualname__)
+
+def record(name, elapsedTime, bytesIn, bytesOut):
+	with countersLock:
+		if name not in counters:
+			counters[name] = Counter()
+		counter = counters[name]
+		counter.calls += 1
+		counter.time += elapsedTime
+		counter.bytesIn += bytesIn
+		counter.bytesOut += bytesOut
+
+def instrument(function, inputArgument, output):
+	name = phaseName(function)
+	def wrapper(*args, **kwargs):
+		if inputArgument is not None and inputArgument < len(args):
+			bytesIn = byteCount(args[inputArgument])
+		else:
+			bytesIn = 0
+		result = None
+		startTime = time.perf_counter()
+		try:
+			result = function(*args, **kwargs)
+			return result
+		finally:
+			elapsedTime = time.perf_counter() - startTime
+			if output == 'buffer':
+				bytesOut = byteCount(result)
+			elif output == 'count' and isinstance(result, int):
+				bytesOut = result
+			else:
+				bytesOut = 0
+			record(name, elapsedTime, bytesIn, bytesOut)
+	wrapper.__name__ = function.__name__
+	wrapper.__qualname__ = function.__qualname__
+	wrapper.__doc__ = function.__doc__
+	wrapper.__wrapped__ = function
+	return wrapper
+
+def isEnabled():
+	return len(patches) > 0
+
+def enable():
+	with patchesLock:
+		if len(patches) > 0:
+			return
+		for (owner, attribute, inputArgument, output) in instrumentedFunctions:
+			original = owner.__dict__[attribute]
+			if isinstance(original, staticmethod):
+				replacement = staticmethod(instrument(original.__func__, inputArgument, output))
+			else:
+				replacement = instrument(original, inputArgument, output)
+			patches.append((owner, attribute, original))
+			setattr(owner, attribute, replacement)
+
+def disable():
+	with patchesLock:
+		for (owner, attribute, original) in reversed(patches):
+			setattr(owner, attribute, original)
+		del patches[:]
+
+def reset():
+	with countersLock:
+		counters.clear()
+
+#
+# Returns the counters collected so far, as a dictionary from phase name
+# to a dictionary of calls, time, bytesIn and bytesOut.
+#
+def snapshot():
+	with countersLock:
+		phases = {}
+		for name in sorted(counters.keys()):
+			counter = counters[name]
+			phases[name] = {
+				'calls': counter.calls,
+				'time': counter.time,
+				'bytesIn': counter.bytesIn,
+				'bytesOut': counter.bytesOut,
+			}
+		return phases
+
+def dump(output, wallTime = None):
+	document = {
+		'wallTime': wallTime,
+		'phases': snapshot(),
+	}
+	if isinstance(output, str):
+		stream = open(output, 'w', encoding = 'utf-8')
+		json.dump(document, stream, indent = 2)
+		stream.write("\n")
+		stream.close()
+	else:
+		json.dump(document, output, indent = 2)
+		output.write("\n")
+		output.flush()
+
+#
+# Collects counters for the duration of a with block, and writes them as
+# JSON to $output, a filename or a text stream, when the block ends:
+#   with stats.collect('stats.json'):
+#     ...
+# If $output is None, nothing is collected, so that tools can pass their
+# --stats option through unchanged.
+#
+@contextlib.contextmanager
+def collect(output):
+	if output is None:
+		yield
+		return
+	
+	reset()
+	enable()
+	startTime = time.perf_counter()
+	try:
+		yield
+	finally:
+		wallTime = time.perf_counter() - startTime
+		disable()
+		dump(output, wallTime)
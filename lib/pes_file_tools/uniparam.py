@@ -1,48 +1,61 @@
-import io
+import multiprocessing
 import struct
+import time
 
 from . import zlib
 
 class DecodeError(Exception):
 	pass
 
+#
+# Decodes the entry table of a decompressed UniformParameter file.
+# Returns a list of ($filename, $contentOffset, $contentLength, $filenameOffset).
+#
+def decodeEntryTable(byteBuffer):
+	if isinstance(byteBuffer, memoryview):
+		byteBuffer = byteBuffer.tobytes()
+	if len(byteBuffer) < 8:
+		raise DecodeError("Incomplete header")
+	(entryCount, entryOffset) = struct.unpack_from('< II', byteBuffer, 0)
+	
+	entryBufferEnd = entryOffset + 12 * entryCount
+	if entryBufferEnd > len(byteBuffer):
+		raise DecodeError("Incomplete entry")
+	entryBuffer = memoryview(byteBuffer)[entryOffset : entryBufferEnd]
+	
+	entries = []
+	for (contentOffset, contentLength, filenameOffset) in struct.iter_unpack('< III', entryBuffer):
+		try:
+			filenameEnd = byteBuffer.index(b'\0', filenameOffset)
+		except ValueError:
+			raise DecodeError("Unexpected end of file reading entry filename")
+		filename = str(byteBuffer[filenameOffset : filenameEnd], 'utf-8')
+		
+		if not (0 <= contentOffset <= len(byteBuffer) and contentOffset + contentLength <= len(byteBuffer)):
+			raise DecodeError("Incomplete data for entry '%s'" % filename)
+		
+		entries.append((filename, contentOffset, contentLength, filenameOffset))
+	entryBuffer.release()
+	return entries
+
 class UniformParameterFile:
 	def __init__(self):
-		# entries is a dictionary from $filename (string) to $content (bytes).
+		# entries is a dictionary from $filename (string) to $content (bytes-like).
 		# $filename is the kit config filename;
 		# $content is the content of the kit config file.
 		self.entries = {}
 	
 	def read(self, byteBuffer):
 		byteBuffer = zlib.tryDecompress(byteBuffer)
+		if isinstance(byteBuffer, memoryview):
+			byteBuffer = byteBuffer.tobytes()
 		data = memoryview(byteBuffer)
 		
-		if len(data) < 8:
-			raise DecodeError("Incomplete header")
-		(entryCount, entryOffset) = struct.unpack('< II', data[0:8])
-		
-		entryStream = io.BytesIO(data[entryOffset:])
 		entries = {}
-		for i in range(entryCount):
-			entryBuffer = bytearray(12)
-			if entryStream.readinto(entryBuffer) != len(entryBuffer):
-				raise DecodeError("Incomplete entry")
-			(contentOffset, contentLength, filenameOffset) = struct.unpack('< III', entryBuffer)
-			
-			filenameStream = io.BytesIO(data[filenameOffset:])
-			filenameBytes = b''
-			while True:
-				filenameByte = bytearray(1)
-				if filenameStream.readinto(filenameByte) != len(filenameByte):
-					raise DecodeError("Unexpected end of file reading entry filename")
-				if filenameByte[0] == 0:
-					break
-				filenameBytes += filenameByte
-			filename = str(filenameBytes, 'utf-8')
-			
-			if not (0 <= contentOffset <= len(data)) and (contentOffset + contentLength <= len(data)):
-				raise DecodeError("Incomplete data for entry '%s'" % filename)
-			content = bytes(data[contentOffset : contentOffset + contentLength])
+		for (filename, contentOffset, contentLength, filenameOffset) in decodeEntryTable(byteBuffer):
+			# Content is kept as a view into $byteBuffer; callers that need
+			# a copy can call bytes() on it.
+			content = data[contentOffset : contentOffset + contentLength]
 			
 			if filename in entries:
 				raise DecodeError("Duplicate entry for filename '%s'" % filename)
@@ -89,3 +102,238 @@ class UniformParameterFile:
 		stream = open(filename, 'wb')
 		stream.write(self.write())
 		stream.close()
+
+#
+# Edits a UniformParameter file while keeping its existing layout.
+#
+# Replacement content is written over the old content when it fits in the
+# 16-byte aligned space the old content occupied, and appended to the file
+# otherwise. Only the entry table and filenames are then rewritten, in
+# their old location if they fit. Content that is no longer referenced
+# is left in place until it makes up half of the file, at which point the
+# file is rewritten from scratch.
+#
+class UniformParameterEditor:
+	def __init__(self):
+		self.buffer = bytearray(8)
+		# slots is a dictionary from $filename to ($contentOffset, $contentLength, $capacity).
+		self.slots = {}
+		self.tableOffset = 8
+		self.tableCapacity = 0
+	
+	def read(self, byteBuffer):
+		self.buffer = bytearray(zlib.tryDecompress(byteBuffer))
+		entries = decodeEntryTable(self.buffer)
+		
+		(entryCount, entryOffset) = struct.unpack('< II', self.buffer[0:8])
+		tableEnd = entryOffset + 12 * entryCount
+		for (filename, contentOffset, contentLength, filenameOffset) in entries:
+			tableEnd = max(tableEnd, self.buffer.index(b'\0', filenameOffset) + 1)
+		self.tableOffset = entryOffset
+		self.tableCapacity = tableEnd - entryOffset
+		
+		#
+		# The space available to each entry extends to the next 16-byte boundary,
+		# unless another entry or the entry table starts before that.
+		#
+		boundaries = sorted(set([contentOffset for (filename, contentOffset, contentLength, filenameOffset) in entries] + [entryOffset, len(self.buffer)]))
+		slots = {}
+		for (filename, contentOffset, contentLength, filenameOffset) in entries:
+			if filename in slots:
+				raise DecodeError("Duplicate entry for filename '%s'" % filename)
+			capacity = alignedLength(contentLength)
+			for boundary in boundaries:
+				if boundary > contentOffset:
+					capacity = min(capacity, boundary - contentOffset)
+					break
+			slots[filename] = (contentOffset, contentLength, max(capacity, contentLength))
+		
+		sharedOffsets = set()
+		seenOffsets = set()
+		for (contentOffset, contentLength, capacity) in slots.values():
+			if contentOffset in seenOffsets:
+				sharedOffsets.add(contentOffset)
+			seenOffsets.add(contentOffset)
+		for filename in slots:
+			(contentOffset, contentLength, capacity) = slots[filename]
+			if contentOffset in sharedOffsets:
+				# Content shared between entries cannot be overwritten.
+				slots[filename] = (contentOffset, contentLength, 0)
+		
+		self.slots = slots
+	
+	def readFile(self, filename):
+		stream = open(filename, 'rb')
+		byteBuffer = stream.read()
+		stream.close()
+		self.read(byteBuffer)
+	
+	def filenames(self):
+		return list(self.slots.keys())
+	
+	def get(self, filename):
+		if filename not in self.slots:
+			return None
+		(contentOffset, contentLength, capacity) = self.slots[filename]
+		return memoryview(self.buffer)[contentOffset : contentOffset + contentLength]
+	
+	def set(self, filename, content):
+		if filename in self.slots and len(content) <= self.slots[filename][2]:
+			(contentOffset, contentLength, capacity) = self.slots[filename]
+			self.buffer[contentOffset : contentOffset + len(content)] = content
+			self.buffer[contentOffset + len(content) : contentOffset + capacity] = bytes(capacity - len(content))
+			self.slots[filename] = (contentOffset, len(content), capacity)
+		else:
+			if len(self.buffer) % 16 > 0:
+				self.buffer += bytes(16 - len(self.buffer) % 16)
+			contentOffset = len(self.buffer)
+			self.buffer += content
+			self.slots[filename] = (contentOffset, len(content), len(content))
+	
+	def delete(self, filename):
+		if filename in self.slots:
+			del self.slots[filename]
+	
+	def usedLength(self):
+		return 8 + sum([12 + len(bytes(filename, 'utf-8')) + 1 + alignedLength(contentLength) for (filename, (contentOffset, contentLength, capacity)) in self.slots.items()])
+	
+	def write(self, compress = False, policy = 'default'):
+		if 2 * self.usedLength() < len(self.buffer):
+			uniparamFile = UniformParameterFile()
+			for filename in self.slots:
+				uniparamFile.entries[filename] = self.get(filename)
+			output = uniparamFile.write()
+			# Continue editing the compacted file, so that later writes can
+			# update it in place again.
+			self.read(output)
+		else:
+			self.writeEntryTable()
+			output = self.buffer
+		
+		if compress:
+			return zlib.tryCompress(output, policy = policy)
+		return output
+	
+	def writeEntryTable(self):
+		filenames = sorted(self.slots.keys())
+		entryBuffer = bytearray(12 * len(filenames))
+		filenameBuffer = bytearray()
+		
+		tableLength = len(entryBuffer) + sum([len(bytes(filename, 'utf-8')) + 1 for filename in filenames])
+		if tableLength <= self.tableCapacity:
+			tableOffset = self.tableOffset
+		else:
+			if len(self.buffer) % 16 > 0:
+				self.buffer += bytes(16 - len(self.buffer) % 16)
+			tableOffset = len(self.buffer)
+			self.buffer += bytes(tableLength)
+			self.tableOffset = tableOffset
+			self.tableCapacity = tableLength
+		
+		filenameBufferOffset = tableOffset + len(entryBuffer)
+		for (i, filename) in enumerate(filenames):
+			(contentOffset, contentLength, capacity) = self.slots[filename]
+			struct.pack_into('< III', entryBuffer, 12 * i,
+				contentOffset,
+				contentLength,
+				filenameBufferOffset + len(filenameBuffer),
+			)
+			filenameBuffer += bytes(filename, 'utf-8')
+			filenameBuffer += b'\0'
+		
+		self.buffer[tableOffset : tableOffset + self.tableCapacity] = entryBuffer + filenameBuffer + bytes(self.tableCapacity - tableLength)
+		struct.pack_into('< II', self.buffer, 0, len(filenames), tableOffset)
+	
+	def writeFile(self, filename, compress = False, policy = 'default'):
+		output = self.write(compress, policy)
+		stream = open(filename, 'wb')
+		stream.write(output)
+		stream.close()
+
+def alignedLength(length):
+	if length % 16 > 0:
+		return length + 16 - length % 16
+	return length
+
+class UniformParameterChanges:
+	def __init__(self, outputFilename = None, addedFiles = None, deletedFiles = None, compress = False, policy = 'default'):
+		# $outputFilename is where the edited file is written, or None to
+		# replace the input file.
+		# addedFiles is a dictionary from packed $filename to the filename
+		# of the file to add or replace it with.
+		# deletedFiles is a list of packed filenames to delete.
+		# $policy is the zlib compression policy used if $compress is set.
+		self.outputFilename = outputFilename
+		self.addedFiles = addedFiles if addedFiles is not None else {}
+		self.deletedFiles = deletedFiles if deletedFiles is not None else []
+		self.compress = compress
+		self.policy = policy
+
+class BatchResult:
+	def __init__(self, filename, outputFilename):
+		self.filename = filename
+		self.outputFilename = outputFilename
+		# Timings are in seconds.
+		self.readTime = 0.0
+		self.editTime = 0.0
+		self.writeTime = 0.0
+		# $error is an error message, or None if the file was edited successfully.
+		self.error = None
+	
+	def totalTime(self):
+		return self.readTime + self.editTime + self.writeTime
+
+#
+# Applies $changes to the UniformParameter file $filename, reading,
+# decompressing and compressing it only once.
+#
+def applyChanges(filename, changes):
+	outputFilename = changes.outputFilename if changes.outputFilename is not None else filename
+	result = BatchResult(filename, outputFilename)
+	try:
+		startTime = time.perf_counter()
+		editor = UniformParameterEditor()
+		editor.readFile(filename)
+		result.readTime = time.perf_counter() - startTime
+		
+		startTime = time.perf_counter()
+		for packedFilename in changes.deletedFiles:
+			editor.delete(packedFilename)
+		for (packedFilename, sourceFilename) in changes.addedFiles.items():
+			stream = open(sourceFilename, 'rb')
+			content = stream.read()
+			stream.close()
+			editor.set(packedFilename, content)
+		result.editTime = time.perf_counter() - startTime
+		
+		startTime = time.perf_counter()
+		editor.writeFile(outputFilename, changes.compress, changes.policy)
+		result.writeTime = time.perf_counter() - startTime
+	except Exception as e:
+		result.error = str(e)
+	return result
+
+def applyChangesTask(task):
+	(filename, changes) = task
+	return applyChanges(filename, changes)
+
+#
+# Applies a manifest of changes to many UniformParameter files.
+# $manifest is a dictionary from UniformParameter filename to
+# UniformParameterChanges. Files are edited by $processes worker
+# processes; yields a BatchResult for every file as it is finished.
+#
+def applyManifest(manifest, processes = None):
+	tasks = list(manifest.items())
+	if processes == 1:
+		for task in tasks:
+			yield applyChangesTask(task)
+		return
+	
+	pool = multiprocessing.Pool(processes)
+	try:
+		for result in pool.imap_unordered(applyChangesTask, tasks):
+			yield result
+	finally:
+		pool.terminate()
+		pool.join()
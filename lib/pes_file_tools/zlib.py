@@ -1,17 +1,31 @@
+import collections
+import concurrent.futures
+import itertools
 import struct
+import tempfile
 import zlib
 
 class DecodeError(Exception):
 	pass
 
+blockSize = 1 << 20
+parallelBlockSize = 1 << 17
+# Sizes in the WESYS header are 32-bit.
+maxSize = 1 << 32
+
 def encodeHeader(compressedBuffer, uncompressedBuffer):
+	return encodeHeaderSizes(len(compressedBuffer), len(uncompressedBuffer))
+
+def encodeHeaderSizes(compressedSize, uncompressedSize):
+	if uncompressedSize >= maxSize or compressedSize >= maxSize:
+		raise ValueError("Input of %d bytes is too large for WESYS compression" % uncompressedSize)
 	return struct.pack('< 3B 5s II',
 		0x00,
 		0x10,
 		0x01,
 		'WESYS'.encode('UTF-8'),
-		len(compressedBuffer),
-		len(uncompressedBuffer),
+		compressedSize,
+		uncompressedSize,
 	)
 
 def decodeHeader(byteBuffer):
@@ -23,12 +37,155 @@ def decodeHeader(byteBuffer):
 		return None
 	return memoryview(byteBuffer)[16:]
 
-def compress(byteBuffer):
-	compressedBuffer = zlib.compress(byteBuffer)
+#
+# Compression policies choose a compression level for an input:
+#   fast     the fastest level, for development builds
+#   default  zlib's default level
+#   max      the smallest output, for release builds
+#   auto     a level chosen by compressing samples of the input
+#
+policyLevels = {
+	'fast': 1,
+	'default': zlib.Z_DEFAULT_COMPRESSION,
+	'max': 9,
+}
+policies = list(policyLevels.keys()) + ['auto']
+
+autoSampleSize = 1 << 16
+autoSampleCount = 4
+
+def sampleBuffer(byteBuffer):
+	if len(byteBuffer) <= autoSampleSize * autoSampleCount:
+		return byteBuffer
+	view = memoryview(byteBuffer)
+	stride = (len(byteBuffer) - autoSampleSize) // (autoSampleCount - 1)
+	return b''.join([view[i * stride : i * stride + autoSampleSize] for i in range(autoSampleCount)])
+
+#
+# Data that barely compresses at the fastest level is compressed at that
+# level, as higher levels will not do much better. Otherwise, the maximum
+# level is used when it saves at least 2% over the default level.
+#
+def chooseLevel(byteBuffer, policy):
+	if policy in policyLevels:
+		return policyLevels[policy]
+	if policy != 'auto':
+		raise ValueError("Unknown compression policy '%s'" % policy)
+	
+	sample = sampleBuffer(byteBuffer)
+	if len(sample) == 0:
+		return zlib.Z_DEFAULT_COMPRESSION
+	if len(zlib.compress(sample, 1)) > 0.9 * len(sample):
+		return 1
+	defaultSize = len(zlib.compress(sample, zlib.Z_DEFAULT_COMPRESSION))
+	maxCompressedSize = len(zlib.compress(sample, 9))
+	if maxCompressedSize < 0.98 * defaultSize:
+		return 9
+	return zlib.Z_DEFAULT_COMPRESSION
+
+def encodeZlibHeader(level):
+	if level == zlib.Z_DEFAULT_COMPRESSION:
+		level = 6
+	if level < 2:
+		levelFlags = 0
+	elif level < 6:
+		levelFlags = 1
+	elif level == 6:
+		levelFlags = 2
+	else:
+		levelFlags = 3
+	compressionMethod = 0x78
+	flags = levelFlags << 6
+	flags += (31 - ((compressionMethod << 8) + flags) % 31) % 31
+	return struct.pack('< BB', compressionMethod, flags)
+
+#
+# Parallel compression, in the style of pigz.
+#
+# The input is split into blocks, which are compressed independently as
+# raw deflate data, each using the last 32KiB of the previous block as
+# its dictionary. Every block ends with a sync flush, so that it ends on
+# a byte boundary and the blocks can be concatenated. The result is
+# wrapped in a zlib header, an empty final block and the adler32 checksum
+# of the input, combined from the checksums of the blocks, producing a
+# regular zlib stream.
+#
+def adler32Combine(adler1, adler2, length2):
+	base = 65521
+	remainder = length2 % base
+	sum1 = adler1 & 0xffff
+	sum2 = (remainder * sum1) % base
+	sum1 = (sum1 + (adler2 & 0xffff) + base - 1) % base
+	sum2 = (sum2 + (adler1 >> 16) + (adler2 >> 16) + base - remainder) % base
+	return sum1 | (sum2 << 16)
+
+def compressBlock(block, dictionary, level):
+	if len(dictionary) > 0:
+		compressor = zlib.compressobj(level, zlib.DEFLATED, -15, zlib.DEF_MEM_LEVEL, zlib.Z_DEFAULT_STRATEGY, dictionary)
+	else:
+		compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+	compressedBlock = compressor.compress(block) + compressor.flush(zlib.Z_SYNC_FLUSH)
+	return (compressedBlock, zlib.adler32(block), len(block))
+
+#
+# Compresses the sequence of buffers $blocks using $threads threads,
+# passing the compressed data to $write in order.
+# Returns the compressed and uncompressed sizes.
+#
+def compressParallel(blocks, write, threads, level):
+	header = encodeZlibHeader(level)
+	emptyFinalBlock = b'\x03\x00'
+	
+	write(header)
+	compressedSize = len(header)
+	uncompressedSize = 0
+	checksum = 1
+	pending = collections.deque()
+	
+	def writeNext():
+		nonlocal compressedSize, uncompressedSize, checksum
+		(compressedBlock, blockChecksum, length) = pending.popleft().result()
+		write(compressedBlock)
+		compressedSize += len(compressedBlock)
+		uncompressedSize += length
+		checksum = adler32Combine(checksum, blockChecksum, length)
+	
+	executor = concurrent.futures.ThreadPoolExecutor(threads)
+	try:
+		dictionary = b''
+		for block in blocks:
+			pending.append(executor.submit(compressBlock, block, dictionary, level))
+			dictionary = block[-32768:]
+			while len(pending) >= 2 * threads:
+				writeNext()
+		while len(pending) > 0:
+			writeNext()
+	finally:
+		for future in pending:
+			future.cancel()
+		executor.shutdown()
+	
+	trailer = emptyFinalBlock + struct.pack('> I', checksum)
+	write(trailer)
+	compressedSize += len(trailer)
+	return (compressedSize, uncompressedSize)
+
+def compressBuffer(byteBuffer, threads, policy):
+	level = chooseLevel(byteBuffer, policy)
+	if threads is None or threads <= 1 or len(byteBuffer) <= parallelBlockSize:
+		return zlib.compress(byteBuffer, level)
+	view = memoryview(byteBuffer)
+	blocks = (view[i : i + parallelBlockSize] for i in range(0, len(view), parallelBlockSize))
+	compressedBlocks = []
+	compressParallel(blocks, compressedBlocks.append, threads, level)
+	return b''.join(compressedBlocks)
+
+def compress(byteBuffer, threads = None, policy = 'default'):
+	compressedBuffer = compressBuffer(byteBuffer, threads, policy)
 	return encodeHeader(compressedBuffer, byteBuffer) + compressedBuffer
 
-def tryCompress(byteBuffer):
-	compressedBuffer = zlib.compress(byteBuffer)
+def tryCompress(byteBuffer, threads = None, policy = 'default'):
+	compressedBuffer = compressBuffer(byteBuffer, threads, policy)
 	if len(compressedBuffer) + 16 < len(byteBuffer):
 		return encodeHeader(compressedBuffer, byteBuffer) + compressedBuffer
 	else:
@@ -55,3 +212,114 @@ def tryDecompress(byteBuffer):
 def isCompressed(byteBuffer):
 	compressedBuffer = decodeHeader(byteBuffer)
 	return compressedBuffer is not None
+
+def compressBlocks(inputStream, outputStream, threads, policy):
+	# Inputs that turn out to be too large are rejected before the block
+	# that exceeds the limit is compressed.
+	inputSize = 0
+	def readBlock(size):
+		nonlocal inputSize
+		block = inputStream.read(size)
+		inputSize += len(block)
+		if inputSize >= maxSize:
+			raise ValueError("Input of more than %d bytes is too large for WESYS compression" % (maxSize - 1))
+		return block
+	
+	# The auto policy chooses a level based on the first block.
+	firstBlock = readBlock(blockSize)
+	level = chooseLevel(firstBlock, policy)
+	
+	if threads is not None and threads > 1:
+		view = memoryview(firstBlock)
+		blocks = itertools.chain(
+			(view[i : i + parallelBlockSize] for i in range(0, len(view), parallelBlockSize)),
+			iter(lambda: readBlock(parallelBlockSize), b''),
+		)
+		return compressParallel(blocks, outputStream.write, threads, level)
+	
+	compressor = zlib.compressobj(level)
+	uncompressedSize = 0
+	compressedSize = 0
+	block = firstBlock
+	while len(block) > 0:
+		uncompressedSize += len(block)
+		compressedBlock = compressor.compress(block)
+		compressedSize += len(compressedBlock)
+		outputStream.write(compressedBlock)
+		block = readBlock(blockSize)
+	compressedBlock = compressor.flush()
+	compressedSize += len(compressedBlock)
+	outputStream.write(compressedBlock)
+	return (compressedSize, uncompressedSize)
+
+#
+# Compresses $inputStream into $outputStream, reading and writing it in
+# blocks. The header is written before the compressed data and filled in
+# afterwards if $outputStream is seekable; otherwise, the compressed data
+# is stored in a temporary file until its size is known.
+# If $threads is more than 1, compresses using that many threads.
+# $policy is one of $policies.
+# Raises ValueError for inputs of 4GiB or more, which the header cannot
+# describe; seekable inputs are checked before anything is written.
+# Returns the number of bytes written.
+#
+def compressStream(inputStream, outputStream, threads = None, policy = 'default'):
+	if inputStream.seekable():
+		inputPosition = inputStream.tell()
+		inputSize = inputStream.seek(0, 2) - inputPosition
+		inputStream.seek(inputPosition, 0)
+		if inputSize >= maxSize:
+			raise ValueError("Input of %d bytes is too large for WESYS compression" % inputSize)
+	
+	if outputStream.seekable():
+		headerPosition = outputStream.tell()
+		outputStream.write(bytes(16))
+		(compressedSize, uncompressedSize) = compressBlocks(inputStream, outputStream, threads, policy)
+		endPosition = outputStream.tell()
+		outputStream.seek(headerPosition, 0)
+		outputStream.write(encodeHeaderSizes(compressedSize, uncompressedSize))
+		outputStream.seek(endPosition, 0)
+	else:
+		spoolStream = tempfile.TemporaryFile()
+		try:
+			(compressedSize, uncompressedSize) = compressBlocks(inputStream, spoolStream, threads, policy)
+			spoolStream.seek(0, 0)
+			outputStream.write(encodeHeaderSizes(compressedSize, uncompressedSize))
+			while True:
+				block = spoolStream.read(blockSize)
+				if len(block) == 0:
+					break
+				outputStream.write(block)
+		finally:
+			spoolStream.close()
+	return compressedSize + 16
+
+#
+# Decompresses $inputStream into $outputStream, reading and writing it in
+# blocks. Returns the number of bytes written.
+#
+def decompressStream(inputStream, outputStream):
+	header = inputStream.read(16)
+	if decodeHeader(header) is None:
+		raise DecodeError()
+	(compressedSize, ) = struct.unpack('< 8x I 4x', header)
+	
+	decompressor = zlib.decompressobj()
+	remainingSize = compressedSize
+	uncompressedSize = 0
+	try:
+		while remainingSize > 0 and not decompressor.eof:
+			block = inputStream.read(min(blockSize, remainingSize))
+			if len(block) == 0:
+				break
+			remainingSize -= len(block)
+			while len(block) > 0:
+				uncompressedBlock = decompressor.decompress(block, blockSize)
+				uncompressedSize += len(uncompressedBlock)
+				outputStream.write(uncompressedBlock)
+				block = decompressor.unconsumed_tail
+	except zlib.error:
+		raise DecodeError()
+	if not decompressor.eof:
+		raise DecodeError()
+	return uncompressedSize
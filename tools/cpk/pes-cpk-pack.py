@@ -3,17 +3,17 @@
 import datetime, os, sys
 sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..', 'lib'))
 
-from pes_file_tools import cpk
+from pes_file_tools import cpk, stats
 
 def addFile(cpk, realFilename, packedFilename):
 	stat = os.stat(realFilename)
 	mtime = datetime.datetime.fromtimestamp(stat.st_mtime)
 	
 	inputFile = open(realFilename, 'rb')
-	content = inputFile.read()
+	success = cpk.writeFileStream(packedFilename, inputFile, mtime)
 	inputFile.close()
 	
-	if not cpk.writeFile(packedFilename, content, mtime):
+	if not success:
 		print("Cannot pack duplicate filename '%s'" % packedFilename)
 		return False
 	
@@ -30,13 +30,13 @@ def addFileRecursive(cpk, filename, pathPrefix):
 				return False
 	return True
 
-def main(cpkFile, packedFiles, allowOverwrite):
+def main(cpkFile, packedFiles, allowOverwrite, enableItoc, enableCrc):
 	if not allowOverwrite and os.path.exists(cpkFile):
 		print("Output file '%s' already exists, not overwriting" % cpkFile)
 		return
 	
 	outputFile = cpk.CpkWriter()
-	outputFile.open(cpkFile)
+	outputFile.open(cpkFile, enableItoc = enableItoc, enableFileCrc = enableCrc, enableTocCrc = enableCrc)
 	
 	for filename in packedFiles:
 		if not addFileRecursive(outputFile, filename, os.path.basename(filename.strip('/\\'))):
@@ -51,12 +51,18 @@ def usage():
 	print("    Recursively packs the contents of <filename>")
 	print("Options:")
 	print("  -r, --allow-replace        Allow overwriting existing cpk file")
+	print("  -i, --itoc                 Include an ITOC, to allow finding files by ID")
+	print("  -c, --crc                  Store crcs of packed files and the TOC")
+	print("      --stats                Print timing statistics as JSON to stderr")
 	print("  -h, --help                 Display this help")
 	sys.exit()
 
 allowOverwrite = False
+enableItoc = False
+enableCrc = False
 cpkFile = None
 packedFiles = []
+showStats = False
 
 index = 1
 while index < len(sys.argv):
@@ -64,6 +70,12 @@ while index < len(sys.argv):
 	index += 1
 	if arg in ['-r', '--allow-replace']:
 		allowOverwrite = True
+	elif arg in ['-i', '--itoc']:
+		enableItoc = True
+	elif arg in ['-c', '--crc']:
+		enableCrc = True
+	elif arg == '--stats':
+		showStats = True
 	elif arg[0:1] == '-':
 		usage()
 	elif cpkFile is None:
@@ -74,4 +86,5 @@ while index < len(sys.argv):
 if cpkFile is None:
 	usage()
 
-main(cpkFile, packedFiles, allowOverwrite)
+with stats.collect(sys.stderr if showStats else None):
+	main(cpkFile, packedFiles, allowOverwrite, enableItoc, enableCrc)
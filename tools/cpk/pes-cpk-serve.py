@@ -0,0 +1,263 @@
+#! /usr/bin/env python3
+
+import asyncio, concurrent.futures, os, sys, urllib.parse
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..', 'lib'))
+
+from pes_file_tools import cpk, stats
+
+statusMessages = {
+	200: 'OK',
+	206: 'Partial Content',
+	400: 'Bad Request',
+	404: 'Not Found',
+	405: 'Method Not Allowed',
+	416: 'Range Not Satisfiable',
+	500: 'Internal Server Error',
+}
+
+#
+# Parses a Range header of the form "bytes=<first>-<last>", "bytes=<first>-"
+# or "bytes=-<suffix length>" into a half-open range of a file of $size bytes.
+# Returns None for headers that should be ignored, such as multiple ranges,
+# and raises ValueError for ranges that cannot be satisfied.
+#
+def parseRange(header, size):
+	if not header.startswith('bytes=') or ',' in header:
+		return None
+	(first, separator, last) = header[6:].strip().partition('-')
+	if separator != '-':
+		return None
+	if first == '':
+		suffixLength = int(last)
+		if suffixLength <= 0 or size == 0:
+			raise ValueError()
+		return (max(0, size - suffixLength), size)
+	start = int(first)
+	end = size if last == '' else min(int(last) + 1, size)
+	if start >= size or end <= start:
+		raise ValueError()
+	return (start, end)
+
+async def readRequest(reader):
+	requestLine = await reader.readline()
+	if len(requestLine) == 0:
+		return None
+	headers = {}
+	while True:
+		line = await reader.readline()
+		if len(line) == 0 or line in [b'\r\n', b'\n']:
+			break
+		(key, separator, value) = line.decode('iso-8859-1').partition(':')
+		headers[key.strip().lower()] = value.strip()
+	return (requestLine.decode('iso-8859-1').split(), headers)
+
+#
+# The state of one response. Once its header is sent, errors can no longer
+# be reported to the client.
+#
+class Response:
+	def __init__(self, writer):
+		self.writer = writer
+		self.headerSent = False
+
+def writeHeader(response, status, headers):
+	response.headerSent = True
+	lines = ["HTTP/1.1 %d %s" % (status, statusMessages[status])]
+	for (key, value) in headers:
+		lines.append("%s: %s" % (key, value))
+	response.writer.write(("\r\n".join(lines) + "\r\n\r\n").encode('iso-8859-1'))
+
+async def writeError(response, status):
+	body = ("%d %s\n" % (status, statusMessages[status])).encode('utf-8')
+	writeHeader(response, status, [
+		('Content-Type', 'text/plain'),
+		('Content-Length', len(body)),
+	])
+	response.writer.write(body)
+	await response.writer.drain()
+
+async def serveFile(cpkReader, response, method, path, headers):
+	writer = response.writer
+	entry = cpkReader.findFile(urllib.parse.unquote(path))
+	if entry is None:
+		await writeError(response, 404)
+		return
+	
+	# Ranges are served from stored files without reading the rest of the
+	# file. Compressed files have to be decompressed as a whole, and are
+	# always served in full.
+	if cpkReader.isStored(entry):
+		size = entry.size
+		responseRange = None
+		if 'range' in headers:
+			try:
+				responseRange = parseRange(headers['range'], size)
+			except ValueError:
+				writeHeader(response, 416, [
+					('Content-Range', "bytes */%d" % size),
+					('Content-Length', 0),
+				])
+				await writer.drain()
+				return
+		
+		if responseRange is None:
+			(start, end) = (0, size)
+			writeHeader(response, 200, [
+				('Content-Type', 'application/octet-stream'),
+				('Content-Length', size),
+				('Accept-Ranges', 'bytes'),
+			])
+		else:
+			(start, end) = responseRange
+			writeHeader(response, 206, [
+				('Content-Type', 'application/octet-stream'),
+				('Content-Length', end - start),
+				('Content-Range', "bytes %d-%d/%d" % (start, end - 1, size)),
+				('Accept-Ranges', 'bytes'),
+			])
+		
+		if method == 'GET':
+			while start < end:
+				block = await cpkReader.readRange(entry, start, min(end, start + cpk.blockSize))
+				writer.write(block)
+				await writer.drain()
+				start += len(block)
+		await writer.drain()
+	else:
+		content = await cpkReader.readFile(entry)
+		writeHeader(response, 200, [
+			('Content-Type', 'application/octet-stream'),
+			('Content-Length', len(content)),
+			('Accept-Ranges', 'none'),
+		])
+		if method == 'GET':
+			writer.write(content)
+		await writer.drain()
+
+async def handleConnection(cpkReader, reader, writer):
+	try:
+		while True:
+			request = await readRequest(reader)
+			if request is None:
+				break
+			(requestLine, headers) = request
+			response = Response(writer)
+			if len(requestLine) != 3:
+				await writeError(response, 400)
+				break
+			(method, target, version) = requestLine
+			
+			if method not in ['GET', 'HEAD']:
+				await writeError(response, 405)
+			else:
+				try:
+					await serveFile(cpkReader, response, method, urllib.parse.urlsplit(target).path, headers)
+				except Exception as e:
+					print("Error serving '%s': %s" % (target, e))
+					sys.stdout.flush()
+					# If the header was already sent, the response cannot be
+					# completed, and the connection is closed instead.
+					if not response.headerSent:
+						await writeError(response, 500)
+					break
+			
+			if headers.get('connection', '').lower() == 'close' or version == 'HTTP/1.0':
+				break
+	except (ConnectionError, asyncio.IncompleteReadError):
+		pass
+	finally:
+		writer.close()
+
+async def serve(cpkFile, host, port, threads):
+	executor = concurrent.futures.ThreadPoolExecutor(threads)
+	cpkReader = cpk.AsyncCpkReader(executor)
+	try:
+		await cpkReader.open(cpkFile)
+	except Exception as e:
+		print("Error reading cpk file: %s" % e)
+		executor.shutdown()
+		return
+	
+	server = await asyncio.start_server(
+		lambda reader, writer: handleConnection(cpkReader, reader, writer),
+		host,
+		port,
+	)
+	address = server.sockets[0].getsockname()
+	print("Serving %d files from '%s' on http://%s:%d/" % (len(cpkReader.files), cpkFile, address[0], address[1]))
+	sys.stdout.flush()
+	try:
+		async with server:
+			await server.serve_forever()
+	finally:
+		cpkReader.close()
+		executor.shutdown()
+
+def main(cpkFile, host, port, threads):
+	try:
+		asyncio.run(serve(cpkFile, host, port, threads))
+	except KeyboardInterrupt:
+		pass
+
+def usage():
+	print("pes-cpk-serve -- Serve the files in a PES cpk archive over HTTP")
+	print("Usage:")
+	print("  pes-cpk-serve [OPTIONS] <cpk file>")
+	print("    Packed files are served at http://<ADDRESS>:<PORT>/<packed file>")
+	print("    Range requests are supported for files stored without compression")
+	print("Options:")
+	print("  -b, --bind <ADDRESS>       Listen on <ADDRESS> [default: 127.0.0.1]")
+	print("  -p, --port <PORT>          Listen on <PORT> [default: 8080]")
+	print("  -j, --threads <COUNT>      Read using <COUNT> threads [default: automatic]")
+	print("      --stats                Print timing statistics as JSON to stderr")
+	print("  -h, --help                 Display this help")
+	sys.exit()
+
+if __name__ == '__main__':
+	host = '127.0.0.1'
+	port = 8080
+	threads = None
+	cpkFile = None
+	showStats = False
+	
+	index = 1
+	while index < len(sys.argv):
+		arg = sys.argv[index]
+		index += 1
+		if arg in ['-b', '--bind']:
+			if index >= len(sys.argv):
+				usage()
+			host = sys.argv[index]
+			index += 1
+		elif arg in ['-p', '--port']:
+			if index >= len(sys.argv):
+				usage()
+			try:
+				port = int(sys.argv[index])
+			except ValueError:
+				usage()
+			index += 1
+		elif arg in ['-j', '--threads']:
+			if index >= len(sys.argv):
+				usage()
+			try:
+				threads = int(sys.argv[index])
+			except ValueError:
+				usage()
+			index += 1
+			if threads < 1:
+				usage()
+		elif arg == '--stats':
+			showStats = True
+		elif arg[0:1] == '-':
+			usage()
+		elif cpkFile is None:
+			cpkFile = arg
+		else:
+			usage()
+	
+	if cpkFile is None:
+		usage()
+	
+	with stats.collect(sys.stderr if showStats else None):
+		main(cpkFile, host, port, threads)
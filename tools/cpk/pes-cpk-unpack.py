@@ -3,7 +3,7 @@
 import os, sys
 sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..', 'lib'))
 
-from pes_file_tools import cpk
+from pes_file_tools import cpk, stats
 
 def main(cpkFile, listMode, allowOverwrite, directory):
 	inputFile = cpk.CpkReader()
@@ -43,10 +43,8 @@ def main(cpkFile, listMode, allowOverwrite, directory):
 			print("Output file '%s' already exists, not overwriting" % effectiveFilename)
 			return
 		
-		fileContent = inputFile.readFile(entry)
-		
 		output = open(effectiveFilename, 'wb')
-		output.write(fileContent)
+		inputFile.readFileTo(entry, output)
 		output.close()
 		if entry.modificationTime is not None:
 			timestamp = entry.modificationTime.timestamp()
@@ -61,6 +59,7 @@ def usage():
 	print("  -r, --allow-replace        Allow overwriting existing packed files")
 	print("  -d, --directory <DIR>      Unpack in directory <DIR>")
 	print("  -l, --list                 List packed files")
+	print("      --stats                Print timing statistics as JSON to stderr")
 	print("  -h, --help                 Display this help")
 	sys.exit()
 
@@ -68,6 +67,7 @@ allowOverwrite = False
 directory = None
 listMode = False
 cpkFile = None
+showStats = False
 
 index = 1
 while index < len(sys.argv):
@@ -84,6 +84,8 @@ while index < len(sys.argv):
 		index += 1
 	elif arg in ['-l', '--list']:
 		listMode = True
+	elif arg == '--stats':
+		showStats = True
 	elif arg[0:1] == '-':
 		usage()
 	elif cpkFile is None:
@@ -94,4 +96,5 @@ while index < len(sys.argv):
 if cpkFile is None:
 	usage()
 
-main(cpkFile, listMode, allowOverwrite, directory)
+with stats.collect(sys.stderr if showStats else None):
+	main(cpkFile, listMode, allowOverwrite, directory)
@@ -0,0 +1,104 @@
+#! /usr/bin/env python3
+
+import os, sys
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..', 'lib'))
+
+from pes_file_tools import cpk, stats
+
+def main(cpkFiles, processes, decode, verbose):
+	failures = 0
+	for cpkFile in cpkFiles:
+		try:
+			reader = cpk.CpkReader()
+			reader.open(cpkFile)
+			tocValid = reader.verifyToc()
+			reader.close()
+		except Exception as e:
+			print("%s: error reading cpk file: %s" % (cpkFile, e))
+			failures += 1
+			continue
+		
+		if tocValid is None:
+			print("%s: no TOC crc" % cpkFile)
+		elif not tocValid:
+			print("%s: bad TOC crc" % cpkFile)
+			failures += 1
+		
+		counts = {}
+		try:
+			for (name, result) in cpk.verifyArchive(cpkFile, processes, decode):
+				status = result.split(':')[0]
+				counts[status] = counts.get(status, 0) + 1
+				if status in ['bad', 'error']:
+					print("%s: %s: %s" % (cpkFile, name, result))
+				elif verbose:
+					print("%s: %s: %s" % (cpkFile, name, result))
+		except Exception as e:
+			print("%s: error verifying cpk file: %s" % (cpkFile, e))
+			failures += 1
+			continue
+		
+		print("%s: %d ok, %d bad, %d errors, %d unchecked" % (
+			cpkFile,
+			counts.get('ok', 0),
+			counts.get('bad', 0),
+			counts.get('error', 0),
+			counts.get('unchecked', 0),
+		))
+		failures += counts.get('bad', 0) + counts.get('error', 0)
+	
+	if failures > 0:
+		sys.exit(1)
+
+def usage():
+	print("pes-cpk-verify -- Check the integrity of PES cpk archives")
+	print("Usage:")
+	print("  pes-cpk-verify [OPTIONS] <cpk file>...")
+	print("    Compares packed files against the crcs stored in the archive")
+	print("Options:")
+	print("  -d, --decode               Check compressed files without a crc by decompressing them")
+	print("  -j, --jobs <COUNT>         Check using <COUNT> processes [default: all cores]")
+	print("  -v, --verbose              List every packed file checked")
+	print("      --stats                Print timing statistics as JSON to stderr")
+	print("  -h, --help                 Display this help")
+	sys.exit()
+
+if __name__ == '__main__':
+	processes = None
+	decode = False
+	verbose = False
+	cpkFiles = []
+	showStats = False
+	
+	index = 1
+	while index < len(sys.argv):
+		arg = sys.argv[index]
+		index += 1
+		if arg in ['-d', '--decode']:
+			decode = True
+		elif arg in ['-j', '--jobs']:
+			if index >= len(sys.argv):
+				usage()
+			if processes is not None:
+				usage()
+			try:
+				processes = int(sys.argv[index])
+			except ValueError:
+				usage()
+			index += 1
+			if processes < 1:
+				usage()
+		elif arg in ['-v', '--verbose']:
+			verbose = True
+		elif arg == '--stats':
+			showStats = True
+		elif arg[0:1] == '-':
+			usage()
+		else:
+			cpkFiles.append(arg)
+	
+	if len(cpkFiles) == 0:
+		usage()
+	
+	with stats.collect(sys.stderr if showStats else None):
+		main(cpkFiles, processes, decode, verbose)
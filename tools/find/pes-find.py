@@ -0,0 +1,112 @@
+#! /usr/bin/env python3
+
+import os, sys
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..', 'lib'))
+
+from pes_file_tools import find, stats
+
+def main(archiveFiles, query, processes):
+	try:
+		for match in find.find(archiveFiles, query, processes):
+			if match.error is not None:
+				sys.stdout.flush()
+				print("Error reading '%s': %s" % (match.path, match.error), file = sys.stderr)
+				sys.stderr.flush()
+				continue
+			if match.offset is None:
+				print(match.path)
+			else:
+				print("%s: offset 0x%x" % (match.path, match.offset))
+			sys.stdout.flush()
+	except Exception as e:
+		print("Error searching archives: %s" % e)
+
+def usage():
+	print("pes-find -- Search PES cpk and fpk archives for packed files")
+	print("Usage:")
+	print("  pes-find [OPTIONS] [archive or directory]...")
+	print("    Searches the archives, and the fpk and cpk archives nested in them")
+	print("    Packed files are printed as <archive>!/<packed file>, nested as needed")
+	print("Options:")
+	print("  -n, --name <GLOB>          Find packed files whose name matches <GLOB>")
+	print("  -e, --regex <REGEX>        Find packed files whose name matches <REGEX>")
+	print("  -c, --content <TEXT>       Find packed files containing <TEXT>")
+	print("  -x, --hex <HEX>            Find packed files containing the bytes <HEX>")
+	print("  -i, --ignore-case          Match filenames case-insensitively")
+	print("  -j, --jobs <COUNT>         Search using <COUNT> processes [default: all cores]")
+	print("      --stats                Print timing statistics as JSON to stderr")
+	print("  -h, --help                 Display this help")
+	sys.exit()
+
+if __name__ == '__main__':
+	namePattern = None
+	nameRegex = None
+	contentPattern = None
+	ignoreCase = False
+	processes = None
+	archiveFiles = []
+	showStats = False
+	
+	index = 1
+	while index < len(sys.argv):
+		arg = sys.argv[index]
+		index += 1
+		if arg in ['-n', '--name']:
+			if index >= len(sys.argv):
+				usage()
+			if namePattern is not None:
+				usage()
+			namePattern = sys.argv[index]
+			index += 1
+		elif arg in ['-e', '--regex']:
+			if index >= len(sys.argv):
+				usage()
+			if nameRegex is not None:
+				usage()
+			nameRegex = sys.argv[index]
+			index += 1
+		elif arg in ['-c', '--content']:
+			if index >= len(sys.argv):
+				usage()
+			if contentPattern is not None:
+				usage()
+			contentPattern = sys.argv[index].encode('utf-8')
+			index += 1
+		elif arg in ['-x', '--hex']:
+			if index >= len(sys.argv):
+				usage()
+			if contentPattern is not None:
+				usage()
+			try:
+				contentPattern = bytes.fromhex(sys.argv[index])
+			except ValueError:
+				usage()
+			index += 1
+		elif arg in ['-i', '--ignore-case']:
+			ignoreCase = True
+		elif arg in ['-j', '--jobs']:
+			if index >= len(sys.argv):
+				usage()
+			if processes is not None:
+				usage()
+			try:
+				processes = int(sys.argv[index])
+			except ValueError:
+				usage()
+			index += 1
+			if processes < 1:
+				usage()
+		elif arg == '--stats':
+			showStats = True
+		elif arg[0:1] == '-':
+			usage()
+		else:
+			archiveFiles.append(arg)
+	
+	if len(archiveFiles) == 0:
+		usage()
+	if contentPattern is not None and len(contentPattern) == 0:
+		usage()
+	
+	with stats.collect(sys.stderr if showStats else None):
+		main(archiveFiles, find.Query(namePattern, nameRegex, contentPattern, ignoreCase), processes)
@@ -3,18 +3,14 @@
 import os, sys
 sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..', 'lib'))
 
-from pes_file_tools import fpk
+from pes_file_tools import fpk, stats
 
-def addFile(fpk, realFilename, packedFilename):
-	if packedFilename in fpk.entries:
+def addFile(fpkFile, realFilename, packedFilename):
+	if packedFilename in fpkFile.entries:
 		print("Cannot pack duplicate filename '%s'" % packedFilename)
 		return False
 	
-	inputFile = open(realFilename, 'rb')
-	content = inputFile.read()
-	inputFile.close()
-	
-	fpk.entries[packedFilename] = content
+	fpkFile.entries[packedFilename] = fpk.FileContent(realFilename)
 	return True
 
 def addDirectoryRecursive(fpk, directory, pathPrefix):
@@ -60,12 +56,14 @@ def usage():
 	print("    Packs the <filename> files without path information")
 	print("Options:")
 	print("  -r, --allow-replace        Allow overwriting existing fpk file")
+	print("      --stats                Print timing statistics as JSON to stderr")
 	print("  -h, --help                 Display this help")
 	sys.exit()
 
 allowOverwrite = False
 fpkFile = None
 packedFiles = []
+showStats = False
 
 index = 1
 while index < len(sys.argv):
@@ -73,6 +71,8 @@ while index < len(sys.argv):
 	index += 1
 	if arg in ['-r', '--allow-replace']:
 		allowOverwrite = True
+	elif arg == '--stats':
+		showStats = True
 	elif arg[0:1] == '-':
 		usage()
 	elif fpkFile is None:
@@ -83,4 +83,5 @@ while index < len(sys.argv):
 if fpkFile is None:
 	usage()
 
-main(fpkFile, packedFiles, allowOverwrite)
+with stats.collect(sys.stderr if showStats else None):
+	main(fpkFile, packedFiles, allowOverwrite)
@@ -3,49 +3,55 @@
 import os, sys
 sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..', 'lib'))
 
-from pes_file_tools import fpk
+from pes_file_tools import fpk, stats
 
 def main(fpkFile, listMode, allowOverwrite, directory):
 	inputFile = fpk.FpkFile()
 	try:
-		inputFile.readFile(fpkFile)
+		inputFile.open(fpkFile)
+		if not listMode:
+			inputFile.verify()
 	except Exception as e:
+		inputFile.close()
 		print("Error reading fpk file: %s" % e)
 		return
 	
-	if directory is not None:
-		os.chdir(directory)
-	
-	for filename in sorted(inputFile.entries.keys()):
-		if listMode:
-			print(filename)
-			continue
-		
-		filenameComponents = filename.replace('\\', '/').split('/')
-		if len(filenameComponents) == 0:
-			continue
-		if filenameComponents[-1] == '':
-			continue
-		components = [component for component in filenameComponents if component != '']
+	try:
+		if directory is not None:
+			os.chdir(directory)
 		
-		for i in range(len(components) - 1):
-			d = os.path.join(*components[0 : i + 1])
-			if os.path.isdir(d):
+		for filename in sorted(inputFile.entries.keys()):
+			if listMode:
+				print(filename)
 				continue
-			elif os.path.exists(d):
-				print("Cannot create directory '%s': file exists" % d)
+			
+			filenameComponents = filename.replace('\\', '/').split('/')
+			if len(filenameComponents) == 0:
+				continue
+			if filenameComponents[-1] == '':
+				continue
+			components = [component for component in filenameComponents if component != '']
+			
+			for i in range(len(components) - 1):
+				d = os.path.join(*components[0 : i + 1])
+				if os.path.isdir(d):
+					continue
+				elif os.path.exists(d):
+					print("Cannot create directory '%s': file exists" % d)
+					return
+				else:
+					os.mkdir(d)
+			
+			effectiveFilename = os.path.join(*components)
+			if not allowOverwrite and os.path.exists(effectiveFilename):
+				print("Output file '%s' already exists, not overwriting" % effectiveFilename)
 				return
-			else:
-				os.mkdir(d)
-		
-		effectiveFilename = os.path.join(*components)
-		if not allowOverwrite and os.path.exists(effectiveFilename):
-			print("Output file '%s' already exists, not overwriting" % effectiveFilename)
-			return
-		
-		output = open(effectiveFilename, 'wb')
-		output.write(inputFile.entries[filename])
-		output.close()
+			
+			output = open(effectiveFilename, 'wb')
+			output.write(inputFile.entries[filename])
+			output.close()
+	finally:
+		inputFile.close()
 
 def usage():
 	print("pes-fpk-unpack -- Unpack or list a PES fpk archive")
@@ -56,6 +62,7 @@ def usage():
 	print("  -r, --allow-replace        Allow overwriting existing packed files")
 	print("  -d, --directory <DIR>      Unpack in directory <DIR>")
 	print("  -l, --list                 List packed files")
+	print("      --stats                Print timing statistics as JSON to stderr")
 	print("  -h, --help                 Display this help")
 	sys.exit()
 
@@ -63,6 +70,7 @@ allowOverwrite = False
 directory = None
 listMode = False
 fpkFile = None
+showStats = False
 
 index = 1
 while index < len(sys.argv):
@@ -79,6 +87,8 @@ while index < len(sys.argv):
 		index += 1
 	elif arg in ['-l', '--list']:
 		listMode = True
+	elif arg == '--stats':
+		showStats = True
 	elif arg[0:1] == '-':
 		usage()
 	elif fpkFile is None:
@@ -89,4 +99,5 @@ while index < len(sys.argv):
 if fpkFile is None:
 	usage()
 
-main(fpkFile, listMode, allowOverwrite, directory)
+with stats.collect(sys.stderr if showStats else None):
+	main(fpkFile, listMode, allowOverwrite, directory)
@@ -3,7 +3,7 @@
 import os, sys
 sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..', 'lib'))
 
-from pes_file_tools import fsop
+from pes_file_tools import fsop, stats
 
 def main(fsopFile, packedFiles, allowOverwrite):
 	outputFile = fsop.FsopFile()
@@ -37,12 +37,14 @@ def usage():
 	print("    <directory> must contain 'vertex-shader.cso' and 'pixel-shader.cso' files")
 	print("Options:")
 	print("  -r, --allow-replace        Allow overwriting existing fsop file")
+	print("      --stats                Print timing statistics as JSON to stderr")
 	print("  -h, --help                 Display this help")
 	sys.exit()
 
 allowOverwrite = False
 fsopFile = None
 packedFiles = []
+showStats = False
 
 index = 1
 while index < len(sys.argv):
@@ -50,6 +52,8 @@ while index < len(sys.argv):
 	index += 1
 	if arg in ['-r', '--allow-replace']:
 		allowOverwrite = True
+	elif arg == '--stats':
+		showStats = True
 	elif arg[0:1] == '-':
 		usage()
 	elif fsopFile is None:
@@ -60,4 +64,5 @@ while index < len(sys.argv):
 if fsopFile is None:
 	usage()
 
-main(fsopFile, packedFiles, allowOverwrite)
+with stats.collect(sys.stderr if showStats else None):
+	main(fsopFile, packedFiles, allowOverwrite)
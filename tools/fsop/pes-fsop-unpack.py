@@ -3,12 +3,12 @@
 import os, sys
 sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..', 'lib'))
 
-from pes_file_tools import fsop
+from pes_file_tools import fsop, stats
 
 def main(fsopFile, listMode, allowOverwrite, directory):
 	inputFile = fsop.FsopFile()
 	try:
-		inputFile.readFile(fsopFile)
+		inputFile.open(fsopFile)
 	except Exception as e:
 		print("Error reading fsop file: %s" % e)
 		return
@@ -16,7 +16,7 @@ def main(fsopFile, listMode, allowOverwrite, directory):
 	if directory is not None:
 		os.chdir(directory)
 	
-	for name in sorted(inputFile.entries.keys()):
+	for name in sorted(inputFile.index.keys()):
 		if listMode:
 			print(name)
 			continue
@@ -37,12 +37,14 @@ def main(fsopFile, listMode, allowOverwrite, directory):
 			print("Output file '%s' already exists, not overwriting" % pixelFilename)
 			return
 		
+		shader = inputFile.get(name)
+		
 		vertexOutput = open(vertexFilename, 'wb')
-		vertexOutput.write(inputFile.entries[name].vertexShader)
+		vertexOutput.write(shader.vertexShader)
 		vertexOutput.close()
 		
 		pixelOutput = open(pixelFilename, 'wb')
-		pixelOutput.write(inputFile.entries[name].pixelShader)
+		pixelOutput.write(shader.pixelShader)
 		pixelOutput.close()
 
 def usage():
@@ -54,6 +56,7 @@ def usage():
 	print("  -r, --allow-replace        Allow overwriting existing packed files")
 	print("  -d, --directory <DIR>      Unpack in directory <DIR>")
 	print("  -l, --list                 List packed files")
+	print("      --stats                Print timing statistics as JSON to stderr")
 	print("  -h, --help                 Display this help")
 	sys.exit()
 
@@ -61,6 +64,7 @@ allowOverwrite = False
 directory = None
 listMode = False
 fsopFile = None
+showStats = False
 
 index = 1
 while index < len(sys.argv):
@@ -77,6 +81,8 @@ while index < len(sys.argv):
 		index += 1
 	elif arg in ['-l', '--list']:
 		listMode = True
+	elif arg == '--stats':
+		showStats = True
 	elif arg[0:1] == '-':
 		usage()
 	elif fsopFile is None:
@@ -87,4 +93,5 @@ while index < len(sys.argv):
 if fsopFile is None:
 	usage()
 
-main(fsopFile, listMode, allowOverwrite, directory)
+with stats.collect(sys.stderr if showStats else None):
+	main(fsopFile, listMode, allowOverwrite, directory)
@@ -3,9 +3,9 @@
 import os, sys
 sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..', 'lib'))
 
-from pes_file_tools import ftex
+from pes_file_tools import ftex, stats
 
-def main(ddsFiles, ftexFilename, colorspace, allowOverwrite):
+def main(ddsFiles, ftexFilename, colorspace, ftexsLevels, allowOverwrite):
 	for ddsFile in ddsFiles:
 		if ftexFilename is not None:
 			outputFilename = ftexFilename
@@ -17,8 +17,13 @@ def main(ddsFiles, ftexFilename, colorspace, allowOverwrite):
 		if not allowOverwrite and os.path.exists(outputFilename):
 			print("Output file '%s' already exists, not overwriting" % outputFilename)
 			return
+		for ftexsNumber in range(1, ftexsLevels + 1):
+			ftexsFilename = ftex.ftexsFilename(outputFilename, ftexsNumber)
+			if not allowOverwrite and os.path.exists(ftexsFilename):
+				print("Output file '%s' already exists, not overwriting" % ftexsFilename)
+				return
 		
-		ftex.ddsToFtex(ddsFile, outputFilename, colorspace)
+		ftex.ddsToFtex(ddsFile, outputFilename, colorspace, ftexsLevels)
 
 def usage():
 	print("pes-dds-to-ftex -- Convert a dds image to PES ftex format")
@@ -30,7 +35,9 @@ def usage():
 	print("                               linear   ftex stores linear colors")
 	print("                               sRGB     ftex stores sRGB colors")
 	print("                               normal   ftex stores noncolor data [default]")
+	print("  -f, --ftexs <COUNT>        Store the <COUNT> largest mipmaps in separate ftexs files")
 	print("  -r, --allow-replace        Allow overwriting existing packed files")
+	print("      --stats                Print timing statistics as JSON to stderr")
 	print("  -h, --help                 Display this help")
 	sys.exit()
 
@@ -38,6 +45,8 @@ allowOverwrite = False
 ddsFiles = []
 ftexFilename = None
 colorspace = None
+ftexsLevels = None
+showStats = False
 
 index = 1
 while index < len(sys.argv):
@@ -54,6 +63,20 @@ while index < len(sys.argv):
 		index += 1
 		if colorspace not in ['LINEAR', 'SRGB', 'NORMAL']:
 			usage()
+	elif arg in ['-f', '--ftexs']:
+		if index >= len(sys.argv):
+			usage()
+		if ftexsLevels is not None:
+			usage()
+		try:
+			ftexsLevels = int(sys.argv[index])
+		except ValueError:
+			usage()
+		index += 1
+		if ftexsLevels < 0:
+			usage()
+	elif arg == '--stats':
+		showStats = True
 	elif arg[0:1] == '-':
 		usage()
 	else:
@@ -66,4 +89,8 @@ if len(ddsFiles) == 2 and ddsFiles[0].lower().endswith('.dds') and ddsFiles[1].l
 	ftexFilename = ddsFiles[1]
 	ddsFiles = [ddsFiles[0]]
 
-main(ddsFiles, ftexFilename, colorspace, allowOverwrite)
+if ftexsLevels is None:
+	ftexsLevels = 0
+
+with stats.collect(sys.stderr if showStats else None):
+	main(ddsFiles, ftexFilename, colorspace, ftexsLevels, allowOverwrite)
@@ -3,9 +3,9 @@
 import os, sys
 sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..', 'lib'))
 
-from pes_file_tools import ftex
+from pes_file_tools import ftex, stats
 
-def main(ftexFiles, ddsFilename, allowOverwrite):
+def main(ftexFiles, ddsFilename, maxSize, allowOverwrite):
 	for ftexFile in ftexFiles:
 		if ddsFilename is not None:
 			outputFilename = ddsFilename
@@ -18,7 +18,7 @@ def main(ftexFiles, ddsFilename, allowOverwrite):
 			print("Output file '%s' already exists, not overwriting" % outputFilename)
 			return
 		
-		ftex.ftexToDds(ftexFile, outputFilename)
+		ftex.ftexToDds(ftexFile, outputFilename, maxSize)
 
 def usage():
 	print("pes-ftex-to-dds -- Convert a PES ftex image to dds format")
@@ -26,13 +26,17 @@ def usage():
 	print("  pes-ftex-to-dds [OPTIONS] [ftex filename]...")
 	print("  pes-ftex-to-dds [OPTIONS] <ftex filename> <dds filename>")
 	print("Options:")
+	print("  -s, --max-size <PIXELS>    Only convert mipmaps at most <PIXELS> wide and high")
 	print("  -r, --allow-replace        Allow overwriting existing packed files")
+	print("      --stats                Print timing statistics as JSON to stderr")
 	print("  -h, --help                 Display this help")
 	sys.exit()
 
 allowOverwrite = False
 ftexFiles = []
 ddsFilename = None
+maxSize = None
+showStats = False
 
 index = 1
 while index < len(sys.argv):
@@ -40,6 +44,20 @@ while index < len(sys.argv):
 	index += 1
 	if arg in ['-r', '--allow-replace']:
 		allowOverwrite = True
+	elif arg in ['-s', '--max-size']:
+		if index >= len(sys.argv):
+			usage()
+		if maxSize is not None:
+			usage()
+		try:
+			maxSize = int(sys.argv[index])
+		except ValueError:
+			usage()
+		index += 1
+		if maxSize < 1:
+			usage()
+	elif arg == '--stats':
+		showStats = True
 	elif arg[0:1] == '-':
 		usage()
 	else:
@@ -52,4 +70,5 @@ if len(ftexFiles) == 2 and ftexFiles[0].lower().endswith('.ftex') and ftexFiles[
 	ddsFilename = ftexFiles[1]
 	ftexFiles = [ftexFiles[0]]
 
-main(ftexFiles, ddsFilename, allowOverwrite)
+with stats.collect(sys.stderr if showStats else None):
+	main(ftexFiles, ddsFilename, maxSize, allowOverwrite)
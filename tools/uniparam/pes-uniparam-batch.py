@@ -0,0 +1,199 @@
+#! /usr/bin/env python3
+
+import json, os, sys
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..', 'lib'))
+
+from pes_file_tools import stats, uniparam, zlib
+
+def listFiles(filename):
+	if not os.path.isdir(filename):
+		return [filename]
+	else:
+		entries = []
+		for entry in os.listdir(filename):
+			if entry in ['.', '..']:
+				continue
+			fullEntry = os.path.join(filename, entry)
+			if os.path.isfile(fullEntry):
+				entries.append(fullEntry)
+		return entries
+
+def packedFilename(filename):
+	effectiveFilename = filename
+	if '/' in effectiveFilename:
+		effectiveFilename = effectiveFilename[effectiveFilename.rfind('/') + 1:]
+	if '\\' in effectiveFilename:
+		effectiveFilename = effectiveFilename[effectiveFilename.rfind('\\') + 1:]
+	return effectiveFilename
+
+#
+# Reads a manifest of the form
+#   {
+#     "<UniformParameters file>": {
+#       "output": "<output file>",
+#       "add": ["<file or directory>", ...],
+#       "delete": ["<packed filename>", ...],
+#       "compress": true
+#     },
+#     ...
+#   }
+# where every key is optional. Files without an "output" are edited in
+# place. No two files may be written to the same output file, and no file
+# may be written over the input of another. "compress"
+# is either a boolean or the name of a compression policy. Relative paths
+# are relative to the directory containing the manifest.
+#
+def readManifest(manifestFile, compressPolicy):
+	stream = open(manifestFile, 'r', encoding = 'utf-8')
+	document = json.load(stream)
+	stream.close()
+	
+	baseDirectory = os.path.dirname(manifestFile)
+	manifest = {}
+	# inputFiles is a dictionary from normalized input path to the list of
+	# UniformParameters files read from there.
+	inputFiles = {}
+	for uniparamFile in document:
+		inputKey = os.path.normcase(os.path.abspath(os.path.join(baseDirectory, uniparamFile)))
+		inputFiles.setdefault(inputKey, []).append(uniparamFile)
+	# outputFiles is a dictionary from normalized output path to the
+	# UniformParameters file written there.
+	outputFiles = {}
+	for (uniparamFile, entry) in document.items():
+		addedFiles = {}
+		for filename in entry.get('add', []):
+			for sourceFilename in listFiles(os.path.join(baseDirectory, filename)):
+				effectiveFilename = packedFilename(sourceFilename)
+				if effectiveFilename in addedFiles:
+					raise ValueError("Cannot make conflicting edits for file '%s' in '%s'" % (sourceFilename, uniparamFile))
+				addedFiles[effectiveFilename] = sourceFilename
+		
+		deletedFiles = []
+		for filename in entry.get('delete', []):
+			effectiveFilename = packedFilename(filename)
+			if effectiveFilename in addedFiles:
+				raise ValueError("Cannot make conflicting edits for file '%s' in '%s'" % (filename, uniparamFile))
+			deletedFiles.append(effectiveFilename)
+		
+		outputFile = entry.get('output')
+		if outputFile is not None:
+			outputFile = os.path.join(baseDirectory, outputFile)
+			effectiveOutputFile = outputFile
+		else:
+			effectiveOutputFile = os.path.join(baseDirectory, uniparamFile)
+		outputKey = os.path.normcase(os.path.abspath(effectiveOutputFile))
+		if outputKey in outputFiles:
+			raise ValueError("Cannot write both '%s' and '%s' to '%s'" % (outputFiles[outputKey], uniparamFile, effectiveOutputFile))
+		for inputFile in inputFiles.get(outputKey, []):
+			if inputFile != uniparamFile:
+				raise ValueError("Cannot write '%s' to '%s', which is the input of '%s'" % (uniparamFile, effectiveOutputFile, inputFile))
+		outputFiles[outputKey] = uniparamFile
+		
+		compress = entry.get('compress', compressPolicy is not None)
+		if compress is True:
+			policy = compressPolicy if compressPolicy is not None else 'default'
+		elif compress is False:
+			policy = 'default'
+		elif compress in zlib.policies:
+			policy = compress
+			compress = True
+		else:
+			raise ValueError("Unknown compression policy '%s' for '%s'" % (compress, uniparamFile))
+		
+		manifest[os.path.join(baseDirectory, uniparamFile)] = uniparam.UniformParameterChanges(
+			outputFile,
+			addedFiles,
+			deletedFiles,
+			compress,
+			policy,
+		)
+	return manifest
+
+def main(manifestFile, compressPolicy, processes):
+	try:
+		manifest = readManifest(manifestFile, compressPolicy)
+	except Exception as e:
+		print("Error reading manifest: %s" % e)
+		return
+	
+	failures = 0
+	totalTime = 0.0
+	for result in uniparam.applyManifest(manifest, processes):
+		if result.error is not None:
+			failures += 1
+			print("%s: error: %s" % (result.filename, result.error))
+		else:
+			print("%s: read %.3fs, edit %.3fs, write %.3fs" % (
+				result.outputFilename,
+				result.readTime,
+				result.editTime,
+				result.writeTime,
+			))
+		sys.stdout.flush()
+		totalTime += result.totalTime()
+	
+	print("Edited %d of %d files, %.3fs total" % (len(manifest) - failures, len(manifest), totalTime))
+	if failures > 0:
+		sys.exit(1)
+
+def usage():
+	print("pes-uniparam-batch -- Edit many PES UniformParameters files from a manifest")
+	print("Usage:")
+	print("  pes-uniparam-batch [OPTIONS] <manifest file>")
+	print("    The manifest is a JSON object mapping each UniformParameters file to")
+	print("    {\"output\": <FILE>, \"add\": [<FILE>...], \"delete\": [<FILE>...], \"compress\": <BOOL or POLICY>}")
+	print("Options:")
+	print("  -z, --compress             Compress modified files without a \"compress\" setting")
+	print("  -p, --compress-policy <POLICY>")
+	print("                             Compress using <POLICY>: %s [default: default]" % ", ".join(zlib.policies))
+	print("  -j, --jobs <COUNT>         Edit using <COUNT> processes [default: all cores]")
+	print("      --stats                Print timing statistics as JSON to stderr")
+	print("  -h, --help                 Display this help")
+	sys.exit()
+
+if __name__ == '__main__':
+	compressPolicy = None
+	processes = None
+	manifestFile = None
+	showStats = False
+	
+	index = 1
+	while index < len(sys.argv):
+		arg = sys.argv[index]
+		index += 1
+		if arg in ['-z', '--compress']:
+			if compressPolicy is None:
+				compressPolicy = 'default'
+		elif arg in ['-p', '--compress-policy']:
+			if index >= len(sys.argv):
+				usage()
+			if sys.argv[index] not in zlib.policies:
+				usage()
+			compressPolicy = sys.argv[index]
+			index += 1
+		elif arg in ['-j', '--jobs']:
+			if index >= len(sys.argv):
+				usage()
+			if processes is not None:
+				usage()
+			try:
+				processes = int(sys.argv[index])
+			except ValueError:
+				usage()
+			index += 1
+			if processes < 1:
+				usage()
+		elif arg == '--stats':
+			showStats = True
+		elif arg[0:1] == '-':
+			usage()
+		elif manifestFile is None:
+			manifestFile = arg
+		else:
+			usage()
+	
+	if manifestFile is None:
+		usage()
+	
+	with stats.collect(sys.stderr if showStats else None):
+		main(manifestFile, compressPolicy, processes)
@@ -3,7 +3,7 @@
 import os, sys
 sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..', 'lib'))
 
-from pes_file_tools import uniparam, zlib
+from pes_file_tools import stats, uniparam, zlib
 
 def listFiles(filename):
 	if not os.path.isdir(filename):
@@ -18,8 +18,8 @@ def listFiles(filename):
 				entries.append(fullEntry)
 		return entries
 
-def main(uniparamFile, addedFiles, deletedFiles, outputFile, allowOverwrite):
-	activeUniparamFile = uniparam.UniformParameterFile()
+def main(uniparamFile, addedFiles, deletedFiles, outputFile, allowOverwrite, compressPolicy):
+	activeUniparamFile = uniparam.UniformParameterEditor()
 	try:
 		activeUniparamFile.readFile(uniparamFile)
 	except Exception as e:
@@ -58,10 +58,9 @@ def main(uniparamFile, addedFiles, deletedFiles, outputFile, allowOverwrite):
 	
 	for filename in changes:
 		if changes[filename] is None:
-			if filename in activeUniparamFile.entries:
-				del activeUniparamFile.entries[filename]
+			activeUniparamFile.delete(filename)
 		else:
-			activeUniparamFile.entries[filename] = changes[filename]
+			activeUniparamFile.set(filename, changes[filename])
 	
 	if outputFile is None:
 		effectiveOutputFile = uniparamFile
@@ -71,7 +70,7 @@ def main(uniparamFile, addedFiles, deletedFiles, outputFile, allowOverwrite):
 			print("Output file '%s' already exists, not overwriting" % effectiveOutputFile)
 			return
 	
-	activeUniparamFile.writeFile(effectiveOutputFile)
+	activeUniparamFile.writeFile(effectiveOutputFile, compressPolicy is not None, compressPolicy)
 
 def usage():
 	print("pes-uniparam-edit -- Edit the contents of a PES UniformParameters file")
@@ -83,15 +82,21 @@ def usage():
 	print("  -d, --delete               Delete packed files from UniformParameters file")
 	print("  -o, --output <FILE>        Save modified UniformParameters file as <FILE>")
 	print("  -r, --allow-replace        Allow overwriting existing files; default without -o")
+	print("  -z, --compress             Compress the modified UniformParameters file")
+	print("  -p, --compress-policy <POLICY>")
+	print("                             Compress using <POLICY>: %s [default: default]" % ", ".join(zlib.policies))
+	print("      --stats                Print timing statistics as JSON to stderr")
 	print("  -h, --help                 Display this help")
 	sys.exit()
 
 addMode = True
 allowOverwrite = False
+compressPolicy = None
 uniparamFile = None
 addedFiles = []
 deletedFiles = []
 outputFile = None
+showStats = False
 
 index = 1
 while index < len(sys.argv):
@@ -110,6 +115,18 @@ while index < len(sys.argv):
 		index += 1
 	elif arg in ['-r', '--allow-replace']:
 		allowOverwrite = True
+	elif arg in ['-z', '--compress']:
+		if compressPolicy is None:
+			compressPolicy = 'default'
+	elif arg in ['-p', '--compress-policy']:
+		if index >= len(sys.argv):
+			usage()
+		if sys.argv[index] not in zlib.policies:
+			usage()
+		compressPolicy = sys.argv[index]
+		index += 1
+	elif arg == '--stats':
+		showStats = True
 	elif arg[0:1] == '-':
 		usage()
 	elif uniparamFile is None:
@@ -123,4 +140,5 @@ while index < len(sys.argv):
 if uniparamFile is None:
 	usage()
 
-main(uniparamFile, addedFiles, deletedFiles, outputFile, allowOverwrite)
+with stats.collect(sys.stderr if showStats else None):
+	main(uniparamFile, addedFiles, deletedFiles, outputFile, allowOverwrite, compressPolicy)
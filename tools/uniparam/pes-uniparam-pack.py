@@ -3,7 +3,7 @@
 import os, sys
 sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..', 'lib'))
 
-from pes_file_tools import uniparam, zlib
+from pes_file_tools import stats, uniparam, zlib
 
 def listFiles(filename):
 	if not os.path.isdir(filename):
@@ -22,6 +22,7 @@ def main(
 	uniparamFile,
 	packedFiles,
 	allowOverwrite,
+	compressPolicy,
 ):
 	outputFile = uniparam.UniformParameterFile()
 	
@@ -50,7 +51,12 @@ def main(
 		inputFile.close()
 		outputFile.entries[effectiveFilename] = content
 	
-	outputFile.writeFile(uniparamFile)
+	if compressPolicy is None:
+		outputFile.writeFile(uniparamFile)
+	else:
+		stream = open(uniparamFile, 'wb')
+		stream.write(zlib.tryCompress(outputFile.write(), policy = compressPolicy))
+		stream.close()
 
 def usage():
 	print("pes-uniparam-pack -- Pack a collection of kit config files into a PES UniformParameters file")
@@ -58,12 +64,18 @@ def usage():
 	print("  pes-uniparam-pack [OPTIONS] <UniformParameters file> [filename]...")
 	print("Options:")
 	print("  -r, --allow-replace        Allow overwriting existing UniformParameter file")
+	print("  -z, --compress             Compress the UniformParameters file")
+	print("  -p, --compress-policy <POLICY>")
+	print("                             Compress using <POLICY>: %s [default: default]" % ", ".join(zlib.policies))
+	print("      --stats                Print timing statistics as JSON to stderr")
 	print("  -h, --help                 Display this help")
 	sys.exit()
 
 allowOverwrite = False
+compressPolicy = None
 uniparamFile = None
 packedFiles = []
+showStats = False
 
 index = 1
 while index < len(sys.argv):
@@ -71,6 +83,18 @@ while index < len(sys.argv):
 	index += 1
 	if arg in ['-r', '--allow-replace']:
 		allowOverwrite = True
+	elif arg in ['-z', '--compress']:
+		if compressPolicy is None:
+			compressPolicy = 'default'
+	elif arg in ['-p', '--compress-policy']:
+		if index >= len(sys.argv):
+			usage()
+		if sys.argv[index] not in zlib.policies:
+			usage()
+		compressPolicy = sys.argv[index]
+		index += 1
+	elif arg == '--stats':
+		showStats = True
 	elif arg[0:1] == '-':
 		usage()
 	elif uniparamFile is None:
@@ -81,4 +105,5 @@ while index < len(sys.argv):
 if uniparamFile is None:
 	usage()
 
-main(uniparamFile, packedFiles, allowOverwrite)
+with stats.collect(sys.stderr if showStats else None):
+	main(uniparamFile, packedFiles, allowOverwrite, compressPolicy)
@@ -3,7 +3,7 @@
 import os, sys
 sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..', 'lib'))
 
-from pes_file_tools import uniparam, zlib
+from pes_file_tools import stats, uniparam, zlib
 
 def main(
 	uniparamFile,
@@ -48,6 +48,7 @@ def usage():
 	print("Options:")
 	print("  -r, --allow-replace        Allow overwriting existing packed files")
 	print("  -l, --list                 List packed files")
+	print("      --stats                Print timing statistics as JSON to stderr")
 	print("  -h, --help                 Display this help")
 	sys.exit()
 
@@ -55,6 +56,7 @@ allowOverwrite = False
 listMode = False
 uniparamFile = None
 packedFiles = []
+showStats = False
 
 index = 1
 while index < len(sys.argv):
@@ -64,6 +66,8 @@ while index < len(sys.argv):
 		allowOverwrite = True
 	elif arg in ['-l', '--list']:
 		listMode = True
+	elif arg == '--stats':
+		showStats = True
 	elif arg[0:1] == '-':
 		usage()
 	elif uniparamFile is None:
@@ -74,4 +78,5 @@ while index < len(sys.argv):
 if uniparamFile is None:
 	usage()
 
-main(uniparamFile, packedFiles, listMode, allowOverwrite)
+with stats.collect(sys.stderr if showStats else None):
+	main(uniparamFile, packedFiles, listMode, allowOverwrite)
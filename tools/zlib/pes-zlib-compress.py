@@ -1,9 +1,9 @@
 #! /usr/bin/env python3
 
-import os, sys
+import os, shutil, sys, tempfile
 sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..', 'lib'))
 
-from pes_file_tools import zlib
+from pes_file_tools import stats, zlib
 
 def main(
 	inputFileNames,
@@ -11,6 +11,8 @@ def main(
 	inPlace,
 	allowMultiple,
 	allowOverwrite,
+	threads,
+	compressPolicy,
 ):
 	for inputFileName in inputFileNames:
 		if outputFileName is not None:
@@ -28,16 +30,39 @@ def main(
 				return
 		
 		inputFile = open(inputFileName, mode = 'rb')
-		inputBuffer = inputFile.read()
-		inputFile.close()
-		
-		if not allowMultiple and zlib.isCompressed(inputBuffer):
+		if not allowMultiple and zlib.isCompressed(inputFile.read(16)):
+			inputFile.close()
 			print("Input file '%s' is already compressed, not compressing again" % inputFileName)
 			return
+		inputFile.seek(0, 0)
+		
+		# When replacing the input file, write to a temporary file next to it,
+		# with the same mode, and move it into place once compression is
+		# complete.
+		if os.path.exists(thisOutputFileName) and os.path.samefile(inputFileName, thisOutputFileName):
+			(outputHandle, temporaryFileName) = tempfile.mkstemp(dir = os.path.dirname(os.path.abspath(thisOutputFileName)))
+			outputFile = os.fdopen(outputHandle, mode = 'wb')
+			shutil.copymode(inputFileName, temporaryFileName)
+		else:
+			temporaryFileName = None
+			outputFile = open(thisOutputFileName, mode = 'wb')
 		
-		outputFile = open(thisOutputFileName, mode = 'wb')
-		outputFile.write(zlib.compress(inputBuffer))
+		try:
+			zlib.compressStream(inputFile, outputFile, threads, compressPolicy)
+		except Exception as e:
+			inputFile.close()
+			outputFile.close()
+			if temporaryFileName is not None:
+				os.remove(temporaryFileName)
+			else:
+				os.remove(thisOutputFileName)
+			print("Error compressing input file '%s': %s" % (inputFileName, e))
+			return
+		inputFile.close()
 		outputFile.close()
+		
+		if temporaryFileName is not None:
+			os.replace(temporaryFileName, thisOutputFileName)
 
 def usage():
 	print("pes-zlib-compress -- Compress a file using PES zlib compression")
@@ -49,6 +74,10 @@ def usage():
 	print("  -m, --allow-multiple       Allow compressing already compressed files")
 	print("  -r, --allow-replace        Allow overwriting existing files")
 	print("  -o, --output <FILE>        Save compressed file as FILE")
+	print("  -j, --threads <COUNT>      Compress using <COUNT> threads [default 1]")
+	print("  -p, --compress-policy <POLICY>")
+	print("                             Compress using <POLICY>: %s [default: default]" % ", ".join(zlib.policies))
+	print("      --stats                Print timing statistics as JSON to stderr")
 	print("  -h, --help                 Display this help")
 	sys.exit()
 
@@ -56,7 +85,10 @@ inPlace = False
 allowMultiple = False
 allowOverwrite = False
 outputFile = None
+threads = None
+compressPolicy = 'default'
 inputFiles = []
+showStats = False
 
 index = 1
 while index < len(sys.argv):
@@ -75,6 +107,27 @@ while index < len(sys.argv):
 			usage()
 		outputFile = sys.argv[index]
 		index += 1
+	elif arg in ['-j', '--threads']:
+		if index >= len(sys.argv):
+			usage()
+		if threads is not None:
+			usage()
+		try:
+			threads = int(sys.argv[index])
+		except ValueError:
+			usage()
+		index += 1
+		if threads < 1:
+			usage()
+	elif arg in ['-p', '--compress-policy']:
+		if index >= len(sys.argv):
+			usage()
+		if sys.argv[index] not in zlib.policies:
+			usage()
+		compressPolicy = sys.argv[index]
+		index += 1
+	elif arg == '--stats':
+		showStats = True
 	elif arg[0:1] == '-':
 		usage()
 	else:
@@ -85,10 +138,13 @@ if len(inputFiles) == 0:
 if outputFile is not None and len(inputFiles) != 1:
 	usage()
 
-main(
-	inputFiles,
-	outputFile,
-	inPlace,
-	allowMultiple,
-	allowOverwrite,
-)
+with stats.collect(sys.stderr if showStats else None):
+	main(
+		inputFiles,
+		outputFile,
+		inPlace,
+		allowMultiple,
+		allowOverwrite,
+		threads,
+		compressPolicy,
+	)
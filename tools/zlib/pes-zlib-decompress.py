@@ -1,9 +1,9 @@
 #! /usr/bin/env python3
 
-import os, sys
+import os, shutil, sys, tempfile
 sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..', 'lib'))
 
-from pes_file_tools import zlib
+from pes_file_tools import stats, zlib
 
 def main(
 	inputFileNames,
@@ -28,22 +28,43 @@ def main(
 				return
 		
 		inputFile = open(inputFileName, mode = 'rb')
-		inputBuffer = inputFile.read()
-		inputFile.close()
-		
-		if not allowNoop and not zlib.isCompressed(inputBuffer):
+		isCompressed = zlib.isCompressed(inputFile.read(16))
+		if not allowNoop and not isCompressed:
+			inputFile.close()
 			print("Input file '%s' is not compressed" % inputFileName)
 			return
+		inputFile.seek(0, 0)
+		
+		# When replacing the input file, decompress to a temporary file next
+		# to it, with the same mode, and move it into place once
+		# decompression is complete.
+		if os.path.exists(thisOutputFileName) and os.path.samefile(inputFileName, thisOutputFileName):
+			(outputHandle, temporaryFileName) = tempfile.mkstemp(dir = os.path.dirname(os.path.abspath(thisOutputFileName)))
+			outputFile = os.fdopen(outputHandle, mode = 'wb')
+			shutil.copymode(inputFileName, temporaryFileName)
+		else:
+			temporaryFileName = None
+			outputFile = open(thisOutputFileName, mode = 'wb')
 		
 		try:
-			outputBuffer = zlib.tryDecompress(inputBuffer)
+			if isCompressed:
+				zlib.decompressStream(inputFile, outputFile)
+			else:
+				shutil.copyfileobj(inputFile, outputFile)
 		except:
+			inputFile.close()
+			outputFile.close()
+			if temporaryFileName is not None:
+				os.remove(temporaryFileName)
+			else:
+				os.remove(thisOutputFileName)
 			print("Error decompressing input file '%s'" % inputFileName)
 			return
-		
-		outputFile = open(thisOutputFileName, mode = 'wb')
-		outputFile.write(outputBuffer)
+		inputFile.close()
 		outputFile.close()
+		
+		if temporaryFileName is not None:
+			os.replace(temporaryFileName, thisOutputFileName)
 
 def usage():
 	print("pes-zlib-decompress -- Decompress a file compressed using PES zlib compression")
@@ -55,6 +76,7 @@ def usage():
 	print("  -n, --allow-noop           Store copy of input file if input is not compressed")
 	print("  -r, --allow-replace        Allow overwriting existing files")
 	print("  -o, --output <FILE>        Save uncompressed file as FILE")
+	print("      --stats                Print timing statistics as JSON to stderr")
 	print("  -h, --help                 Display this help")
 	sys.exit()
 
@@ -63,6 +85,7 @@ allowNoop = False
 allowOverwrite = False
 outputFile = None
 inputFiles = []
+showStats = False
 
 index = 1
 while index < len(sys.argv):
@@ -81,6 +104,8 @@ while index < len(sys.argv):
 			usage()
 		outputFile = sys.argv[index]
 		index += 1
+	elif arg == '--stats':
+		showStats = True
 	elif arg[0:1] == '-':
 		usage()
 	else:
@@ -91,10 +116,11 @@ if len(inputFiles) == 0:
 if outputFile is not None and len(inputFiles) != 1:
 	usage()
 
-main(
-	inputFiles,
-	outputFile,
-	inPlace,
-	allowNoop,
-	allowOverwrite,
-)
+with stats.collect(sys.stderr if showStats else None):
+	main(
+		inputFiles,
+		outputFile,
+		inPlace,
+		allowNoop,
+		allowOverwrite,
+	)
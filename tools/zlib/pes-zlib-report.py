@@ -0,0 +1,100 @@
+#! /usr/bin/env python3
+
+import os, sys, time
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..', 'lib'))
+
+from pes_file_tools import stats, zlib
+
+def listFiles(filename):
+	if not os.path.isdir(filename):
+		return [filename]
+	else:
+		entries = []
+		for (directory, subdirectories, files) in os.walk(filename):
+			subdirectories.sort()
+			for entry in sorted(files):
+				entries.append(os.path.join(directory, entry))
+		return entries
+
+def assetType(filename):
+	basename = os.path.basename(filename)
+	pos = basename.rfind('.')
+	if pos <= 0:
+		return '(none)'
+	return basename[pos + 1:].lower()
+
+def main(inputFileNames, policies):
+	# totals is a dictionary from asset type to a dictionary from policy to
+	# [$uncompressedSize, $compressedSize, $time].
+	totals = {}
+	for inputFileName in inputFileNames:
+		inputFile = open(inputFileName, mode = 'rb')
+		inputBuffer = zlib.tryDecompress(inputFile.read())
+		inputFile.close()
+		
+		typeTotals = totals.setdefault(assetType(inputFileName), {})
+		for policy in policies:
+			startTime = time.perf_counter()
+			outputBuffer = zlib.compress(inputBuffer, policy = policy)
+			elapsed = time.perf_counter() - startTime
+			
+			policyTotals = typeTotals.setdefault(policy, [0, 0, 0.0])
+			policyTotals[0] += len(inputBuffer)
+			policyTotals[1] += len(outputBuffer)
+			policyTotals[2] += elapsed
+	
+	print("%-10s %-8s %12s %12s %7s %9s %9s" % ("type", "policy", "input", "output", "ratio", "time", "MB/s"))
+	for typeName in sorted(totals.keys()):
+		for policy in policies:
+			(uncompressedSize, compressedSize, elapsed) = totals[typeName][policy]
+			print("%-10s %-8s %12d %12d %6.1f%% %8.3fs %9.1f" % (
+				typeName,
+				policy,
+				uncompressedSize,
+				compressedSize,
+				100.0 * compressedSize / max(uncompressedSize, 1),
+				elapsed,
+				uncompressedSize / max(elapsed, 1e-9) / (1 << 20),
+			))
+
+def usage():
+	print("pes-zlib-report -- Compare PES zlib compression policies by asset type")
+	print("Usage:")
+	print("  pes-zlib-report [OPTIONS] <file or directory>...")
+	print("    Compressed input files are decompressed before measuring")
+	print("Options:")
+	print("  -p, --policy <POLICY>      Measure only <POLICY>; may be repeated")
+	print("                             [default: %s]" % ", ".join(zlib.policies))
+	print("      --stats                Print timing statistics as JSON to stderr")
+	print("  -h, --help                 Display this help")
+	sys.exit()
+
+policies = []
+inputFiles = []
+showStats = False
+
+index = 1
+while index < len(sys.argv):
+	arg = sys.argv[index]
+	index += 1
+	if arg in ['-p', '--policy']:
+		if index >= len(sys.argv):
+			usage()
+		if sys.argv[index] not in zlib.policies:
+			usage()
+		policies.append(sys.argv[index])
+		index += 1
+	elif arg == '--stats':
+		showStats = True
+	elif arg[0:1] == '-':
+		usage()
+	else:
+		inputFiles += listFiles(arg)
+
+if len(inputFiles) == 0:
+	usage()
+if len(policies) == 0:
+	policies = zlib.policies
+
+with stats.collect(sys.stderr if showStats else None):
+	main(inputFiles, policies)